@@ -0,0 +1,42 @@
+#! /usr/bin/env python3
+import os
+import logging
+import argparse
+from core import backtester
+
+## Setup
+LOGS_DIR = 'logs/'
+
+## Settup logging.
+log_format = '%(asctime)s:%(name)s:%(message)s'
+logging.basicConfig(
+    format=log_format,
+    level=logging.WARNING)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay recorded klines through the trader_configuration.py strategy.')
+    parser.add_argument('file', help='Kline file (.csv, .npy, .parquet or a cache/klines .klines file) with [time, open, high, low, close, volume] rows.')
+    parser.add_argument('--market', default='BTC-ETH', help='Market in QUOTE-BASE format (default BTC-ETH).')
+    parser.add_argument('--market-type', default='SPOT', choices=['SPOT', 'MARGIN'])
+    parser.add_argument('--currency', type=float, default=0.002, help='Currency the trader is allowed to use.')
+    parser.add_argument('--max-candles', type=int, default=500)
+    parser.add_argument('--lot-size', type=int, default=backtester.DEFAULT_RULES['LOT_SIZE'])
+    parser.add_argument('--tick-size', type=int, default=backtester.DEFAULT_RULES['TICK_SIZE'])
+    return(parser.parse_args())
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if not(os.path.exists(LOGS_DIR)):
+        os.makedirs(LOGS_DIR, exist_ok=True)
+
+    klines = backtester.load_klines(args.file)
+    rules = {'LOT_SIZE':args.lot_size, 'TICK_SIZE':args.tick_size, 'MINIMUM_NOTATION':backtester.DEFAULT_RULES['MINIMUM_NOTATION']}
+
+    report = backtester.Backtester(args.market, klines, market_type=args.market_type, base_currency=args.currency,
+        max_candles=args.max_candles, rules=rules, logs_dir=LOGS_DIR).run()
+
+    print('Market: {0} | Candles: {1} | Time: {2:.2f}s | Candles/sec: {3:.0f}'.format(report['market'], report['candles'], report['elapsed'], report['candles_per_sec']))
+    print('Round trips: {0} | Wins: {1} | Outcome: {2:.8f}'.format(report['round_trips'], report['wins'], report['outcome']))
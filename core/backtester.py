@@ -0,0 +1,178 @@
+#! /usr/bin/env python3
+import os
+import time
+import logging
+import numpy as np
+
+from . import trader
+from . import trade_journal
+from . import kline_store
+
+## Default spread used to build the simulated order book (as a fraction of the price).
+DEFAULT_SPREAD = 0.0002
+
+## Default market rules used for the backtest trader.
+DEFAULT_RULES = {'LOT_SIZE':3, 'TICK_SIZE':8, 'MINIMUM_NOTATION':0.0001}
+
+
+def load_klines(file_path):
+    '''
+    Load recorded klines into an oldest first (N, 6) float array of [time, open, high, low, close, volume].
+    -> .csv     : Binance kline dumps (extra columns are ignored, a header line is skipped).
+    -> .npy     : Array saved with numpy.save.
+    -> .parquet : Requires pandas (with pyarrow/fastparquet), the first 6 columns are used.
+    -> .klines  : Kline store files kept by the bot in cache/klines (memory mapped, not read into memory).
+    '''
+    extension = os.path.splitext(file_path)[1].lower()
+
+    if extension == kline_store.KLINE_EXTENSION:
+        ## Stored oldest first with increasing times so the mapped file is used as is (as a plain ndarray view, memmap indexing is slower).
+        return(np.asarray(kline_store.map_klines(file_path)))
+    elif extension == '.npy':
+        klines = np.load(file_path)
+    elif extension == '.parquet':
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError('pandas is required to load parquet kline files.')
+        klines = pandas.read_parquet(file_path).iloc[:, :6].to_numpy(dtype=np.float64)
+    elif extension == '.csv':
+        with open(file_path, 'r') as f:
+            first_line = f.readline()
+        skip_header = 0 if first_line[:1].isdigit() else 1
+        klines = np.loadtxt(file_path, delimiter=',', usecols=range(6), skiprows=skip_header, ndmin=2)
+    else:
+        raise ValueError('Unsupported kline file type: {0}'.format(extension))
+
+    klines = np.ascontiguousarray(klines[:, :6], dtype=np.float64)
+    return(klines[np.argsort(klines[:, 0], kind='stable')])
+
+
+class KlineWindow(object):
+    ''' Newest first window over an oldest first kline array ending at a given candle (no copying). '''
+    def __init__(self, klines, end, size):
+        self.klines = klines
+        self.end = end
+        self.size = min(size, end+1)
+
+
+    def __len__(self):
+        return(self.size)
+
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError('candle index out of range')
+        candle = self.klines[self.end-index].tolist()
+        candle[0] = int(candle[0])
+        return(candle)
+
+
+class HistoricDataInterface(object):
+    '''
+    Data interface used by BaseTrader to replay recorded klines.
+    -> advance() moves the simulated clock forward by one candle (returns False once all candles are used).
+    -> time() returns the simulated clock in seconds.
+    -> get_candle_data/get_depth_data mirror the live socket endpoints.
+    '''
+    def __init__(self, klines, max_candles=500, spread=DEFAULT_SPREAD):
+        self.klines = klines
+        self.max_candles = max_candles
+        self.spread = spread
+
+        ## Start with a full window of history so the indicators are warmed up.
+        self.cursor = min(max_candles, len(klines))-2
+        self.steps = 0
+
+
+    def advance(self):
+        if self.cursor+1 >= len(self.klines):
+            return(False)
+        self.cursor += 1
+        self.steps += 1
+        return(True)
+
+
+    def time(self):
+        return(self.klines[max(self.cursor, 0)][0]/1000)
+
+
+    def get_candle_data(self, symbol):
+        return(KlineWindow(self.klines, self.cursor, self.max_candles))
+
+
+    def get_depth_data(self, symbol):
+        price = float(self.klines[self.cursor][4])
+        half_spread = price*self.spread/2
+        return({'a':[[price+half_spread, float('inf')]], 'b':[[price-half_spread, float('inf')]]})
+
+
+class Backtester(object):
+
+    def __init__(self, market, klines, market_type='SPOT', base_currency=0.002, max_candles=500, rules=None, logs_dir='logs/'):
+        # Initilize the backtester for a single market.
+        self.market         = market
+        self.quote_asset, self.base_asset = market.split('-')
+        self.klines         = klines
+        self.market_type    = market_type
+        self.base_currency  = base_currency
+        self.max_candles    = max_candles
+        self.rules          = dict(DEFAULT_RULES if rules == None else rules)
+        self.logs_dir       = logs_dir
+
+
+    def run(self):
+        '''
+        Replay the klines through a TEST mode BaseTrader as fast as possible.
+        Returns a report with the throughput and the trade outcome.
+        '''
+        data_if = HistoricDataInterface(self.klines, self.max_candles)
+
+        journal = None
+        if self.logs_dir:
+            journal = trade_journal.TradeJournal(os.path.join(self.logs_dir, 'backtest_journal_{0}{1}.jsonl'.format(self.base_asset, self.quote_asset)), fsync_policy='none')
+            journal.start()
+
+        trader_ = trader.BaseTrader(self.quote_asset, self.base_asset, None, data_if=data_if, trade_journal=journal, max_candles=self.max_candles)
+        trader_.setup_initial_values(self.market_type, 'TEST', self.rules)
+
+        logging.info('[Backtester] Replaying {0} candles for {1}.'.format(len(self.klines), self.market))
+        start_time = time.perf_counter()
+        trader_.start(self.base_currency, {self.quote_asset:[self.base_currency, 0.0]})
+        trader_.join()
+        elapsed = time.perf_counter()-start_time
+
+        if journal:
+            journal.stop()
+
+        report = self.build_report(trader_, data_if.steps, elapsed)
+        logging.info('[Backtester] Finished {0}: {1:.0f} candles/sec.'.format(self.market, report['candles_per_sec']))
+        return(report)
+
+
+    def build_report(self, trader_, steps, elapsed):
+        ''' Summarise the backtest run. '''
+        trades = trader_.trade_recorder
+        outcome = 0.0
+        wins = 0
+        round_trips = 0
+
+        for i in range(1, len(trades), 2):
+            buy, sell = trades[i-1], trades[i]
+            if buy[4] != 'BUY' or sell[4] != 'SELL':
+                continue
+            trade_outcome = trade_journal.round_trip_outcome(buy, sell)
+            outcome += trade_outcome
+            wins += 1 if trade_outcome > 0 else 0
+            round_trips += 1
+
+        return({
+            'market':self.market,
+            'candles':steps,
+            'elapsed':elapsed,
+            'candles_per_sec':(steps/elapsed) if elapsed > 0 else 0.0,
+            'round_trips':round_trips,
+            'wins':wins,
+            'outcome':outcome})
@@ -0,0 +1,175 @@
+#! /usr/bin/env python3
+import logging
+import threading
+import numpy as np
+
+import trader_configuration as TC
+
+## Conditions that can be provided in a batched form within trader_configuration (as batch_<name>).
+BATCH_CONDITIONS = ['long_entry_conditions', 'long_exit_conditions', 'short_entry_conditions', 'short_exit_conditions']
+
+## Default number of newest candles passed per market (column 0 is the live candle).
+DEFAULT_DEPTH = 2
+
+
+def get_batch_functions():
+    ''' Return the batched condition functions defined within trader_configuration. '''
+    return({name:getattr(TC, 'batch_'+name) for name in BATCH_CONDITIONS if hasattr(TC, 'batch_'+name)})
+
+
+class BatchEvaluator(object):
+    '''
+    Evaluates trade conditions for every market in one call.
+    -> Each market is a row, columns are newest first candles (NaN where there is no value).
+    -> Matrices are preallocated and only the rows of markets whose data changed are refilled.
+    -> Results are tagged with the live candle the row was built from, traders only use a result
+        when it matches the data they currently hold (otherwise the per market function is used).
+    -> Markets are added/removed from other threads, evaluate works on a copy of the row layout taken under
+        the lock and publishes its results together with the rows they were built for.
+    '''
+    def __init__(self, batch_functions, depth=DEFAULT_DEPTH):
+        logging.info('[BatchEvaluator] Initilizing batch evaluator for: {0}'.format(', '.join(batch_functions)))
+
+        self.batch_functions = batch_functions
+        self.depth = depth
+        self.traders = []
+        self.rows = {}
+        self.matrices = None
+        self.row_fingerprints = []
+        self.results = ({}, {})
+        self.evaluations = 0
+        self.lock = threading.Lock()
+
+
+    def add(self, trader):
+        ''' Add a trader (a row) to the batch, the matrices are rebuilt. '''
+        symbol = trader.configuration['symbol']
+        with self.lock:
+            if symbol in self.rows:
+                return
+
+            ## The row layout is replaced rather than changed in place so a running evaluate keeps a consistent copy.
+            rows = dict(self.rows)
+            rows.update({symbol:len(self.traders)})
+            self.rows = rows
+            self.traders = self.traders+[trader]
+            self.matrices = None
+
+
+    def remove(self, trader):
+        ''' Remove a trader from the batch, the matrices are rebuilt. '''
+        symbol = trader.configuration['symbol']
+        with self.lock:
+            if not(symbol in self.rows):
+                return
+
+            self.traders = [trader_ for trader_ in self.traders if trader_ is not trader]
+            self.rows = {trader_.configuration['symbol']:row for row, trader_ in enumerate(self.traders)}
+            self.results = ({}, {})
+            self.matrices = None
+
+
+    def evaluate(self, changed_symbols=None):
+        '''
+        Refresh the rows of changed markets then run every batched condition once over all markets.
+        -> Traders that are mid cycle are skipped and keep their previous row.
+        '''
+        with self.lock:
+            if not(self.traders):
+                return
+
+            if self.matrices == None:
+                self._build_matrices()
+                changed_symbols = None
+            traders, rows, matrices, row_fingerprints = self.traders, self.rows, self.matrices, self.row_fingerprints
+
+        for row, trader_ in enumerate(traders):
+            if changed_symbols != None and not(trader_.configuration['symbol'] in changed_symbols):
+                continue
+
+            if not(trader_.cycle_lock.acquire(blocking=False)):
+                continue
+            try:
+                if trader_._update_market_data():
+                    self._fill_row(matrices, row_fingerprints, row, trader_)
+            finally:
+                trader_.cycle_lock.release()
+
+        fingerprints = list(row_fingerprints)
+        results = {}
+        for name, function in self.batch_functions.items():
+            try:
+                results.update({name:(fingerprints, function(matrices))})
+            except Exception as error:
+                logging.exception('[BatchEvaluator] Batch condition {0} failed: {1}'.format(name, error))
+
+        with self.lock:
+            ## Results built for a layout that has since changed are dropped (the next sweep rebuilds them).
+            if matrices is self.matrices:
+                self.results = (rows, results)
+        self.evaluations += 1
+
+
+    def get_result(self, condition_name, symbol, candles):
+        ''' Return the batched result for a market if it was built from the live candle currently held (else None). '''
+        rows, results = self.results
+        if not(condition_name in results) or not(symbol in rows):
+            return(None)
+
+        fingerprints, results = results[condition_name]
+        row = rows[symbol]
+        if fingerprints[row] != (candles[0][0], candles[0][4]):
+            return(None)
+        return(results[row])
+
+
+    def _build_matrices(self):
+        ''' Preallocate a (markets x depth) matrix for the close price and every registered indicator. '''
+        shape = (len(self.traders), self.depth)
+        self.matrices = {'close':np.full(shape, np.nan)}
+
+        for indicator, series, source, group, name in self.traders[0].indicator_engine.entries:
+            value_keys = getattr(indicator, 'VALUE_KEYS', None)
+            if value_keys:
+                matrix = {key:np.full(shape, np.nan) for key in value_keys}
+            else:
+                matrix = np.full(shape, np.nan)
+
+            if name == None:
+                self.matrices.update({group:matrix})
+            else:
+                self.matrices.setdefault(group, {}).update({name:matrix})
+
+        self.row_fingerprints = [None]*len(self.traders)
+
+
+    def _fill_row(self, matrices, row_fingerprints, row, trader_):
+        ''' Copy the newest values of a traders candles/indicators into its row. '''
+        candles = trader_.candle_store
+        closes = candles.column('close', self.depth)
+        matrices['close'][row, :] = np.nan
+        matrices['close'][row, :len(closes)] = closes
+
+        values = trader_.indicator_engine.values
+        for group in values:
+            if isinstance(values[group], dict) and isinstance(matrices.get(group), dict):
+                for name in values[group]:
+                    self._fill_values(matrices[group].get(name), row, values[group][name])
+            else:
+                self._fill_values(matrices.get(group), row, values[group])
+
+        row_fingerprints[row] = (candles[0][0], candles[0][4])
+
+
+    def _fill_values(self, matrix, row, series_values):
+        if matrix is None:
+            return
+
+        for column in range(self.depth):
+            value = series_values[column] if column < len(series_values) else None
+
+            if isinstance(matrix, dict):
+                for key in matrix:
+                    matrix[key][row, column] = np.nan if value == None else value[key]
+            else:
+                matrix[row, column] = np.nan if value == None else value
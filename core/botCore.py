@@ -4,21 +4,37 @@ import sys
 import time
 import json
 import os.path
-import hashlib
 import logging
 import threading
+import concurrent.futures
 from decimal import Decimal
-from flask_socketio import SocketIO
-from flask import Flask, render_template, url_for, request
+from flask_socketio import SocketIO, emit
+from flask import Flask, Response, render_template, url_for, request
 
 from binance_api import api_master_rest_caller
 from binance_api import api_master_socket_caller
 
 from . import trader
+from . import data_notifier
+from . import trader_scheduler
+from . import core_lifecycle
+from . import batch_evaluator
+from . import web_delta
+from . import trader_store
+from . import trade_history
+from . import trade_journal
+from . import order_gateway
+from . import rate_limiter
+from . import exchange_simulator
+from . import order_book
+from . import shard_manager
+from . import chart_cache
+from . import market_registry
+from . import market_socket
+from . import kline_store
+from . import startup_timer
 
 
-MULTI_DEPTH_INDICATORS = ['ema', 'sma', 'rma', 'order']
-
 # Initilize globals.
 
 ## Setup flask app/socket
@@ -34,8 +50,11 @@ started_updater = False
 host_ip     = ''
 host_port   = ''
 
-## Set traders cache file name.
-CAHCE_FILES = 'traders.json'
+## Set latency stats log file name.
+LATENCY_LOG_FILE = 'latency_stats.json'
+
+## Traders started at once on start (each mostly waits for its market data).
+TRADER_START_WORKERS = 64
 
 
 @APP.context_processor
@@ -63,8 +82,7 @@ def control_panel():
     ## Web updater used for live updating.
     if not(started_updater):
         started_updater = True
-        web_updater_thread = threading.Thread(target=web_updater)
-        web_updater_thread.start()
+        core_object.lifecycle.start_thread('WebUpdater', web_updater)
 
     ## Set socket ip/port.
     start_up_data = {
@@ -86,78 +104,166 @@ def update_trader():
     if current_trader == None:
         ## No trader therefore return false.
         return(json.dumps({'call':False, 'message':'INVALID_TRADER'}))
-    elif data['action'] == 'start':
-        ## Updating trader status to running.
-        if current_trader.state_data['runtime_state'] == 'FORCE_PAUSE':
-            current_trader.state_data['runtime_state'] = 'RUN'
-    elif data['action'] == 'pause':
-        ## Updating trader status to paused.
-        if current_trader.state_data['runtime_state'] == 'RUN':
-            current_trader.state_data['runtime_state'] = 'FORCE_PAUSE'
-    else:
+    elif not(core_object.trader_action(current_trader.print_pair, data['action'])):
         ## If action was not found return false
         return(json.dumps({'call':False, 'message':'INVALID_ACTION'}))
 
     return(json.dumps({'call':True}))
 
 
+@APP.route('/rest-api/v1/market_update', methods=['POST'])
+def update_market():
+    # Add or remove a market while the core is running.
+    data = request.get_json()
+
+    if data['action'] == 'add':
+        changed, message = core_object.add_market(data['market'])
+    elif data['action'] == 'remove':
+        changed, message = core_object.remove_market(data['market'])
+    else:
+        return(json.dumps({'call':False, 'message':'INVALID_ACTION'}))
+
+    if not(changed):
+        return(json.dumps({'call':False, 'message':message}))
+
+    return(json.dumps({'call':True}))
+
+
 @APP.route('/rest-api/v1/get_trader_charting', methods=['GET'])
 def get_trader_charting():
+    # Endpoint to pass trader candles with the indicator data that covers them.
+    return(chart_response('charting'))
+
+
+@APP.route('/rest-api/v1/get_trader_indicators', methods=['GET'])
+def get_trader_indicators():
     # Endpoint to pass trader indicator data.
+    return(chart_response('indicators'))
+
+
+@APP.route('/rest-api/v1/get_trader_candles', methods=['GET'])
+def get_trader_candles():
+    # Endpoint to pass trader candles.
+    return(chart_response('candles'))
+
+
+@APP.route('/rest-api/v1/get_scheduler_stats', methods=['GET'])
+def get_scheduler_stats():
+    # Endpoint to pass the trader worker pool stats (queue depth, busy workers).
+    scheduler_stats = core_object.get_scheduler_stats()
+
+    if scheduler_stats == None:
+        return(json.dumps({'call':False, 'message':'SCHEDULER_DISABLED'}))
+
+    return(json.dumps({'call':True, 'data':scheduler_stats}))
+
+
+@APP.route('/rest-api/v1/get_indicator_cache_stats', methods=['GET'])
+def get_indicator_cache_stats():
+    # Endpoint to pass the indicator cache hit/miss counters (for all markets if no market is given).
     market = request.args.get('market')
-    limit = int(request.args.get('limit'))
-    data = {'market':market}
+
+    if market == None:
+        return(json.dumps({'call':True, 'data':core_object.get_indicator_cache_stats()}))
 
     ## Check if specified bot exists.
-    current_trader = api_error_check(data)
+    current_trader = api_error_check({'market':market})
 
     if current_trader == None:
         ## No trader therefore return false.
         return(json.dumps({'call':False, 'message':'INVALID_TRADER'}))
 
-    candle_data = core_object.get_trader_candles(current_trader.print_pair)[:limit]
-    indicator_data = core_object.get_trader_indicators(current_trader.print_pair)
-    short_indicator_data = shorten_indicators(indicator_data, candle_data[-1][0])
-
-    return(json.dumps({'call':True, 'data':{'market':market, 'indicators':short_indicator_data, 'candles':candle_data}}))
+    return(json.dumps({'call':True, 'data':core_object.get_indicator_cache_stats(current_trader.print_pair)}))
 
 
-@APP.route('/rest-api/v1/get_trader_indicators', methods=['GET'])
-def get_trader_indicators():
-    # Endpoint to pass trader indicator data.
+@APP.route('/rest-api/v1/get_trader_latency', methods=['GET'])
+def get_trader_latency():
+    # Endpoint to pass the per stage latency stats (count/mean/p50/p99/max in seconds) for the trader loop.
     market = request.args.get('market')
-    limit = int(request.args.get('limit'))
-    data = {'market':market}
+
+    if market == None:
+        return(json.dumps({'call':True, 'data':core_object.get_latency_stats()}))
 
     ## Check if specified bot exists.
-    current_trader = api_error_check(data)
+    current_trader = api_error_check({'market':market})
 
     if current_trader == None:
         ## No trader therefore return false.
         return(json.dumps({'call':False, 'message':'INVALID_TRADER'}))
 
-    indicator_data = core_object.get_trader_indicators(current_trader.print_pair)
+    return(json.dumps({'call':True, 'data':core_object.get_latency_stats(current_trader.print_pair)}))
 
-    return(json.dumps({'call':True, 'data':{'market':market, 'indicators':indicator_data}}))
 
+@APP.route('/rest-api/v1/get_trade_history', methods=['GET'])
+def get_trade_history():
+    # Endpoint to query the trade history (oldest first), optionally by market, side and a start/end time range (in seconds).
+    market = request.args.get('market')
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    side = request.args.get('side')
+    limit = request.args.get('limit', default=trade_history.MAX_QUERY_LIMIT, type=int)
+    offset = request.args.get('offset', default=0, type=int)
 
-@APP.route('/rest-api/v1/get_trader_candles', methods=['GET'])
-def get_trader_candles():
-    # Endpoint to pass trader candles.
+    if market != None:
+        ## Check if specified bot exists.
+        current_trader = api_error_check({'market':market})
+
+        if current_trader == None:
+            ## No trader therefore return false.
+            return(json.dumps({'call':False, 'message':'INVALID_TRADER'}))
+
+    trades = core_object.history_store.query(market, start=start, end=end, side=side, limit=limit, offset=offset)
+    total = core_object.history_store.count(market, start=start, end=end, side=side)
+
+    return(json.dumps({'call':True, 'data':{'market':market, 'total':total, 'offset':offset, 'trades':trades}}))
+
+
+@APP.route('/rest-api/v1/get_order_gateway_stats', methods=['GET'])
+def get_order_gateway_stats():
+    # Endpoint to pass the order gateway counters and the submit to ack latency per order action.
+    return(json.dumps({'call':True, 'data':core_object.get_order_gateway_stats()}))
+
+
+@APP.route('/rest-api/v1/get_order_book', methods=['GET'])
+def get_order_book():
+    # Endpoint to query a local order book (top of book, spread, depth within bps of the mid price and the VWAP for a size).
     market = request.args.get('market')
-    limit = int(request.args.get('limit'))
-    data = {'market':market}
+    bps = request.args.get('bps', default=10, type=float)
+    size = request.args.get('size', type=float)
 
     ## Check if specified bot exists.
-    current_trader = api_error_check(data)
+    current_trader = api_error_check({'market':market})
 
     if current_trader == None:
         ## No trader therefore return false.
         return(json.dumps({'call':False, 'message':'INVALID_TRADER'}))
 
-    candle_data = core_object.get_trader_candles(current_trader.print_pair)[:limit]
+    book_data = core_object.get_order_book(current_trader.print_pair, bps, size)
+
+    if book_data == None:
+        return(json.dumps({'call':False, 'message':'NO_ORDER_BOOK'}))
+
+    return(json.dumps({'call':True, 'data':book_data}))
+
+
+@APP.route('/rest-api/v1/get_rate_limit_stats', methods=['GET'])
+def get_rate_limit_stats():
+    # Endpoint to pass the REST rate limiter counters (weight/order budget used, waiting, coalesced and per endpoint calls).
+    return(json.dumps({'call':True, 'data':core_object.get_rate_limit_stats()}))
+
 
-    return(json.dumps({'call':True, 'data':{'market':market, 'candles':candle_data}}))
+@APP.route('/rest-api/v1/get_startup_stats', methods=['GET'])
+def get_startup_stats():
+    # Endpoint to pass the startup phase timings and when the traders were started (in seconds from the core start).
+    return(json.dumps({'call':True, 'data':core_object.get_startup_stats()}))
+
+
+@APP.route('/rest-api/v1/get_pnl_stats', methods=['GET'])
+def get_pnl_stats():
+    # Endpoint to pass the PnL stats (per market and overall) built from the trade journal.
+    records = trade_journal.read_journal(core_object.trade_journal.file_path)
+
+    return(json.dumps({'call':True, 'data':trade_journal.aggregate_pnl(records)}))
 
 
 @APP.route('/rest-api/v1/test', methods=['GET'])
@@ -166,83 +272,161 @@ def test_rest_call():
     return(json.dumps({'call':True, 'message':'HELLO WORLD!'}))
 
 
-def shorten_indicators(indicators, end_time):
-    base_indicators = {}
+def chart_response(kind):
+    # Shared by the chart endpoints, since/before page by candle time (ms) and format picks json or binary.
+    market = request.args.get('market')
+    limit = request.args.get('limit', type=int)
+    since = request.args.get('since', type=int)
+    before = request.args.get('before', type=int)
+    encoding = request.args.get('format', default='json')
+    data = {'market':market}
 
-    for ind in indicators:
-        if ind in MULTI_DEPTH_INDICATORS:
-            base_indicators.update({ind:{}})
-            for sub_ind in indicators[ind]:
-                base_indicators[ind].update({sub_ind:[ [val[0] if ind != 'order' else val[0]*1000,val[1]] for val in indicators[ind][sub_ind] if (val[0] if ind != 'order' else val[0]*1000) > end_time ]})
-        else:
-            base_indicators.update({ind:[ [val[0],val[1]] for val in indicators[ind] if val[0] > end_time]})
+    ## Check if specified bot exists.
+    current_trader = api_error_check(data)
 
-    return(base_indicators)
+    if current_trader == None:
+        ## No trader therefore return false.
+        return(json.dumps({'call':False, 'message':'INVALID_TRADER'}))
+
+    if not(encoding in chart_cache.ENCODINGS):
+        return(json.dumps({'call':False, 'message':'INVALID_FORMAT'}))
+
+    chart_data = core_object.get_chart_data(current_trader.print_pair, kind, limit, since, before, encoding)
+
+    if chart_data == None:
+        return(json.dumps({'call':False, 'message':'NO_DATA'}))
+
+    if encoding == 'binary':
+        return(Response(chart_data, mimetype='application/octet-stream'))
+    return(chart_data)
 
 
 def api_error_check(data):
-    ## Check if specified bot exists.
-    current_trader = None
-    for trader in core_object.trader_objects:
-        if trader.print_pair == data['market']:
-            current_trader = trader
-            break
-    return(current_trader)
+    ## Check if specified bot exists (by print pair BTC-ETH or exchange symbol ETHBTC).
+    market = data.get('market')
+    if market == None:
+        return(None)
+    return(core_object.market_registry.get(market) or core_object.market_registry.get_symbol(market))
+
+
+@SOCKET_IO.on('connect')
+def web_connect():
+    # Send the full trader state to a newly connected client, after this it only receives deltas.
+    if core_object != None:
+        emit('current_traders_data', {'data':core_object.web_tracker.snapshot()})
+
+
+@SOCKET_IO.on('request_snapshot')
+def web_request_snapshot():
+    # Resend the full trader state to a client that has missed a delta version.
+    if core_object != None:
+        emit('current_traders_data', {'data':core_object.web_tracker.snapshot()})
 
 
 def web_updater():
     # Web updater use to update live via socket.
-    lastHash = None
+    last_rate_limit_stats = None
 
-    while True:
+    core_object.lifecycle.wait_for_state('RUN')
+
+    while not(core_object.lifecycle.wait(.8)):
         if core_object.coreState == 'RUN':
-            ## Get trader data and hash it to find out if there have been any changes.
-            traderData = core_object.get_trader_data()
-            currHash = hashlib.md5(str(traderData).encode())
-
-            if lastHash != currHash:
-                ## Update any new changes via socket.
-                lastHash = currHash
-                total_bulk_data = []
-                for trader in traderData:
-                    bulk_data = {}
-                    bulk_data.update({'market':trader['market']})
-                    bulk_data.update({'trade_recorder':trader['trade_recorder']})
-                    bulk_data.update({'wallet_pair':trader['wallet_pair']})
-
-                    bulk_data.update(trader['custom_conditions'])
-                    bulk_data.update(trader['market_activity'])
-                    bulk_data.update(trader['market_prices'])
-                    bulk_data.update(trader['state_data'])
-                    total_bulk_data.append(bulk_data)
-
-                SOCKET_IO.emit('current_traders_data', {'data':total_bulk_data})
-                time.sleep(.8)
+            ## Only the fields that changed since the last update are sent (tagged with each markets version).
+            deltas = core_object.web_tracker.collect(core_object.trader_objects)
+
+            if deltas:
+                SOCKET_IO.emit('traders_data_delta', {'data':deltas})
+
+            ## The rate limiter counters are small so they are sent whenever they change.
+            rate_limit_stats = core_object.get_rate_limit_stats()
+            rate_limit_stats.pop('endpoints', None)
+            if rate_limit_stats != last_rate_limit_stats:
+                last_rate_limit_stats = rate_limit_stats
+                SOCKET_IO.emit('rate_limit_stats', {'data':rate_limit_stats})
 
 
 class BotCore():
 
-    def __init__(self, settings, logs_dir, cache_dir):
-        # Initilization for the bot core managment object.
+    def __init__(self, settings, logs_dir, cache_dir, shard_link=None):
+        # Initilization for the bot core managment object (shard_link is set when running as a shard process).
         logging.info('[BotCore] Initilizing the BotCore object.')
+        self.shard_link         = shard_link
 
         ## Setup binance REST and socket API.
-        self.rest_api           = api_master_rest_caller.Binance_REST(settings['public_key'], settings['private_key'])
+        ## Point the binance api at a local exchange simulator (see simulator.py) if one is set.
+        if settings['simulator_host']:
+            exchange_simulator.point_binance_api(
+                'http://{0}:{1}'.format(settings['simulator_host'], exchange_simulator.REST_PORT),
+                'ws://{0}:{1}'.format(settings['simulator_host'], exchange_simulator.SOCKET_PORT),
+                [api_master_rest_caller, api_master_socket_caller])
+
+        ## All REST calls go through the rate limiter so the Binance request weight limits are never exceeded (shards split the limits).
+        limit_share = 1/shard_link.shard_count if shard_link else 1
+        self.rest_api           = rate_limiter.RateLimitedREST(api_master_rest_caller.Binance_REST(settings['public_key'], settings['private_key']),
+            weight_limit=int(rate_limiter.WEIGHT_LIMIT*limit_share),
+            order_limit=max(int(rate_limiter.ORDER_LIMIT*limit_share), 1))
         self.socket_api         = api_master_socket_caller.Binance_SOCK()
 
+        ## Setup the notifier used to wake traders only when their market data changes.
+        self.data_notifier      = data_notifier.DataNotifier()
+
+        ## Setup the evaluator for batched condition checks (only if trader_configuration provides batch_ functions).
+        batch_functions = batch_evaluator.get_batch_functions()
+        if batch_functions:
+            self.batch_evaluator = batch_evaluator.BatchEvaluator(batch_functions)
+            self.data_notifier.set_sweep_callback(self.batch_evaluator.evaluate)
+        else:
+            self.batch_evaluator = None
+
+        ## Setup the shared worker pool used to run the traders (0 workers gives each trader its own thread).
+        if settings['trader_workers'] > 0:
+            self.trader_scheduler = trader_scheduler.TraderScheduler(settings['trader_workers'])
+        else:
+            self.trader_scheduler = None
+
         ## Setup the logs/cache dir locations.
         self.logs_dir           = logs_dir
         self.cache_dir          = cache_dir
 
+        ## Setup the store used to persist the traders state (snapshot plus a log of changes, owned by the parent for shards).
+        if shard_link:
+            self.state_store    = shard_manager.ShardStateStore(shard_link)
+        else:
+            self.state_store    = trader_store.TraderStateStore(cache_dir)
+
+        ## Setup the store holding the full trade history (traders only keep their newest trades in memory).
+        self.history_store      = trade_history.TradeHistory(os.path.join(cache_dir, trade_history.HISTORY_FILE))
+
+        ## Setup the per market cache the chart endpoints are served from.
+        self.chart_cache        = chart_cache.ChartCache()
+
+        ## Setup the local kline store (cache/klines) the trader candles are seeded from on start.
+        self.kline_store        = kline_store.KlineStore(cache_dir, settings['trader_interval'])
+
+        ## Setup the journal completed round trips are written to (by a background writer, in the parent for shards).
+        if shard_link:
+            self.trade_journal  = shard_manager.ShardJournal(shard_link)
+        else:
+            self.trade_journal  = trade_journal.TradeJournal(os.path.join(logs_dir, trade_journal.JOURNAL_FILE), settings['journal_fsync'])
+
+        ## Setup the gateway used to make the order REST calls off the trader threads.
+        self.order_gateway      = order_gateway.OrderGateway()
+
         ## Setup run type, market type, and update bnb balance.
         self.run_type           = settings['run_type']
         self.market_type        = settings['market_type']
         self.update_bnb_balance = settings['update_bnb_balance']
+        self.latency_log        = settings['latency_log']
 
         ## Setup max candle/depth setting.
         self.max_candles        = settings['max_candles']
         self.max_depth          = settings['max_depth']
 
+        ## Local order books kept from the 100ms diff depth stream (set up once the markets are known).
+        self.local_order_book   = settings['local_order_book']
+        self.simulator_host     = settings['simulator_host']
+        self.depth_stream       = None
+
         ## Get base quote pair (This prevents multiple different pairs from conflicting.)
         pair_one = settings['trading_markets'][0]
 
@@ -250,58 +434,68 @@ class BotCore():
         self.base_currency      = settings['trading_currency']
         self.candle_Interval    = settings['trader_interval']
 
-        ## Initilize base trader settings.
-        self.trader_objects     = []
+        ## Initilize base trader settings (traders are indexed by market, symbol and asset).
+        self.market_registry    = market_registry.MarketRegistry()
+
+        ## Sockets of the markets added while running (by market) and the lock guarding market changes.
+        self.market_sockets     = {}
+        self.market_lock        = threading.Lock()
         self.trading_markets    = settings['trading_markets']
 
+        ## Initilize the tracker used to send only changed trader data to the web UI.
+        self.web_tracker        = web_delta.WebDeltaTracker()
+
         ## Initilize core state
-        self.coreState          = 'READY'
+        self.lifecycle          = core_lifecycle.CoreLifecycle()
+
+        ## Timings of the startup phases (replaced on start).
+        self.startup_timer      = startup_timer.StartupTimer()
+
+
+    @property
+    def coreState(self):
+        return(self.lifecycle.state)
+
+
+    @property
+    def trader_objects(self):
+        return(self.market_registry.traders())
 
 
     def start(self):
         # Start the core object.
         logging.info('[BotCore] Starting the BotCore object.')
-        self.coreState = 'SETUP'
+        self.lifecycle.set_state('SETUP')
+        self.startup_timer = startup_timer.StartupTimer()
+        startup = self.startup_timer
+
+        ## The exchange info and cached trader state do not depend on each other so are loaded at once.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            exchange_info_future = executor.submit(startup.timed, 'exchange_info', self.rest_api.get_exchangeInfo)
+            cached_traders_future = executor.submit(startup.timed, 'cached_state', self.state_store.load)
 
         ## check markets
         found_markets = []
         not_supported = []
+        found_market_info = {}
+        trading_markets = set(self.trading_markets)
 
-        for market in self.rest_api.get_exchangeInfo()['symbols']:
-            fmtMarket = '{0}-{1}'.format(market['quoteAsset'], market['baseAsset'])
-
-            # If the current market is not in the trading markets list then skip.
-            if not fmtMarket in self.trading_markets:
-                continue
-
-            found_markets.append(fmtMarket)
+        with startup.phase('parse_markets'):
+            for market in exchange_info_future.result()['symbols']:
+                fmtMarket = '{0}-{1}'.format(market['quoteAsset'], market['baseAsset'])
 
-            if (self.market_type == 'MARGIN' and market['isMarginTradingAllowed'] == False) or (self.market_type == 'SPOT' and market['isSpotTradingAllowed'] == False):
-                not_supported.append(fmtMarket)
-                continue
+                # If the current market is not in the trading markets list then skip.
+                if not fmtMarket in trading_markets:
+                    continue
 
-            # This is used to setup min quantity.
-            if float(market['filters'][2]['minQty']) < 1.0:
-                minQuantBase = (Decimal(market['filters'][2]['minQty'])).as_tuple()
-                lS = abs(int(len(minQuantBase.digits)+minQuantBase.exponent))+1
-            else: lS = 0
+                found_markets.append(fmtMarket)
 
-            # This is used to set up the price precision for the market.
-            tickSizeBase = (Decimal(market['filters'][0]['tickSize'])).as_tuple()
-            tS = abs(int(len(tickSizeBase.digits)+tickSizeBase.exponent))+1
+                if not(self._is_supported(market)):
+                    not_supported.append(fmtMarket)
+                    continue
 
-            # This is used to get the markets minimal notation.
-            mN = float(market['filters'][3]['minNotional'])
+                found_market_info.update({fmtMarket:market})
 
-            # Put all rules into a json object to pass to the trader.
-            market_rules = {'LOT_SIZE':lS, 'TICK_SIZE':tS, 'MINIMUM_NOTATION':mN}
-
-            # Initilize trader objecta dn also set-up its inital required data.
-            traderObject = trader.BaseTrader(market['quoteAsset'], market['baseAsset'], self.rest_api, socket_api=self.socket_api)
-            traderObject.setup_initial_values(self.market_type, self.run_type, market_rules)
-            self.trader_objects.append(traderObject)
-
-        
         ## Show markets that dont exist on the binance exchange.
         if len(self.trading_markets) != len(found_markets):
             no_market_text = ''
@@ -317,98 +511,359 @@ class BotCore():
             logging.warning('[BotCore] Following market pairs are not supported for {}: {}'.format(self.market_type, not_support_text))
 
         valid_tading_markets = [market for market in found_markets if market not in not_supported]
+        symbols = [market_registry.market_symbol(market) for market in valid_tading_markets]
+
+        if self.simulator_host:
+            rest_url = 'http://{0}:{1}'.format(self.simulator_host, exchange_simulator.REST_PORT)
+        else:
+            rest_url = order_book.REST_URL
+
+        ## Fetch the klines missing from the kline store for all markets at once (bounded by the rate limiter).
+        with startup.phase('backfill'):
+            backfilled = self.kline_store.backfill(symbols, self.max_candles, rest_url, rest_api=self.rest_api)
+        logging.info('[BotCore] Backfilled {0} klines for {1} markets.'.format(sum(backfilled.values()), len(backfilled)))
+
+        ## Setup the local order books (these replace the binance_api depth stream).
+        if self.local_order_book:
+            depth_urls = {}
+            if self.simulator_host:
+                depth_urls = {
+                    'rest_url':rest_url,
+                    'socket_url':'ws://{0}:{1}'.format(self.simulator_host, exchange_simulator.SOCKET_PORT)}
+            self.depth_stream = order_book.DepthStream(symbols, self.max_depth, rest_api=self.rest_api, **depth_urls)
+            self.depth_stream.set_listener(self.data_notifier.push)
+
+        ## Initilize the trader objects (after the depth stream as the traders read their depth from it).
+        with startup.phase('create_traders'):
+            for market in valid_tading_markets:
+                self._add_trader(found_market_info[market], self.socket_api)
+
+        ## Only the candles since the last stored kline are fetched (all markets share the socket so the largest gap is used).
+        candle_limit = self.kline_store.fetch_limit(symbols, self.max_candles)
+        logging.info('[BotCore] Fetching {0} historic candles per market.'.format(candle_limit))
 
         ## setup the binance socket.
         for market in valid_tading_markets:
             self.socket_api.set_candle_stream(symbol=market, interval=self.candle_Interval)
-            self.socket_api.set_manual_depth_stream(symbol=market, update_speed='1000ms')
+            if not(self.depth_stream):
+                self.socket_api.set_manual_depth_stream(symbol=market, update_speed='1000ms')
 
         if self.run_type == 'REAL':
             self.socket_api.set_userDataStream(self.rest_api, self.market_type)
 
-        self.socket_api.BASE_CANDLE_LIMIT = self.max_candles
+        self.socket_api.BASE_CANDLE_LIMIT = candle_limit
         self.socket_api.BASE_DEPTH_LIMIT = self.max_depth
 
-        self.socket_api.build_query()
-        self.socket_api.set_live_and_historic_combo(self.rest_api)
+        with startup.phase('socket_history'):
+            self.socket_api.build_query()
+            self.socket_api.set_live_and_historic_combo(self.rest_api)
 
         self.socket_api.start()
+        if self.depth_stream:
+            self.depth_stream.start()
+        self.data_notifier.start()
 
-        # Load the wallets.
-        if self.run_type == 'REAL':
-            user_info = self.rest_api.get_account(self.market_type)
-            if self.market_type == 'SPOT':
-                wallet_balances = user_info['balances']
-            elif self.market_type == 'MARGIN':
-                wallet_balances = user_info['userAssets']
-            current_tokens = {}
-            
-            for balance in wallet_balances:
-                total_balance = (float(balance['free']) + float(balance['locked']))
-                if total_balance > 0:
-                    current_tokens.update({balance['asset']:[
-                                        float(balance['free']),
-                                        float(balance['locked'])]})
-        else:
-            current_tokens = {self.quote_asset:[float(self.base_currency), 0.0]}
-
-        # Load cached data
-        cached_traders_data = None
-        if os.path.exists(self.cache_dir+CAHCE_FILES):
-            with open(self.cache_dir+CAHCE_FILES, 'r') as f:
-                cached_traders_data = json.load(f)['data']
-
-        ## Setup the trader objects and start them.
-        logging.info('[BotCore] Starting the trader objects.')
-        for trader_ in self.trader_objects:
-            currSymbol = "{0}{1}".format(trader_.base_asset, trader_.quote_asset)
+        if self.trader_scheduler:
+            self.trader_scheduler.start()
 
-            # Update trader with cached data (to resume trades/keep records of trades.)
-            if cached_traders_data != '' and cached_traders_data:
-                for cached_trader in cached_traders_data:
-                    m_split = cached_trader['market'].split('-')
-                    if (m_split[1]+m_split[0]) == currSymbol:
-                        trader_.configuration           = cached_trader['configuration']
-                        trader_.custom_conditional_data = cached_trader['custom_conditions']
-                        trader_.market_activity         = cached_trader['market_activity']
-                        trader_.trade_recorder          = cached_trader['trade_recorder']
-                        trader_.state_data              = cached_trader['state_data']
+        # Load the wallets (after the user data stream is open so no balance change is missed).
+        with startup.phase('wallets'):
+            wallet_pairs = self._wallet_pairs(self._get_current_tokens())
 
-            wallet_pair = {}
+        # Cached data (snapshot plus any changes logged since it was written).
+        cached_traders_data = cached_traders_future.result()
+        cached_traders = {cached_trader['market']:cached_trader for cached_trader in (cached_traders_data or [])}
 
-            if trader_.quote_asset in current_tokens:
-                wallet_pair.update({trader_.quote_asset:current_tokens[trader_.quote_asset]})
+        self.trade_journal.start()
+        self.order_gateway.start()
 
-            if trader_.base_asset in current_tokens:
-                wallet_pair.update({trader_.base_asset:current_tokens[trader_.base_asset]})
-
-            trader_.start(self.base_currency, wallet_pair)
+        ## Start the traders at once so each starts as soon as its own market data is ready.
+        logging.info('[BotCore] Starting the trader objects.')
+        traders = self.trader_objects
+        if traders:
+            with startup.phase('start_traders'):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=min(TRADER_START_WORKERS, len(traders))) as executor:
+                    for trader_ in traders:
+                        executor.submit(self._start_trader, trader_, cached_traders, wallet_pairs)
 
         logging.debug('[BotCore] Starting trader manager')
-        TM_thread = threading.Thread(target=self._trader_manager)
-        TM_thread.start()
+        self.lifecycle.start_thread('TraderManager', self._trader_manager)
 
         if self.update_bnb_balance:
             logging.debug('[BotCore] Starting BNB manager')
-            BNB_thread = threading.Thread(target=self._bnb_manager)
-            BNB_thread.start()
+            self.lifecycle.start_thread('BNBManager', self._bnb_manager)
 
         logging.debug('[BotCore] Starting connection manager thread.')
-        CM_thread = threading.Thread(target=self._connection_manager)
-        CM_thread.start()
+        self.lifecycle.start_thread('ConnectionManager', self._connection_manager)
 
         logging.debug('[BotCore] Starting file manager thread.')
-        FM_thread = threading.Thread(target=self._file_manager)
-        FM_thread.start()
+        self.lifecycle.start_thread('FileManager', self._file_manager)
+
+        startup.finish()
+        logging.info('[BotCore] BotCore successfully started in {0}.'.format(startup.summary()))
+        self.lifecycle.set_state('RUN')
+
+
+    def stop(self, timeout=core_lifecycle.STOP_TIMEOUT):
+        ''' Stop the core, all managed threads are joined within the timeout. '''
+        if not(self.lifecycle.set_state('STOP')):
+            return(False)
+        logging.info('[BotCore] Stopping the BotCore object.')
+
+        alive = self.lifecycle.join(timeout)
+
+        if hasattr(self.socket_api, 'stop'):
+            self.socket_api.stop()
+
+        for socket_api in list(self.market_sockets.values()):
+            socket_api.stop()
+
+        if self.depth_stream:
+            self.depth_stream.stop()
+
+        logging.info('[BotCore] BotCore stopped.')
+        return(len(alive) == 0)
+
+
+    def add_market(self, market):
+        '''
+        Add a market while the core is running, returns (added, error message), added once the market is being set up.
+        -> The market gets its own socket so only its candles are backfilled, its trader is started once its data is ready.
+        '''
+        if self.coreState != 'RUN':
+            return(False, 'CORE_NOT_RUNNING')
+
+        with self.market_lock:
+            if market in self.market_registry or market in self.market_sockets:
+                return(False, 'MARKET_EXISTS')
+
+            if market[:market.find('-')] != self.quote_asset:
+                return(False, 'INVALID_QUOTE_ASSET')
+
+            market_info = None
+            for symbol_info in self.rest_api.get_exchangeInfo()['symbols']:
+                if '{0}-{1}'.format(symbol_info['quoteAsset'], symbol_info['baseAsset']) == market:
+                    market_info = symbol_info
+                    break
+
+            if market_info == None:
+                return(False, 'INVALID_MARKET')
+            if not(self._is_supported(market_info)):
+                return(False, 'MARKET_NOT_SUPPORTED')
+
+            logging.info('[BotCore] Adding market {0}.'.format(market))
+            candle_limit = self.kline_store.fetch_limit([market_registry.market_symbol(market)], self.max_candles)
+            socket_api = market_socket.MarketSocket(market, self.socket_api, self.rest_api, self.candle_Interval, candle_limit, self.max_depth, with_depth=not(self.depth_stream))
+            self.market_sockets.update({market:socket_api})
+            if self.depth_stream:
+                self.depth_stream.add_symbol(market_registry.market_symbol(market))
+
+        self.lifecycle.start_thread('AddMarket-{0}'.format(market), lambda: self._start_added_market(market_info, socket_api))
+        return(True, None)
+
+
+    def remove_market(self, market):
+        '''
+        Stop a markets trader and unsubscribe its streams while the core is running, returns (removed, error message).
+        -> REAL traders with an open order or position are not removed as nothing would be left managing them on the exchange.
+        -> A market still being set up (backfilling) is cancelled, its set up thread drops it once the backfill returns.
+        '''
+        with self.market_lock:
+            trader_ = self.market_registry.get(market)
+            if trader_ == None:
+                if market in self.market_sockets:
+                    logging.info('[BotCore] Cancelling the add of market {0}.'.format(market))
+                    self.market_sockets.pop(market)
+                    return(True, None)
+                return(False, 'INVALID_TRADER')
+
+            ## Checked under the cycle lock so the trader can not place an order between the check and the stop.
+            with trader_.cycle_lock:
+                cp = trader_.market_activity
+                if self.run_type == 'REAL' and (cp['order_id'] != None or cp['order_side'] == 'SELL'):
+                    return(False, 'MARKET_IN_TRADE')
+                trader_.stop()
+
+            logging.info('[BotCore] Removing market {0}.'.format(market))
+            symbol = market_registry.market_symbol(market)
+
+            self.market_registry.remove(market)
+            self.data_notifier.unregister(symbol)
+            if self.batch_evaluator:
+                self.batch_evaluator.remove(trader_)
+            self.chart_cache.remove(market)
+
+            ## Markets from the start share the core socket (binance_api can not unsubscribe them, their data is ignored).
+            socket_api = self.market_sockets.pop(market, None)
+            if socket_api:
+                socket_api.stop()
+            if self.depth_stream:
+                self.depth_stream.remove_symbol(symbol)
+
+            self.trading_markets = [trading_market for trading_market in self.trading_markets if trading_market != market]
+
+        ## Joined outside the market lock so other market changes are not held up by the trader finishing its cycle.
+        trader_.join(core_lifecycle.STOP_TIMEOUT)
+
+        ## Keep the final state so the trades are not lost if the market is added again after a restart.
+        self.state_store.sync([trader_])
+        self._record_klines([trader_])
+        return(True, None)
+
+
+    def _start_added_market(self, market_info, socket_api):
+        market = socket_api.market
+
+        try:
+            socket_api.start()
+            started = True
+        except Exception:
+            logging.exception('[BotCore] Failed to set up the added market {0}.'.format(market))
+            started = False
+
+        with self.market_lock:
+            ## Failed, removed (or the core stopped) while backfilling, the market is dropped so it can be added again.
+            if not(started) or self.market_sockets.get(market) != socket_api or self.lifecycle.is_stopping():
+                if self.market_sockets.get(market) == socket_api:
+                    self.market_sockets.pop(market)
+                if self.depth_stream and not(market in self.market_sockets):
+                    self.depth_stream.remove_symbol(market_registry.market_symbol(market))
+                try:
+                    socket_api.stop()
+                except Exception:
+                    logging.exception('[BotCore] Failed to close the socket for {0}.'.format(market))
+                return
+
+            trader_ = self._add_trader(market_info, socket_api)
+            self.trading_markets = self.trading_markets+[market]
+
+        trader_.start(self.base_currency, self._wallet_pairs(self._get_current_tokens()).get(market, {}))
+
+        ## Removed while waiting for its data, the trader was stopped before it was started.
+        if not(market in self.market_registry):
+            trader_.stop()
+            return
+        logging.info('[BotCore] Market {0} added.'.format(market))
+
+
+    def _start_trader(self, trader_, cached_traders, wallet_pairs):
+        ''' Restore a traders cached state and start it (blocks until its market data is ready). '''
+        try:
+            # Update trader with cached data (to resume trades/keep records of trades.)
+            cached_trader = cached_traders.get(trader_.print_pair)
+            if cached_trader:
+                trader_.configuration           = cached_trader['configuration']
+                trader_.custom_conditional_data = cached_trader['custom_conditions']
+                trader_.market_activity         = cached_trader['market_activity']
+                trader_.trade_recorder          = cached_trader['trade_recorder']
+                trader_.state_data              = cached_trader['state_data']
+
+                # Caches from before the trade history store hold the full history, move it into the store.
+                if self.history_store.count(trader_.print_pair) == 0 and trader_.trade_recorder:
+                    self.history_store.extend(trader_.print_pair, trader_.trade_recorder)
+                trade_history.trim_recent(trader_.trade_recorder)
+
+            ## Totals shown by the UI cover the full history not just the trades held in the recorder.
+            trader_.trade_totals = self.history_store.totals(trader_.print_pair)
+
+            trader_.start(self.base_currency, wallet_pairs.get(trader_.print_pair, {}))
+            self.startup_timer.market_started(trader_.print_pair)
+        except Exception:
+            logging.exception('[BotCore] Failed to start the trader for {0}.'.format(trader_.print_pair))
+
+
+    def _add_trader(self, market_info, socket_api):
+        ''' Initilize a trader for an exchangeInfo symbol and register it. '''
+        # This is used to setup min quantity.
+        if float(market_info['filters'][2]['minQty']) < 1.0:
+            minQuantBase = (Decimal(market_info['filters'][2]['minQty'])).as_tuple()
+            lS = abs(int(len(minQuantBase.digits)+minQuantBase.exponent))+1
+        else: lS = 0
+
+        # This is used to set up the price precision for the market.
+        tickSizeBase = (Decimal(market_info['filters'][0]['tickSize'])).as_tuple()
+        tS = abs(int(len(tickSizeBase.digits)+tickSizeBase.exponent))+1
+
+        # This is used to get the markets minimal notation.
+        mN = float(market_info['filters'][3]['minNotional'])
+
+        # Put all rules into a json object to pass to the trader.
+        market_rules = {'LOT_SIZE':lS, 'TICK_SIZE':tS, 'MINIMUM_NOTATION':mN}
+
+        # Initilize trader objecta dn also set-up its inital required data.
+        traderObject = trader.BaseTrader(market_info['quoteAsset'], market_info['baseAsset'], self.rest_api, socket_api=socket_api, notifier=self.data_notifier, scheduler=self.trader_scheduler, batch_evaluator=self.batch_evaluator, state_store=self.state_store, history_store=self.history_store, trade_journal=self.trade_journal, order_gateway=self.order_gateway, depth_stream=self.depth_stream, max_candles=self.max_candles)
+        traderObject.setup_initial_values(self.market_type, self.run_type, market_rules)
+
+        # Seed the candles from the kline store, the fetched candles are merged onto them by the first sync.
+        traderObject.candle_store.load(self.kline_store.load(market_info['symbol'], self.max_candles))
+        self.market_registry.add(traderObject)
+
+        if self.batch_evaluator:
+            self.batch_evaluator.add(traderObject)
+        return(traderObject)
+
+
+    def _is_supported(self, market_info):
+        return(not((self.market_type == 'MARGIN' and market_info['isMarginTradingAllowed'] == False) or (self.market_type == 'SPOT' and market_info['isSpotTradingAllowed'] == False)))
 
-        logging.info('[BotCore] BotCore successfully started.')
-        self.coreState = 'RUN'
+
+    def _get_current_tokens(self):
+        ''' Wallet balances held ({asset:[free, locked]}), test runs only hold the trading currency. '''
+        if self.run_type != 'REAL':
+            return({self.quote_asset:[float(self.base_currency), 0.0]})
+
+        user_info = self.rest_api.get_account(self.market_type)
+        if self.market_type == 'SPOT':
+            wallet_balances = user_info['balances']
+        elif self.market_type == 'MARGIN':
+            wallet_balances = user_info['userAssets']
+        current_tokens = {}
+
+        for balance in wallet_balances:
+            total_balance = (float(balance['free']) + float(balance['locked']))
+            if total_balance > 0:
+                current_tokens.update({balance['asset']:[
+                                    float(balance['free']),
+                                    float(balance['locked'])]})
+        return(current_tokens)
+
+
+    def _wallet_pairs(self, current_tokens):
+        ''' Wallet pair of each trader ({market:{asset:[free, locked]}}), the balances held are routed by asset. '''
+        wallet_pairs = {}
+        for asset, balance in current_tokens.items():
+            for trader_ in self.market_registry.for_asset(asset):
+                wallet_pairs.setdefault(trader_.print_pair, {}).update({asset:balance})
+        return(wallet_pairs)
 
 
     def _trader_manager(self):
-        ''' '''
-        while self.coreState != 'STOP':
-            pass
+        ''' This blocks until the core is stopped then cleanly stops all of the traders. '''
+        self.lifecycle.wait_for_state('STOP')
+
+        for trader_ in self.trader_objects:
+            trader_.stop()
+
+        ## The traders share one deadline so shutdown does not grow with the number of markets.
+        deadline = time.time()+core_lifecycle.STOP_TIMEOUT
+        if self.trader_scheduler:
+            self.trader_scheduler.stop(max(0, deadline-time.time()))
+        self.data_notifier.stop()
+
+        for trader_ in self.trader_objects:
+            trader_.join(max(0, deadline-time.time()))
+
+        self.trade_journal.stop(core_lifecycle.STOP_TIMEOUT)
+        self.order_gateway.stop()
+
+        ## The stores are closed only once the traders are joined so a final fill still reaches them.
+        ## Fold the log into the snapshot on shutdown so the next start has nothing to replay.
+        self.state_store.sync(self.trader_objects)
+        self.state_store.close()
+        self.history_store.close()
+
+        self._record_klines(self.trader_objects)
+        self.kline_store.close()
 
 
     def _bnb_manager(self):
@@ -427,29 +882,38 @@ class BotCore():
                         if wallet['a'] == 'BNB':
                             if float(wallet['f']) < 0.01:
                                 bnb_order = self.rest_api.place_order(self.market_type, symbol='BNBBTC', side='BUY', type='MARKET', quantity=0.1)
-            time.sleep(2)
+            self.lifecycle.wait(2)
 
 
     def _file_manager(self):
         ''' This section is responsible for activly updating the traders cache files. '''
         while self.coreState != 'STOP':
-            time.sleep(15)
+            self.lifecycle.wait(15)
 
-            traders_data = self.get_trader_data()
-            if os.path.exists(self.cache_dir):
-                file_path = '{0}{1}'.format(self.cache_dir,CAHCE_FILES)
+            ## Only the trader state that changed is appended to the log (compacted once it grows).
+            self.state_store.sync(self.trader_objects)
+            self._record_klines(self.trader_objects)
+
+            if self.latency_log and os.path.exists(self.logs_dir):
+                file_path = '{0}{1}'.format(self.logs_dir, LATENCY_LOG_FILE)
                 with open(file_path, 'w') as f:
-                    json.dump({'lastUpdateTime':time.time() ,'data':traders_data}, f)
+                    json.dump({'lastUpdateTime':time.time(), 'data':self.get_latency_stats()}, f)
+
+
+    def _record_klines(self, traders):
+        ''' Append the candles closed since the last call to the kline store. '''
+        for trader_ in traders:
+            with trader_.cycle_lock:
+                self.kline_store.record(trader_.base_asset+trader_.quote_asset, trader_.candle_store)
 
 
     def _connection_manager(self):
         ''' This section is responsible for re-testing connectiongs in the event of a disconnect. '''
         update_time = 0
         retryCounter = 1
-        time.sleep(20)
+        self.lifecycle.wait(20)
 
-        while self.coreState != 'STOP':
-            time.sleep(1)
+        while not(self.lifecycle.wait(1)):
             if self.coreState != 'RUN':
                 continue
             if self.socket_api.last_data_recv_time != update_time:
@@ -469,6 +933,11 @@ class BotCore():
                         logging.info('[BotCore] Attempting socket restart.')
                         self.socket_api.start()
 
+                    for socket_api in list(self.market_sockets.values()):
+                        if not(socket_api.socketRunning):
+                            logging.info('[BotCore] Attempting socket restart for {0}.'.format(socket_api.market))
+                            socket_api.reconnect()
+
 
     def get_trader_data(self):
         ''' This can be called to return data for each of the active traders. '''
@@ -476,30 +945,111 @@ class BotCore():
         return(rData)
 
 
-    def get_trader_indicators(self, market):
-        ''' This can be called to return the indicators that are used by the traders (Will be used to display web UI activity.) '''
-        for _trader in self.trader_objects:
-            if _trader.print_pair == market:
-                indicator_data = _trader.indicators
-                indicator_data.update({'order':{'buy':[], 'sell':[]}})
-                indicator_data['order']['buy'] = [ [order[0],order[1]] for order in _trader.trade_recorder if order[4] == 'BUY']
-                indicator_data['order']['sell'] = [ [order[0],order[1]] for order in _trader.trade_recorder if order[4] == 'SELL']
-                return(indicator_data)
+    def get_latency_stats(self, market=None):
+        ''' This can be called to return the per stage latency stats for each of the traders (or a single market). '''
+        return({_trader.print_pair:_trader.stage_timer.get_stats() for _trader in self._traders_for(market)})
+
+
+    def get_indicator_cache_stats(self, market=None):
+        ''' This can be called to return the indicator cache hit/miss counters for each of the traders (or a single market). '''
+        return({_trader.print_pair:_trader.indicator_engine.cache.get_stats() for _trader in self._traders_for(market)})
+
 
+    def _traders_for(self, market):
+        ''' All traders when market is None, otherwise just that markets trader (if held). '''
+        if market == None:
+            return(self.trader_objects)
+        _trader = self.market_registry.get(market)
+        return([] if _trader == None else [_trader])
 
-    def get_trader_candles(self, market):
+
+    def get_scheduler_stats(self):
+        ''' The worker pool stats with the notifier wakeup counts (how the traders on it were woken). '''
+        if self.trader_scheduler == None:
+            return(None)
+        scheduler_stats = self.trader_scheduler.get_stats()
+        scheduler_stats.update({'notifier':self.data_notifier.get_watch_stats()})
+        return(scheduler_stats)
+
+
+    def get_rate_limit_stats(self):
+        return(self.rest_api.get_stats())
+
+
+    def get_startup_stats(self):
+        return(self.startup_timer.get_stats())
+
+
+    def get_order_gateway_stats(self):
+        return(self.order_gateway.get_stats())
+
+
+    def trader_action(self, market, action):
+        ''' Start (un-pause) or pause a trader, returns False if the action is not known. '''
+        _trader = self.market_registry.get(market)
+        if _trader == None:
+            return(False)
+
+        if action == 'start':
+            ## Updating trader status to running.
+            if _trader.state_data['runtime_state'] == 'FORCE_PAUSE':
+                _trader.state_data['runtime_state'] = 'RUN'
+        elif action == 'pause':
+            ## Updating trader status to paused.
+            if _trader.state_data['runtime_state'] == 'RUN':
+                _trader.state_data['runtime_state'] = 'FORCE_PAUSE'
+        else:
+            return(False)
+        return(True)
+
+
+    def get_order_book(self, market, bps, size=None):
+        ''' This can be called to return the local order book stats for a market (None if local books are not kept). '''
+        if self.depth_stream == None:
+            return(None)
+
+        quote_asset, base_asset = market.split('-')
+        book = self.depth_stream.get_book(base_asset+quote_asset)
+        if book == None:
+            return(None)
+
+        book_data = {
+            'market':market,
+            'synced':book.synced,
+            'top_of_book':book.top_of_book(),
+            'spread':book.spread(),
+            'depth':book.depth_within(bps)}
+
+        if size != None:
+            book_data.update({'vwap':{'BUY':book.vwap('BUY', size), 'SELL':book.vwap('SELL', size)}})
+        return(book_data)
+
+
+    def get_chart_data(self, market, kind, limit=None, since=None, before=None, encoding='json'):
+        ''' This can be called to return the encoded chart data for a trader (cached until its live candle changes). '''
+        _trader = self.market_registry.get(market)
+        if _trader == None:
+            return(None)
+        return(self.chart_cache.get(_trader, self.history_store, kind, limit, since, before, encoding))
+
+
+    def get_trader_candles(self, market, limit=None):
         ''' This can be called to return the candle data for the traders (Will be used to display web UI activity.) '''
-        for _trader in self.trader_objects:
-            if _trader.print_pair == market:
-                sock_symbol = str(_trader.base_asset)+str(_trader.quote_asset)
-                return(self.socket_api.get_live_candles(sock_symbol))
+        _trader = self.market_registry.get(market)
+        if _trader == None:
+            return(None)
+        return(_trader.candle_store.to_list(limit))
 
 
 def start(settings, logs_dir, cache_dir):
     global core_object, host_ip, host_port
 
     if core_object == None:
-        core_object = BotCore(settings, logs_dir, cache_dir)
+        ## Sharded mode runs the traders in worker processes, this process only serves the web UI and writes the cache.
+        if settings['shard_processes'] > 0:
+            core_object = shard_manager.ShardedCore(settings, logs_dir, cache_dir, settings['shard_processes'])
+        else:
+            core_object = BotCore(settings, logs_dir, cache_dir)
         core_object.start()
 
     logging.info('[BotCore] Starting traders in {0} mode, market type is {1}.'.format(settings['run_type'], settings['market_type']))
@@ -509,8 +1059,11 @@ def start(settings, logs_dir, cache_dir):
     host_ip = settings['host_ip']
     host_port = settings['host_port']
 
-    SOCKET_IO.run(APP, 
-        host=settings['host_ip'], 
-        port=settings['host_port'], 
-        debug=True, 
-        use_reloader=False)
+    try:
+        SOCKET_IO.run(APP, 
+            host=settings['host_ip'], 
+            port=settings['host_port'], 
+            debug=True, 
+            use_reloader=False)
+    finally:
+        core_object.stop()
@@ -0,0 +1,136 @@
+#! /usr/bin/env python3
+import logging
+import numpy as np
+
+## Candle fields in the order they are found within a candle.
+CANDLE_FIELDS = ['time', 'open', 'high', 'low', 'close', 'volume']
+
+## Default number of candles held per market.
+DEFAULT_CAPACITY = 500
+
+
+class CandleStore(object):
+    '''
+    Ring buffer of candles for a single market backed by one preallocated numpy array per field.
+    -> Every row is written twice (at i and i+capacity) so the held candles are always one
+        contiguous block which allows zero-copy column views.
+    -> Indexing is newest first to match the socket candle lists (store[0] is the live candle).
+    '''
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.columns = {}
+
+        for field in CANDLE_FIELDS:
+            dtype = np.int64 if field == 'time' else np.float64
+            self.columns.update({field:np.zeros(capacity*2, dtype=dtype)})
+
+        self.head = -1
+        self.size = 0
+
+
+    def __len__(self):
+        return(self.size)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return([self[i] for i in range(*index.indices(self.size))])
+
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError('candle index out of range')
+
+        position = self.head+self.capacity-index
+        columns = self.columns
+        return([int(columns['time'][position]),
+            float(columns['open'][position]),
+            float(columns['high'][position]),
+            float(columns['low'][position]),
+            float(columns['close'][position]),
+            float(columns['volume'][position])])
+
+
+    def column(self, field, limit=None):
+        ''' Return a newest first zero-copy view of a field. '''
+        size = self.size if limit == None else min(limit, self.size)
+        end = self.head+self.capacity
+        return(self.columns[field][end:end-size:-1] if size else self.columns[field][:0])
+
+
+    def chronological(self, field, limit=None):
+        ''' Return an oldest first zero-copy view of a field. '''
+        size = self.size if limit == None else min(limit, self.size)
+        end = self.head+self.capacity+1
+        return(self.columns[field][end-size:end])
+
+
+    def to_list(self, limit=None):
+        ''' Return newest first candles as plain lists (used for serialising). '''
+        columns = [self.column(field, limit).tolist() for field in CANDLE_FIELDS]
+        return([list(candle) for candle in zip(*columns)])
+
+
+    def last_time(self):
+        ''' Open time of the newest candle held or None if empty. '''
+        if self.size == 0:
+            return(None)
+        return(int(self.columns['time'][self.head]))
+
+
+    def load(self, candles):
+        ''' Replace the held candles with a newest first candle list. '''
+        self.head = -1
+        self.size = 0
+        for i in range(min(len(candles), self.capacity)-1, -1, -1):
+            self.append(candles[i])
+
+
+    def append(self, candle):
+        ''' Add a new newest candle, dropping the oldest once full. '''
+        self.head = (self.head+1) % self.capacity
+        self._write(self.head, candle)
+        if self.size < self.capacity:
+            self.size += 1
+
+
+    def sync(self, candles):
+        '''
+        Bring the store in line with a newest first candle list.
+        -> If only the live candle has changed it is updated in place.
+        -> If new candles have opened the previous live candle is finalised and the new ones appended.
+        '''
+        if len(candles) == 0:
+            return
+
+        newest_time = self.last_time()
+        live_time = candles[0][0]
+
+        if newest_time == None or live_time < newest_time:
+            self.load(candles)
+            return
+
+        if live_time == newest_time:
+            self._write(self.head, candles[0])
+            return
+
+        index = 0
+        while index < len(candles) and candles[index][0] > newest_time:
+            index += 1
+
+        if index == len(candles):
+            logging.debug('[CandleStore] Candle gap seen, reloading candles.')
+            self.load(candles)
+            return
+
+        self._write(self.head, candles[index])
+        for i in range(index-1, -1, -1):
+            self.append(candles[i])
+
+
+    def _write(self, position, candle):
+        capacity = self.capacity
+        for i, field in enumerate(CANDLE_FIELDS):
+            column = self.columns[field]
+            column[position] = candle[i]
+            column[position+capacity] = candle[i]
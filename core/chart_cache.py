@@ -0,0 +1,224 @@
+#! /usr/bin/env python3
+import json
+import struct
+import threading
+import collections
+import numpy as np
+
+from . import candle_store
+
+## Chart data kinds served (charting holds both the candles and the indicators).
+CHART_KINDS = ['charting', 'candles', 'indicators']
+
+## Response encodings, binary is a JSON header followed by little endian float64 arrays.
+ENCODINGS = ['json', 'binary']
+
+## Start of every binary response.
+BINARY_MAGIC = b'SBTC'
+
+## Max encoded responses held per market (all are dropped whenever the live candle changes).
+MAX_RESPONSES = 16
+
+
+class MarketChart(object):
+    ''' Closed candle chart data for a market held as newest first numpy arrays. '''
+    def __init__(self, version, candles, series):
+        self.version = version
+        self.candles = candles
+        self.series = series
+        self.live_key = None
+        self.responses = collections.OrderedDict()
+
+
+class ChartCache(object):
+    '''
+    Per market cache of the chart data served to the web UI.
+    -> Closed candles, closed indicator values and the trade overlays are built into numpy arrays once per candle
+        close (or new trade), requests only window them and put the live candle/indicator values in front.
+    -> Encoded responses are reused until the live candle changes so clients polling a market share them.
+    -> since returns only the points at or after that time (the live candle is always sent again) and before
+        pages back to older points, the cursor/before values returned are passed on the next call.
+    '''
+    def __init__(self):
+        self.markets = {}
+        self.lock = threading.Lock()
+
+
+    def get(self, trader_, history_store, kind, limit=None, since=None, before=None, encoding='json'):
+        '''
+        Return the encoded chart data for a trader (bytes for binary, a str for json), None if there are no candles.
+        -> Only a snapshot of the candles/indicators is copied under the traders cycle lock, building and encoding is done outside it.
+        '''
+        response_key = (kind, limit, since, before, encoding)
+
+        with trader_.cycle_lock:
+            candles = trader_.candle_store
+            if len(candles) == 0:
+                return(None)
+
+            last_trade = tuple(trader_.trade_recorder[-1]) if trader_.trade_recorder else None
+            version = (trader_.indicator_engine.last_closed_time, candles[len(candles)-1][0], last_trade)
+            live_candle = candles[0]
+            live_key = tuple(live_candle)
+            live_values = [series.live for group, name, series in trader_.indicator_engine.series_items()]
+
+            with self.lock:
+                chart = self.markets.get(trader_.print_pair)
+                if chart != None and chart.version == version:
+                    if chart.live_key != live_key:
+                        chart.live_key = live_key
+                        chart.responses.clear()
+
+                    response = chart.responses.get(response_key)
+                    if response != None:
+                        return(response)
+
+            snapshot = None if chart != None and chart.version == version else self._snapshot(trader_)
+
+        if snapshot != None:
+            chart = self._build(trader_.print_pair, history_store, version, *snapshot)
+            chart.live_key = live_key
+            with self.lock:
+                self.markets.update({trader_.print_pair:chart})
+
+        response = self._encode(trader_.print_pair, chart, live_candle, live_values, kind, limit, since, before, encoding)
+
+        with self.lock:
+            if chart.live_key == live_key:
+                chart.responses[response_key] = response
+                while len(chart.responses) > MAX_RESPONSES:
+                    chart.responses.popitem(last=False)
+        return(response)
+
+
+    def remove(self, market):
+        with self.lock:
+            self.markets.pop(market, None)
+
+
+    def _snapshot(self, trader_):
+        ''' Copy the closed candles (index 0 of the candle store is the live candle) and take the cached closed indicator values of a trader. '''
+        candles = trader_.candle_store
+        closed_candles = np.column_stack([candles.column(field)[1:] for field in candle_store.CANDLE_FIELDS]).astype(np.float64)
+        histories = trader_.indicator_engine.closed_series()
+        return(closed_candles, histories, candles[len(candles)-1][0])
+
+
+    def _build(self, market, history_store, version, closed_candles, histories, oldest_time):
+        ''' Build the closed candle chart arrays for a market from a snapshot. '''
+        series = [_to_series(group, name, history) for group, name, history in histories]
+
+        ## Trade overlays only cover the held candles (trade times are in seconds, candle times in ms).
+        start_time = oldest_time/1000
+        for side in ['BUY', 'SELL']:
+            trades = history_store.query(market, start=start_time, side=side, newest_first=True)
+            series.append(_to_series('order', side.lower(), [[trade[0]*1000, trade[1]] for trade in trades]))
+
+        return(MarketChart(version, closed_candles, series))
+
+
+    def _encode(self, market, chart, live_candle, live_values, kind, limit, since, before, encoding):
+        candles = np.vstack((np.array([live_candle], dtype=np.float64), chart.candles))
+        candle_index = _window(candles[:, 0], since, before, limit)
+        selected_candles = candles[candle_index]
+
+        cursor = int(selected_candles[0][0]) if len(selected_candles) else since
+        oldest_time = selected_candles[-1][0] if len(selected_candles) else None
+        more_before = bool(len(candle_index) and candle_index[-1] < len(candles)-1)
+
+        selected_series = []
+        if kind in ['charting', 'indicators']:
+            for series, live in zip(chart.series, live_values+[None]*(len(chart.series)-len(live_values))):
+                columns = series['columns']
+                rows = series['rows']
+                if live != None:
+                    live_row = _to_series(series['group'], series['name'], [live], columns)
+                    columns = live_row['columns']
+                    rows = np.vstack((live_row['rows'], rows)) if len(rows) else live_row['rows']
+
+                if oldest_time == None:
+                    rows = rows[:0]
+                else:
+                    rows = rows[_window(rows[:, 0], oldest_time, before, None)]
+                selected_series.append({'group':series['group'], 'name':series['name'], 'columns':columns or ['time', 'value'], 'rows':rows})
+
+        if kind == 'indicators':
+            selected_candles = None
+
+        cursor_data = {'market':market, 'cursor':cursor, 'before':int(oldest_time) if more_before else None}
+
+        if encoding == 'binary':
+            return(_encode_binary(cursor_data, selected_candles, selected_series))
+        return(_encode_json(cursor_data, selected_candles, selected_series))
+
+
+def _window(times, since, before, limit):
+    ''' Indexes of the newest first rows with since <= time < before (the newest limit rows). '''
+    mask = np.ones(len(times), dtype=bool)
+    if since != None:
+        mask &= times >= since
+    if before != None:
+        mask &= times < before
+    index = np.flatnonzero(mask)
+    return(index if limit == None else index[:limit])
+
+
+def _to_series(group, name, entries, columns=None):
+    ''' Pack [time, value] entries into rows of time plus one column per value (dict values give a column per key). '''
+    if entries and isinstance(entries[0][1], dict):
+        columns = ['time']+list(entries[0][1])
+        rows = [[entry[0]]+[entry[1][key] for key in columns[1:]] for entry in entries]
+    else:
+        columns = columns or (['time', 'value'] if entries else None)
+        rows = [[entry[0], entry[1]] for entry in entries]
+    return({'group':group, 'name':name, 'columns':columns, 'rows':np.array(rows, dtype=np.float64).reshape(-1, len(columns or [0, 0]))})
+
+
+def _encode_json(cursor_data, candles, series):
+    ''' Encode in the json layout the chart endpoints have always used (newest first [time, ...] lists). '''
+    chart_data = dict(cursor_data)
+
+    if candles is not None:
+        chart_data.update({'candles':[[int(row[0])]+row[1:] for row in candles.tolist()]})
+
+    if series:
+        indicators = {}
+        for entry in series:
+            columns = entry['columns']
+            if len(columns) == 2:
+                values = [[int(row[0]), row[1]] for row in entry['rows'].tolist()]
+            else:
+                values = [[int(row[0]), dict(zip(columns[1:], row[1:]))] for row in entry['rows'].tolist()]
+
+            if entry['name'] == None:
+                indicators.update({entry['group']:values})
+            else:
+                indicators.setdefault(entry['group'], {}).update({entry['name']:values})
+        chart_data.update({'indicators':indicators})
+
+    return(json.dumps({'call':True, 'data':chart_data}))
+
+
+def _encode_binary(cursor_data, candles, series):
+    '''
+    Encode as BINARY_MAGIC, a uint32 header length, the JSON header (padded so the arrays are 8 byte aligned)
+    then each series as row major little endian float64 values in the order given in the header.
+    '''
+    arrays = []
+    header = dict(cursor_data)
+    header.update({'series':[]})
+
+    if candles is not None:
+        header['series'].append({'group':'candles', 'name':None, 'columns':candle_store.CANDLE_FIELDS, 'rows':len(candles)})
+        arrays.append(candles)
+
+    for entry in series:
+        header['series'].append({'group':entry['group'], 'name':entry['name'], 'columns':entry['columns'], 'rows':len(entry['rows'])})
+        arrays.append(entry['rows'])
+
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' '*(-(len(BINARY_MAGIC)+4+len(header_bytes)) % 8)
+
+    body = [BINARY_MAGIC, struct.pack('<I', len(header_bytes)), header_bytes]
+    body.extend([np.ascontiguousarray(array, dtype='<f8').tobytes() for array in arrays])
+    return(b''.join(body))
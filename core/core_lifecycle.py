@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+import time
+import logging
+import threading
+
+## Allowed state transitions for the core.
+CORE_TRANSITIONS = {
+    'READY':['SETUP', 'STOP'],
+    'SETUP':['RUN', 'STOP'],
+    'RUN':['STOP'],
+    'STOP':[]
+}
+
+## Max time given for all managed threads to finish when stopping (in seconds).
+STOP_TIMEOUT = 10
+
+
+class CoreLifecycle(object):
+    '''
+    Event driven state holder for the core.
+    -> Threads block on state changes rather than polling the state.
+    -> Managed threads use wait() in place of time.sleep() so they wake instantly on stop.
+    -> join() waits for all managed threads with a bounded total timeout.
+    '''
+    def __init__(self):
+        self.state      = 'READY'
+        self.condition  = threading.Condition()
+        self.stop_event = threading.Event()
+        self.threads    = []
+
+
+    def set_state(self, new_state):
+        ''' Move the core to a new state, invalid transitions are ignored and return False. '''
+        with self.condition:
+            if not(new_state in CORE_TRANSITIONS[self.state]):
+                logging.warning('[CoreLifecycle] Invalid state transition {0} -> {1}.'.format(self.state, new_state))
+                return(False)
+
+            logging.debug('[CoreLifecycle] State transition {0} -> {1}.'.format(self.state, new_state))
+            self.state = new_state
+            if new_state == 'STOP':
+                self.stop_event.set()
+            self.condition.notify_all()
+        return(True)
+
+
+    def wait_for_state(self, state, timeout=None):
+        ''' Block until the core reaches the state (or STOP), returns True if the state was reached. '''
+        with self.condition:
+            self.condition.wait_for(lambda: self.state in [state, 'STOP'], timeout)
+            return(self.state == state)
+
+
+    def wait(self, timeout):
+        ''' Interruptible sleep, returns True if the core is stopping. '''
+        return(self.stop_event.wait(timeout))
+
+
+    def is_stopping(self):
+        return(self.stop_event.is_set())
+
+
+    def start_thread(self, name, target):
+        ''' Start a thread that will be joined when the core stops (threads that have finished are let go). '''
+        thread = threading.Thread(target=target, name=name)
+        thread.start()
+        self.threads = [managed for managed in self.threads if managed.is_alive()]+[thread]
+        return(thread)
+
+
+    def join(self, timeout=STOP_TIMEOUT):
+        ''' Join all managed threads sharing a single deadline, returns the names of any still alive. '''
+        deadline = time.time()+timeout
+        for thread in self.threads:
+            thread.join(max(0, deadline-time.time()))
+
+        alive = [thread.name for thread in self.threads if thread.is_alive()]
+        if alive:
+            logging.warning('[CoreLifecycle] Threads still running after stop: {0}'.format(', '.join(alive)))
+        return(alive)
@@ -0,0 +1,282 @@
+#! /usr/bin/env python3
+import time
+import logging
+import threading
+
+## Min interval used between checks of the live market data not pushed by its socket (in seconds).
+POLL_INTERVAL = 0.05
+
+## Max share of its time the watcher spends checking, the interval grows with the time a check of every market takes.
+WATCH_DUTY = 0.1
+
+## Max time a waiting trader is left idle before being woken regardless of data (in seconds).
+HEARTBEAT_INTERVAL = 5
+
+
+class DataNotifier(object):
+    '''
+    Wakes traders when their market data changes.
+    -> Sockets that can report their own updates (the local order book depth stream) call push() as each one
+        is applied so the market is woken straight away.
+    -> The binance_api candle/depth streams and the order/wallet socket buffer have no update hook, a single
+        watcher thread polls those for changes (its interval grows with the number of markets checked).
+    '''
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        # Initilize the notifier used to wake traders when their market data changes.
+        logging.info('[DataNotifier] Initilizing the data notifier object.')
+
+        self.poll_interval  = poll_interval
+        self.markets        = {}
+        self.running        = False
+        self.watch_thread   = None
+        self.sweep_callback = None
+
+        ## Counters used for monitoring (wakeups pushed by a socket or seen by the watcher, the last watcher check).
+        self.pushed         = 0
+        self.polled         = 0
+        self.check_time     = 0.0
+        self.watch_interval = poll_interval
+
+        ## Changed markets waiting for the sweep thread (merged while a sweep is running).
+        self.sweep_thread   = None
+        self.sweep_pending  = {}
+        self.sweep_condition= threading.Condition()
+
+
+    def register(self, symbol, candle_endpoint, depth_endpoint, buffer_endpoint=None, depth_pushed=False):
+        '''
+        Register a market to be watched.
+        -> candle_endpoint/depth_endpoint are called with the symbol and return the live data.
+        -> buffer_endpoint (optional) returns the socket buffer used for order/wallet updates.
+        -> depth_pushed is set when depth changes are passed to push(), the watcher then only checks depth is there.
+        '''
+        self.markets.update({symbol:{
+            'candle_endpoint':candle_endpoint,
+            'depth_endpoint':depth_endpoint,
+            'buffer_endpoint':buffer_endpoint,
+            'depth_pushed':depth_pushed,
+            'event':threading.Event(),
+            'ready':threading.Event(),
+            'callback':None,
+            'fingerprint':None,
+            'changed_at':0.0,
+            'last_called':0.0,
+            'wakeups':0}})
+
+
+    def set_callback(self, symbol, callback):
+        '''
+        Set a callback to be called with the change time when the markets data changes.
+        Markets with a callback are also called every HEARTBEAT_INTERVAL with None if no data is seen.
+        '''
+        if symbol in self.markets:
+            self.markets[symbol]['callback'] = callback
+
+
+    def set_sweep_callback(self, callback):
+        '''
+        Set a callback called with the list of changed symbols, before the market callbacks.
+        -> It is run on its own thread so a slow sweep never holds up change detection, the markets changed
+            are only woken once the sweep that covers them is done.
+        '''
+        self.sweep_callback = callback
+
+
+    def unregister(self, symbol):
+        ''' Stop watching a market, any waiting trader is released. '''
+        if symbol in self.markets:
+            self.markets.pop(symbol)['event'].set()
+
+
+    def start(self):
+        ''' Start the watcher thread. '''
+        if self.running:
+            return
+        logging.info('[DataNotifier] Starting data watcher for {0} markets.'.format(len(self.markets)))
+        self.running = True
+        if self.sweep_callback:
+            self.sweep_thread = threading.Thread(target=self._sweeper, name='DataSweeper')
+            self.sweep_thread.start()
+
+        self.watch_thread = threading.Thread(target=self._watcher)
+        self.watch_thread.start()
+
+
+    def stop(self):
+        ''' Stop the watcher thread and release all waiting traders. '''
+        self.running = False
+        with self.sweep_condition:
+            self.sweep_condition.notify()
+        for market in list(self.markets.values()):
+            market['event'].set()
+
+        if self.watch_thread:
+            self.watch_thread.join()
+        if self.sweep_thread:
+            self.sweep_thread.join()
+
+
+    def wait(self, symbol, timeout=HEARTBEAT_INTERVAL):
+        '''
+        Block until the market data for the symbol changes or the timeout is reached.
+        Returns the time the change was seen or None if woken by the timeout.
+        '''
+        market = self.markets.get(symbol)
+        if market == None:
+            time.sleep(timeout)
+            return(None)
+
+        if not market['event'].wait(timeout):
+            return(None)
+
+        market['event'].clear()
+        return(market['changed_at'])
+
+
+    def notify(self, symbol):
+        ''' Wake the market as if its data had changed (used when something other than market data needs handling). '''
+        market = self.markets.get(symbol)
+        if market == None:
+            return
+
+        market['changed_at'] = time.time()
+        market['event'].set()
+        if market['callback']:
+            market['last_called'] = market['changed_at']
+            market['callback'](market['changed_at'])
+
+
+    def push(self, symbol):
+        ''' Wake a market whose socket has just applied an update (called from the socket thread). '''
+        market = self.markets.get(symbol)
+
+        ## Markets are made ready by the watcher once both their candles and depth are held.
+        if market == None or not(market['ready'].is_set()):
+            return
+
+        market['changed_at'] = time.time()
+        market['wakeups'] += 1
+        self.pushed += 1
+        if self.sweep_thread:
+            with self.sweep_condition:
+                self.sweep_pending.update({symbol:market})
+                self.sweep_condition.notify()
+        else:
+            self._wake([(symbol, market)])
+
+
+    def wait_ready(self, symbol, timeout=None):
+        ''' Block until the market has both candle and depth data, returns True if ready. '''
+        market = self.markets.get(symbol)
+        if market == None:
+            return(False)
+        return(market['ready'].wait(timeout))
+
+
+    def is_ready(self, symbol):
+        return(symbol in self.markets and self.markets[symbol]['ready'].is_set())
+
+
+    def get_stats(self):
+        ''' Return the number of data wakeups seen for each market. '''
+        return({symbol:market['wakeups'] for symbol, market in list(self.markets.items())})
+
+
+    def get_watch_stats(self):
+        ''' Return the pushed/polled wakeup counts and the time the last watcher check took/the interval it set (in seconds). '''
+        return({
+            'markets':len(self.markets),
+            'pushed_wakeups':self.pushed,
+            'polled_wakeups':self.polled,
+            'check_time':self.check_time,
+            'poll_interval':self.watch_interval})
+
+
+    def _watcher(self):
+        ''' Single thread responsible for checking all markets for changes to their live data (the poll interval scales with the check time). '''
+        while self.running:
+            check_start = time.perf_counter()
+            changed_markets = []
+
+            for symbol, market in list(self.markets.items()):
+                fingerprint = self._fingerprint(symbol, market)
+
+                if fingerprint == None or fingerprint == market['fingerprint']:
+                    ## Keep callback markets ticking over even when no data is seen.
+                    if market['callback'] and (time.time()-market['last_called']) > HEARTBEAT_INTERVAL:
+                        market['last_called'] = time.time()
+                        market['callback'](None)
+                    continue
+
+                market['fingerprint'] = fingerprint
+                market['changed_at'] = time.time()
+                market['wakeups'] += 1
+                market['ready'].set()
+                changed_markets.append((symbol, market))
+            self.polled += len(changed_markets)
+
+            if changed_markets:
+                if self.sweep_thread:
+                    with self.sweep_condition:
+                        self.sweep_pending.update(changed_markets)
+                        self.sweep_condition.notify()
+                else:
+                    self._wake(changed_markets)
+
+            ## With many markets a check costs more so the watcher waits longer (bounding its CPU use).
+            self.check_time = time.perf_counter()-check_start
+            self.watch_interval = max(self.poll_interval, self.check_time*(1-WATCH_DUTY)/WATCH_DUTY)
+            time.sleep(self.watch_interval)
+
+
+    def _sweeper(self):
+        ''' Run the sweep callback over the markets changed since the last sweep then wake them. '''
+        while True:
+            with self.sweep_condition:
+                while self.running and not(self.sweep_pending):
+                    self.sweep_condition.wait()
+                if not(self.running):
+                    break
+                changed_markets = list(self.sweep_pending.items())
+                self.sweep_pending = {}
+
+            try:
+                self.sweep_callback([symbol for symbol, market in changed_markets])
+            except Exception as error:
+                logging.exception('[DataNotifier] Sweep callback failed: {0}'.format(error))
+            self._wake(changed_markets)
+
+
+    def _wake(self, changed_markets):
+        for symbol, market in changed_markets:
+            market['event'].set()
+            if market['callback']:
+                market['last_called'] = market['changed_at']
+                market['callback'](market['changed_at'])
+
+
+    def _fingerprint(self, symbol, market):
+        ''' Build a small comparable summary of the markets live data (live candle, top of book, socket events). '''
+        try:
+            candles = market['candle_endpoint'](symbol)
+            books_data = market['depth_endpoint'](symbol)
+
+            if not(candles) or not(books_data) or not('a' in books_data):
+                return(None)
+
+            ## Pushed depth changes wake the market themselves so only the candle is compared.
+            if market['depth_pushed']:
+                fingerprint = [tuple(candles[0][:6])]
+            else:
+                fingerprint = [tuple(candles[0][:6]), tuple(books_data['a'][0]), tuple(books_data['b'][0])]
+        except (KeyError, IndexError, TypeError):
+            return(None)
+
+        if market['buffer_endpoint']:
+            socket_buffer = market['buffer_endpoint']()
+            if symbol in socket_buffer and 'executionReport' in socket_buffer[symbol]:
+                fingerprint.append(socket_buffer[symbol]['executionReport'].get('E'))
+            if 'outboundAccountPosition' in socket_buffer:
+                fingerprint.append(socket_buffer['outboundAccountPosition'].get('E'))
+
+        return(fingerprint)
@@ -0,0 +1,649 @@
+#! /usr/bin/env python3
+import sys
+import json
+import time
+import base64
+import random
+import struct
+import hashlib
+import logging
+import threading
+import socketserver
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import latency_stats
+
+## Default ports the REST and websocket servers listen on.
+REST_PORT = 9000
+SOCKET_PORT = 9001
+
+## Default time between depth updates and kline updates for each market (in seconds).
+DEPTH_INTERVAL = 0.1
+KLINE_INTERVAL = 1
+
+## Number of price levels held on each side of the simulated books.
+BOOK_LEVELS = 20
+
+## Quote balance every simulated account starts with.
+START_BALANCE = 100.0
+
+## Binance hosts that are redirected to the simulator by point_binance_api.
+BINANCE_REST_HOSTS = ['https://api.binance.com', 'https://api1.binance.com', 'https://api2.binance.com', 'https://api3.binance.com']
+BINANCE_SOCKET_HOSTS = ['wss://stream.binance.com:9443', 'wss://stream.binance.com']
+
+INTERVAL_MS = {'1m':60000, '3m':180000, '5m':300000, '15m':900000, '30m':1800000, '1h':3600000, '2h':7200000,
+    '4h':14400000, '6h':21600000, '8h':28800000, '12h':43200000, '1d':86400000, '3d':259200000}
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class SimMarket(object):
+    ''' Random walk market with a synthetic order book, seeded so every run is the same. '''
+    def __init__(self, quote_asset, base_asset, price, seed):
+        self.quote_asset = quote_asset
+        self.base_asset = base_asset
+        self.symbol = base_asset+quote_asset
+        self.rand = random.Random(seed)
+        self.price = price
+        self.tick = price/10000
+        self.update_id = 1
+        self.kline = None
+        self.bids = []
+        self.asks = []
+        self._build_book()
+        self.bid_changes = self.bids
+        self.ask_changes = self.asks
+
+
+    def step(self):
+        ''' Move the price and rebuild the book, returns the event time (in ms). '''
+        self.price *= 1+self.rand.gauss(0, 0.0005)
+        self.update_id += 1
+        old_bids, old_asks = self.bids, self.asks
+        self._build_book()
+        self.bid_changes = self._book_changes(old_bids, self.bids)
+        self.ask_changes = self._book_changes(old_asks, self.asks)
+        return(int(time.time()*1000))
+
+
+    def get_kline(self, interval, event_time):
+        ''' Update the live kline for the interval with the current price. '''
+        interval_ms = INTERVAL_MS.get(interval, 60000)
+        open_time = event_time-(event_time % interval_ms)
+
+        if self.kline == None or self.kline['t'] != open_time:
+            self.kline = {'t':open_time, 'T':open_time+interval_ms-1, 'i':interval, 'o':self.price, 'h':self.price, 'l':self.price, 'c':self.price, 'v':0.0, 'x':False}
+        self.kline['h'] = max(self.kline['h'], self.price)
+        self.kline['l'] = min(self.kline['l'], self.price)
+        self.kline['c'] = self.price
+        self.kline['v'] += self.rand.random()
+        return(self.kline)
+
+
+    def get_history(self, interval, limit, end_time):
+        ''' Build limit closed klines (oldest first, Binance REST format) walking back from the current price. '''
+        interval_ms = INTERVAL_MS.get(interval, 60000)
+        open_time = end_time-(end_time % interval_ms)
+        rand = random.Random(self.symbol)
+        close = self.price
+        klines = []
+
+        for i in range(limit):
+            open_price = close*(1+rand.gauss(0, 0.002))
+            high = max(open_price, close)*(1+abs(rand.gauss(0, 0.001)))
+            low = min(open_price, close)*(1-abs(rand.gauss(0, 0.001)))
+            volume = rand.random()*100
+            klines.append([open_time, _fmt(open_price), _fmt(high), _fmt(low), _fmt(close), _fmt(volume), open_time+interval_ms-1, _fmt(volume*close), 1, '0', '0', '0'])
+            open_time -= interval_ms
+            close = open_price
+
+        return(klines[::-1])
+
+
+    def _book_changes(self, old_levels, new_levels):
+        ''' Levels changed by the last step in the diff depth format (removed levels have a quantity of 0). '''
+        new_prices = set(_fmt(price) for price, quantity in new_levels)
+        return(new_levels+[[price, 0.0] for price, quantity in old_levels if not(_fmt(price) in new_prices)])
+
+
+    def _build_book(self):
+        spread = self.tick*2
+        self.bids = [[self.price-spread-(self.tick*i), self.rand.random()*10] for i in range(BOOK_LEVELS)]
+        self.asks = [[self.price+spread+(self.tick*i), self.rand.random()*10] for i in range(BOOK_LEVELS)]
+
+
+class SimExchange(object):
+    '''
+    In process stand in for the Binance exchange used for load and latency testing.
+    -> Markets are given as QUOTE-BASE pairs and are random walks seeded by their position (runs are repeatable).
+    -> MARKET orders fill against the top of the book, LIMIT orders fill once the book crosses their price.
+    -> Fills are pushed to the user data stream as executionReport/outboundAccountPosition events.
+    -> tick_to_order records the time from the last market event a trader could have seen to its order arriving.
+    '''
+    def __init__(self, markets, seed=0):
+        self.markets = {}
+        for index, market in enumerate(markets):
+            quote_asset, base_asset = market.split('-')
+            sim_market = SimMarket(quote_asset, base_asset, random.Random(seed+index).uniform(0.001, 0.1), seed+index)
+            self.markets.update({sim_market.symbol:sim_market})
+
+        self.lock = threading.Lock()
+        self.balances = {}
+        self.orders = {}
+        self.order_id = 0
+        self.user_streams = []
+        self.last_event_time = {}
+        self.tick_to_order = latency_stats.LatencyHistogram()
+        self.events_sent = 0
+
+
+    def get_exchange_info(self):
+        symbols = []
+        for sim_market in self.markets.values():
+            symbols.append({
+                'symbol':sim_market.symbol,
+                'status':'TRADING',
+                'baseAsset':sim_market.base_asset,
+                'quoteAsset':sim_market.quote_asset,
+                'isSpotTradingAllowed':True,
+                'isMarginTradingAllowed':True,
+                'filters':[
+                    {'filterType':'PRICE_FILTER', 'tickSize':'0.00000001'},
+                    {'filterType':'PERCENT_PRICE'},
+                    {'filterType':'LOT_SIZE', 'minQty':'0.00100000'},
+                    {'filterType':'MIN_NOTIONAL', 'minNotional':'0.00010000'}]})
+        return({'timezone':'UTC', 'serverTime':int(time.time()*1000), 'symbols':symbols})
+
+
+    def get_account(self):
+        with self.lock:
+            balances = [{'asset':asset, 'free':_fmt(free), 'locked':_fmt(locked)} for asset, (free, locked) in self._get_balances().items()]
+        return({'balances':balances, 'userAssets':balances})
+
+
+    def place_order(self, params):
+        received_time = time.time()*1000
+        sim_market = self.markets.get(params.get('symbol'))
+        if sim_market == None:
+            return({'code':-1121, 'msg':'Invalid symbol.'})
+
+        last_event_time = self.last_event_time.get(sim_market.symbol)
+        if last_event_time:
+            self.tick_to_order.record(max(received_time-last_event_time, 0)/1000)
+
+        with self.lock:
+            self.order_id += 1
+            order = {
+                'symbol':sim_market.symbol,
+                'orderId':self.order_id,
+                'clientOrderId':'sim{0}'.format(self.order_id),
+                'transactTime':int(received_time),
+                'price':params.get('price', '0.00000000'),
+                'origQty':params.get('quantity', '0'),
+                'executedQty':'0.00000000',
+                'status':'NEW',
+                'timeInForce':params.get('timeInForce', 'GTC'),
+                'type':params.get('type', 'LIMIT'),
+                'side':params.get('side', 'BUY'),
+                'fills':[]}
+
+            if order['type'] == 'MARKET':
+                fill_price = sim_market.asks[0][0] if order['side'] == 'BUY' else sim_market.bids[0][0]
+                order['price'] = '0.00000000'
+                self._fill(sim_market, order, fill_price)
+            else:
+                self.orders.update({order['orderId']:order})
+                self._send_execution(order, 'NEW', 0.0, 0.0)
+        return(dict(order))
+
+
+    def cancel_order(self, params):
+        with self.lock:
+            order = None
+            if 'orderId' in params:
+                order = self.orders.pop(int(params['orderId']), None)
+            else:
+                for order_id, open_order in list(self.orders.items()):
+                    if open_order['symbol'] == params.get('symbol'):
+                        order = self.orders.pop(order_id)
+                        break
+
+            if order == None:
+                return({'code':-2011, 'msg':'Unknown order sent.'})
+
+            order['status'] = 'CANCELED'
+            self._send_execution(order, 'CANCELED', 0.0, 0.0)
+        return(dict(order))
+
+
+    def step_market(self, sim_market):
+        ''' Move a market on by one depth update and fill any crossed orders. '''
+        event_time = sim_market.step()
+        self.last_event_time.update({sim_market.symbol:event_time})
+
+        with self.lock:
+            for order_id, order in list(self.orders.items()):
+                if order['symbol'] != sim_market.symbol:
+                    continue
+                price = float(order['price'])
+                if (order['side'] == 'BUY' and sim_market.asks[0][0] <= price) or (order['side'] == 'SELL' and sim_market.bids[0][0] >= price):
+                    del self.orders[order_id]
+                    self._fill(sim_market, order, price)
+        return(event_time)
+
+
+    def get_stats(self):
+        return({
+            'markets':len(self.markets),
+            'open_orders':len(self.orders),
+            'orders_placed':self.order_id,
+            'events_sent':self.events_sent,
+            'tick_to_order':self.tick_to_order.get_stats()})
+
+
+    def _fill(self, sim_market, order, price):
+        quantity = float(order['origQty'])
+        order['status'] = 'FILLED'
+        order['executedQty'] = order['origQty']
+        order['fills'] = [{'price':_fmt(price), 'qty':order['origQty'], 'commission':'0.00000000', 'commissionAsset':'BNB'}]
+
+        balances = self._get_balances()
+        base = balances.setdefault(sim_market.base_asset, [0.0, 0.0])
+        quote = balances.setdefault(sim_market.quote_asset, [START_BALANCE, 0.0])
+        direction = 1 if order['side'] == 'BUY' else -1
+        base[0] += quantity*direction
+        quote[0] -= quantity*price*direction
+
+        self._send_execution(order, 'FILLED', quantity, price)
+        self._send_user_event({'e':'outboundAccountPosition', 'E':int(time.time()*1000), 'u':int(time.time()*1000),
+            'B':[{'a':asset, 'f':_fmt(free), 'l':_fmt(locked)} for asset, (free, locked) in balances.items()]})
+
+
+    def _get_balances(self):
+        if not(self.balances):
+            self.balances.update({'BTC':[START_BALANCE, 0.0], 'BNB':[START_BALANCE, 0.0]})
+        return(self.balances)
+
+
+    def _send_execution(self, order, status, last_quantity, last_price):
+        event_time = int(time.time()*1000)
+        self._send_user_event({
+            'e':'executionReport', 'E':event_time, 's':order['symbol'], 'c':order['clientOrderId'], 'S':order['side'],
+            'o':order['type'], 'f':order['timeInForce'], 'q':order['origQty'], 'p':order['price'], 'x':'TRADE' if last_quantity else status,
+            'X':status, 'i':order['orderId'], 'l':_fmt(last_quantity), 'z':order['executedQty'], 'L':_fmt(last_price),
+            'n':'0', 'N':'BNB', 'T':event_time})
+
+
+    def _send_user_event(self, event):
+        for client in list(self.user_streams):
+            client.send_json(event)
+
+
+class SimRESTHandler(BaseHTTPRequestHandler):
+    ''' Binance style REST endpoints served from the SimExchange (signatures/keys are not checked). '''
+    exchange = None
+
+    def do_GET(self):
+        self._route('GET')
+
+
+    def do_POST(self):
+        self._route('POST')
+
+
+    def do_PUT(self):
+        self._route('PUT')
+
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+
+    def log_message(self, format, *args):
+        logging.debug('[SimREST] '+format%args)
+
+
+    def _route(self, method):
+        parsed = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(parsed.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update(dict(urllib.parse.parse_qsl(self.rfile.read(length).decode())))
+
+        exchange = self.exchange
+        path = parsed.path
+
+        if path.endswith('/ping'):
+            body = {}
+        elif path.endswith('/time'):
+            body = {'serverTime':int(time.time()*1000)}
+        elif path.endswith('/exchangeInfo'):
+            body = exchange.get_exchange_info()
+        elif path.endswith('/account'):
+            body = exchange.get_account()
+        elif path.endswith('/klines'):
+            sim_market = exchange.markets.get(params.get('symbol'))
+            if sim_market == None:
+                return(self._send({'code':-1121, 'msg':'Invalid symbol.'}, 400))
+            body = sim_market.get_history(params.get('interval', '1m'), min(int(params.get('limit', 500)), 1000), int(time.time()*1000))
+        elif path.endswith('/depth'):
+            sim_market = exchange.markets.get(params.get('symbol'))
+            if sim_market == None:
+                return(self._send({'code':-1121, 'msg':'Invalid symbol.'}, 400))
+            limit = int(params.get('limit', BOOK_LEVELS))
+            body = {'lastUpdateId':sim_market.update_id, 'bids':_fmt_book(sim_market.bids[:limit]), 'asks':_fmt_book(sim_market.asks[:limit])}
+        elif path.endswith('/userDataStream'):
+            body = {'listenKey':'simListenKey'} if method == 'POST' else {}
+        elif path.endswith('/order') or path.endswith('/orderList') or path.endswith('/order/oco'):
+            if method == 'POST':
+                body = exchange.place_order(params)
+            elif method == 'DELETE':
+                body = exchange.cancel_order(params)
+            else:
+                body = exchange.orders.get(int(params.get('orderId', 0)), {'code':-2013, 'msg':'Order does not exist.'})
+        elif path.endswith('/margin/loan') or path.endswith('/margin/repay'):
+            body = {'tranId':int(time.time()*1000)}
+        elif path.endswith('/simulator/stats'):
+            body = exchange.get_stats()
+        else:
+            return(self._send({'code':-1000, 'msg':'Unknown endpoint {0}.'.format(path)}, 404))
+
+        self._send(body, 400 if isinstance(body, dict) and 'code' in body else 200)
+
+
+    def _send(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class SimSocketHandler(socketserver.BaseRequestHandler):
+    '''
+    Minimal RFC 6455 websocket endpoint.
+    -> /ws/<stream>/<stream> and /stream?streams=<stream>/<stream> (combined {'stream', 'data'} messages) are served.
+    -> SUBSCRIBE/UNSUBSCRIBE requests are accepted, a path or stream matching the listen key gets the user data events.
+    '''
+    server_ref = None
+
+    def setup(self):
+        self.send_lock = threading.Lock()
+        self.streams = set()
+        self.combined = False
+        self.open = False
+
+
+    def handle(self):
+        request = b''
+        while not(b'\r\n\r\n' in request):
+            data = self.request.recv(4096)
+            if not(data):
+                return
+            request += data
+
+        lines = request.decode(errors='ignore').split('\r\n')
+        path = lines[0].split(' ')[1]
+        headers = {line.split(':', 1)[0].strip().lower():line.split(':', 1)[1].strip() for line in lines[1:] if ':' in line}
+        accept = base64.b64encode(hashlib.sha1((headers.get('sec-websocket-key', '')+WEBSOCKET_GUID).encode()).digest()).decode()
+        self.request.sendall('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {0}\r\n\r\n'.format(accept).encode())
+
+        parsed = urllib.parse.urlparse(path)
+        if parsed.path.startswith('/stream'):
+            self.combined = True
+            streams = dict(urllib.parse.parse_qsl(parsed.query)).get('streams', '')
+        else:
+            streams = parsed.path[len('/ws/'):] if parsed.path.startswith('/ws/') else ''
+        self._subscribe([stream for stream in streams.split('/') if stream])
+
+        self.open = True
+        self.server_ref.add_client(self)
+        try:
+            self._read_frames()
+        finally:
+            self.open = False
+            self.server_ref.remove_client(self)
+
+
+    def send_json(self, message, stream=None):
+        if not(self.open):
+            return
+        if self.combined and stream:
+            message = {'stream':stream, 'data':message}
+        self._send_frame(0x1, json.dumps(message).encode())
+
+
+    def _subscribe(self, streams):
+        for stream in streams:
+            if stream == 'simListenKey':
+                self.server_ref.exchange.user_streams.append(self)
+            else:
+                self.streams.add(stream.lower())
+
+
+    def _read_frames(self):
+        while True:
+            header = self._recv_exact(2)
+            if header == None:
+                return
+            opcode = header[0] & 0x0f
+            length = header[1] & 0x7f
+            if length == 126:
+                length = struct.unpack('>H', self._recv_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack('>Q', self._recv_exact(8))[0]
+            mask = self._recv_exact(4) if header[1] & 0x80 else b'\x00'*4
+            payload = bytearray(self._recv_exact(length) or b'')
+            for i in range(len(payload)):
+                payload[i] ^= mask[i % 4]
+
+            if opcode == 0x8:
+                self._send_frame(0x8, b'')
+                return
+            elif opcode == 0x9:
+                self._send_frame(0xA, bytes(payload))
+            elif opcode == 0x1:
+                try:
+                    request = json.loads(payload.decode())
+                except ValueError:
+                    continue
+                if request.get('method') == 'SUBSCRIBE':
+                    self._subscribe(request.get('params', []))
+                elif request.get('method') == 'UNSUBSCRIBE':
+                    self.streams -= set(stream.lower() for stream in request.get('params', []))
+                self._send_frame(0x1, json.dumps({'result':None, 'id':request.get('id')}).encode())
+
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size-len(data))
+            if not(chunk):
+                return(None)
+            data += chunk
+        return(data)
+
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+
+        try:
+            with self.send_lock:
+                self.request.sendall(header+payload)
+        except OSError:
+            self.open = False
+
+
+class ThreadingSocketServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ExchangeSimulator(object):
+    '''
+    Serves a SimExchange over Binance style REST and websocket endpoints.
+    -> Every market gets a depth update every depth_interval and a kline update every kline_interval.
+    '''
+    def __init__(self, markets, host='127.0.0.1', rest_port=REST_PORT, socket_port=SOCKET_PORT, depth_interval=DEPTH_INTERVAL, kline_interval=KLINE_INTERVAL, seed=0):
+        logging.info('[ExchangeSimulator] Initilizing simulator for {0} markets.'.format(len(markets)))
+
+        self.exchange       = SimExchange(markets, seed)
+        self.host           = host
+        self.rest_port      = rest_port
+        self.socket_port    = socket_port
+        self.depth_interval = depth_interval
+        self.kline_interval = kline_interval
+        self.clients        = []
+        self.clients_lock   = threading.Lock()
+        self.running        = False
+        self.threads        = []
+
+        rest_handler = type('RESTHandler', (SimRESTHandler,), {'exchange':self.exchange})
+        socket_handler = type('SocketHandler', (SimSocketHandler,), {'server_ref':self})
+        self.rest_server = ThreadingHTTPServer((host, rest_port), rest_handler)
+        self.socket_server = ThreadingSocketServer((host, socket_port), socket_handler)
+
+
+    @property
+    def rest_url(self):
+        return('http://{0}:{1}'.format(self.host, self.rest_port))
+
+
+    @property
+    def socket_url(self):
+        return('ws://{0}:{1}'.format(self.host, self.socket_port))
+
+
+    def start(self):
+        self.running = True
+        for name, target in (('SimREST', self.rest_server.serve_forever), ('SimSocket', self.socket_server.serve_forever), ('SimMarkets', self._market_feed)):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logging.info('[ExchangeSimulator] Serving REST on {0} and websockets on {1}.'.format(self.rest_url, self.socket_url))
+
+
+    def stop(self):
+        self.running = False
+        self.rest_server.shutdown()
+        self.socket_server.shutdown()
+        self.rest_server.server_close()
+        self.socket_server.server_close()
+
+
+    def add_client(self, client):
+        with self.clients_lock:
+            self.clients.append(client)
+
+
+    def remove_client(self, client):
+        with self.clients_lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        if client in self.exchange.user_streams:
+            self.exchange.user_streams.remove(client)
+
+
+    def _market_feed(self):
+        ''' Push depth/kline updates for every market at the configured rates. '''
+        next_depth = time.time()
+        next_kline = time.time()
+
+        while self.running:
+            now = time.time()
+            send_klines = now >= next_kline
+            if send_klines:
+                next_kline = now+self.kline_interval
+
+            with self.clients_lock:
+                clients = list(self.clients)
+
+            for sim_market in self.exchange.markets.values():
+                event_time = self.exchange.step_market(sim_market)
+                symbol = sim_market.symbol.lower()
+
+                for client in clients:
+                    for stream in client.streams:
+                        if not(stream.startswith(symbol+'@')):
+                            continue
+                        message = self._build_event(sim_market, stream[len(symbol)+1:], event_time, send_klines)
+                        if message != None:
+                            client.send_json(message, stream)
+                            self.exchange.events_sent += 1
+
+            next_depth += self.depth_interval
+            time.sleep(max(next_depth-time.time(), 0))
+
+
+    def _build_event(self, sim_market, stream_type, event_time, send_klines):
+        if stream_type.startswith('kline_'):
+            if not(send_klines):
+                return(None)
+            kline = dict(sim_market.get_kline(stream_type[len('kline_'):], event_time))
+            for key in ('o', 'h', 'l', 'c', 'v'):
+                kline[key] = _fmt(kline[key])
+            kline.update({'s':sim_market.symbol})
+            return({'e':'kline', 'E':event_time, 's':sim_market.symbol, 'k':kline})
+
+        elif stream_type.startswith('depth'):
+            levels = stream_type[len('depth'):].split('@')[0]
+            if levels.isdigit():
+                return({'lastUpdateId':sim_market.update_id, 'bids':_fmt_book(sim_market.bids[:int(levels)]), 'asks':_fmt_book(sim_market.asks[:int(levels)])})
+            return({'e':'depthUpdate', 'E':event_time, 's':sim_market.symbol, 'U':sim_market.update_id, 'u':sim_market.update_id,
+                'b':_fmt_book(sim_market.bid_changes), 'a':_fmt_book(sim_market.ask_changes)})
+
+        elif stream_type == 'bookticker':
+            return({'u':sim_market.update_id, 's':sim_market.symbol, 'b':_fmt(sim_market.bids[0][0]), 'B':_fmt(sim_market.bids[0][1]),
+                'a':_fmt(sim_market.asks[0][0]), 'A':_fmt(sim_market.asks[0][1])})
+        return(None)
+
+
+def point_binance_api(rest_url, socket_url, modules=None):
+    '''
+    Redirect the binance_api REST/socket callers to the simulator.
+    -> Every string attribute of the modules (and of their classes) that holds a Binance host is rewritten.
+    -> Returns the number of attributes changed, raises RuntimeError if none were found (rather than
+        carrying on against the live exchange with the configured keys).
+    '''
+    if modules == None:
+        modules = [sys.modules[name] for name in list(sys.modules) if name.startswith('binance_api')]
+
+    replacements = [(host, rest_url) for host in BINANCE_REST_HOSTS]+[(host, socket_url) for host in BINANCE_SOCKET_HOSTS]
+    changed = 0
+
+    for module in modules:
+        targets = [module]+[value for value in vars(module).values() if isinstance(value, type) and value.__module__ == module.__name__]
+        for target in targets:
+            for name, value in list(vars(target).items()):
+                if not(isinstance(value, str)):
+                    continue
+                new_value = value
+                for host, url in replacements:
+                    if new_value.startswith(host):
+                        new_value = url+new_value[len(host):]
+                        break
+                if new_value != value:
+                    setattr(target, name, new_value)
+                    changed += 1
+
+    if changed == 0:
+        raise RuntimeError('No Binance host settings found within binance_api, can not point it at the simulator.')
+
+    logging.info('[ExchangeSimulator] Redirected {0} binance_api host settings to the simulator.'.format(changed))
+    return(changed)
+
+
+def _fmt(value):
+    return('{0:.8f}'.format(value))
+
+
+def _fmt_book(levels):
+    return([[_fmt(price), _fmt(quantity)] for price, quantity in levels])
@@ -0,0 +1,151 @@
+#! /usr/bin/env python3
+import bisect
+
+## Order types the simulator handles (anything else is treated as a LIMIT order).
+MARKET_ORDER_TYPES = ['MARKET']
+STOP_ORDER_TYPES = ['STOP_LOSS_LIMIT']
+
+
+class SimOrder(object):
+    ''' A TEST order and its fill state, side is the exchange side (SHORT orders are already inverted). '''
+    def __init__(self, side, order_type, quantity, fee, price=None, stop_price=None, stop_limit_price=None):
+        self.side = side
+        self.fee = fee
+        self.order_type = order_type
+        self.quantity = quantity
+        self.price = price
+        self.stop_price = stop_price
+        self.stop_limit_price = stop_limit_price
+        self.triggered = False
+        self.filled = 0.0
+        self.notional = 0.0
+        self.fees = 0.0
+        self.status = 'NEW'
+
+        ## Quantity already taken per price level ({price:[level quantity, taken]}), reset when the level changes.
+        self.taken = {}
+
+
+    @property
+    def remaining(self):
+        return(self.quantity-self.filled)
+
+
+    @property
+    def average_price(self):
+        return((self.notional/self.filled) if self.filled else 0.0)
+
+
+    @property
+    def effective_price(self):
+        ''' Average fill price with the fee applied (paid more on buys, received less on sells). '''
+        return(self.average_price*(1+self.fee) if self.side == 'BUY' else self.average_price*(1-self.fee))
+
+
+    def fill(self, quantity, price):
+        if quantity <= 0:
+            return
+        quantity = min(quantity, self.remaining)
+        self.filled += quantity
+        self.notional += quantity*price
+        self.fees += quantity*price*self.fee
+        self.status = 'FILLED' if self.remaining <= self.quantity*1e-9 else 'PARTIALLY_FILLED'
+
+
+class FillSimulator(object):
+    '''
+    Fills TEST orders against the order book the trader already holds.
+    -> MARKET orders walk the opposite side of the book (the rest fills at the last level if the book is too thin).
+    -> LIMIT orders rest until levels cross their price (filling only the crossing quantity, so they can
+        fill partially) or the last trade goes through their price (the rest fills at the limit price).
+    -> Quantity a resting order took from a level is not taken again until that levels quantity changes.
+    -> STOP_LOSS_LIMIT orders become LIMIT orders at their price once the last price hits the stop.
+    -> OCO_LIMIT orders rest as a LIMIT order and switch to their stop limit once the stop is hit.
+    -> The commission fee is tracked per order and applied to its effective_price.
+    '''
+    def __init__(self, fee):
+        self.fee = fee
+        self.order = None
+
+
+    def place(self, side, order_type, quantity, price=None, stop_price=None, stop_limit_price=None, books_data=None, last_price=None):
+        ''' Place an order (replacing any current one), MARKET orders are filled straight away. '''
+        self.order = SimOrder(side, order_type, quantity, self.fee, price, stop_price, stop_limit_price)
+        if order_type in MARKET_ORDER_TYPES and books_data:
+            self.check(books_data, last_price)
+        return(self.order)
+
+
+    def cancel(self):
+        if self.order and self.order.status in ['NEW', 'PARTIALLY_FILLED']:
+            self.order.status = 'CANCELED'
+        self.order = None
+
+
+    def check(self, books_data, last_price):
+        ''' Match the current order against the book/last price, returns the order (None if there is no order). '''
+        order = self.order
+        if order == None or order.status in ['FILLED', 'CANCELED'] or not(books_data):
+            return(order)
+
+        levels = books_data['a'] if order.side == 'BUY' else books_data['b']
+
+        if order.order_type in MARKET_ORDER_TYPES:
+            self._walk(order, levels, len(levels), True)
+            return(order)
+
+        limit_price = order.price
+        if order.order_type in STOP_ORDER_TYPES or order.order_type == 'OCO_LIMIT':
+            stop_price = order.stop_price if order.stop_price != None else order.price
+            if not(order.triggered) and last_price != None and stop_price != None and self._crossed(order.side, last_price, stop_price, True):
+                order.triggered = True
+            if order.triggered and order.order_type == 'OCO_LIMIT':
+                limit_price = order.stop_limit_price if order.stop_limit_price != None else stop_price
+            elif not(order.triggered) and order.order_type in STOP_ORDER_TYPES:
+                return(order)
+
+        if limit_price == None:
+            return(order)
+
+        ## Levels are best first (asks rising, bids falling), bisect the prices (negated for bids) to find those that cross the limit.
+        if order.side == 'BUY':
+            crossing = bisect.bisect_right([float(level[0]) for level in levels], limit_price)
+        else:
+            crossing = bisect.bisect_right([-float(level[0]) for level in levels], -limit_price)
+        self._walk(order, levels, crossing, False)
+
+        if order.status != 'FILLED' and last_price != None and self._crossed(order.side, last_price, limit_price, False):
+            order.fill(order.remaining, limit_price)
+        return(order)
+
+
+    def _walk(self, order, levels, count, fill_rest):
+        ''' Fill the remaining quantity over the first count levels, less what the order already took from each. '''
+        price = None
+        for level in levels[:count]:
+            if order.remaining <= order.quantity*1e-9:
+                return
+            price, quantity = float(level[0]), float(level[1])
+
+            taken = order.taken.get(price)
+            if taken == None or taken[0] != quantity:
+                taken = [quantity, 0.0]
+                order.taken.update({price:taken})
+
+            available = min(quantity-taken[1], order.remaining)
+            if available > 0:
+                order.fill(available, price)
+                taken[1] += available
+
+        if fill_rest and price != None:
+            order.fill(order.remaining, price)
+
+
+    def _crossed(self, side, last_price, price, is_stop):
+        '''
+        Check if the last price has gone through a limit price (buy limits below, sell limits above) or
+        reached a stop price (buy stops above, sell stops below).
+        '''
+        if is_stop:
+            return(last_price >= price if side == 'BUY' else last_price <= price)
+        return(last_price < price if side == 'BUY' else last_price > price)
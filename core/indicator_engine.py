@@ -0,0 +1,376 @@
+#! /usr/bin/env python3
+import logging
+import collections
+
+from . import candle_store
+
+## Index of the candle value used as the default source for indicators (close price).
+CLOSE_INDEX = 4
+
+## Number of rolls before a running sum is rebuilt to drop floating point drift.
+RESUM_INTERVAL = 1000
+
+## Max number of closed candle value sets held by an indicator cache.
+CACHE_MAX_ENTRIES = 64
+
+'''
+--- Incremental Indicators ---
+    Each indicator carries its own state forward so only new data is ever calculated.
+        roll(price)     = Commit a closed candle value and return the indicator value.
+        peek(price)     = Return the indicator value for the live (forming) candle without committing it.
+        reset()         = Clear all carried state.
+    Values are None until enough candles have been seen.
+'''
+
+
+class EMA(object):
+
+    def __init__(self, period):
+        self.params = (period,)
+        self.period = period
+        self.alpha = 2/(period+1)
+        self.reset()
+
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.value = None
+
+
+    def _next(self, price):
+        if self.value == None:
+            if self.count+1 < self.period:
+                return(None)
+            return((self.total+price)/self.period)
+        return((price*self.alpha)+(self.value*(1-self.alpha)))
+
+
+    def peek(self, price):
+        return(self._next(price))
+
+
+    def roll(self, price):
+        value = self._next(price)
+        if self.value == None:
+            self.count += 1
+            self.total += price
+        self.value = value
+        return(value)
+
+
+class RMA(EMA):
+
+    def __init__(self, period):
+        EMA.__init__(self, period)
+        self.alpha = 1/period
+
+
+class SMA(object):
+
+    def __init__(self, period):
+        self.params = (period,)
+        self.period = period
+        self.reset()
+
+
+    def reset(self):
+        self.window = collections.deque(maxlen=self.period)
+        self.total = 0.0
+        self.rolls = 0
+
+
+    def peek(self, price):
+        if len(self.window)+1 < self.period:
+            return(None)
+        dropped = self.window[0] if len(self.window) == self.period else 0.0
+        return((self.total+price-dropped)/self.period)
+
+
+    def roll(self, price):
+        value = self.peek(price)
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(price)
+        self.total += price
+
+        self.rolls += 1
+        if self.rolls % RESUM_INTERVAL == 0:
+            self.total = sum(self.window)
+        return(value)
+
+
+class MACD(object):
+
+    ## Keys of the dict returned for each value.
+    VALUE_KEYS = ['macd', 'signal', 'hist']
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.params = (fast, slow, signal)
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+
+    def reset(self):
+        self.fast.reset()
+        self.slow.reset()
+        self.signal.reset()
+
+
+    def peek(self, price):
+        fast = self.fast.peek(price)
+        slow = self.slow.peek(price)
+        if fast == None or slow == None:
+            return(None)
+
+        macd = fast-slow
+        signal = self.signal.peek(macd)
+        if signal == None:
+            return(None)
+        return({'macd':macd, 'signal':signal, 'hist':macd-signal})
+
+
+    def roll(self, price):
+        fast = self.fast.roll(price)
+        slow = self.slow.roll(price)
+        if fast == None or slow == None:
+            return(None)
+
+        macd = fast-slow
+        signal = self.signal.roll(macd)
+        if signal == None:
+            return(None)
+        return({'macd':macd, 'signal':signal, 'hist':macd-signal})
+
+
+class IndicatorSeries(object):
+    '''
+    Newest first sequence of [time, value] pairs for an indicator.
+    Index 0 is the live candle, closed values are kept in a bounded deque so
+    indexing the most recent values is O(1) regardless of the history length.
+    '''
+    def __init__(self, max_length=None):
+        self.history = collections.deque(maxlen=max_length)
+        self.live = None
+        self.values = SeriesValues(self)
+
+
+    def __len__(self):
+        return(len(self.history) + (0 if self.live == None else 1))
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return([self[i] for i in range(*index.indices(len(self)))])
+
+        if index < 0:
+            index += len(self)
+
+        if self.live != None:
+            if index == 0:
+                return(self.live)
+            index -= 1
+
+        if index < 0:
+            raise IndexError('series index out of range')
+        return(self.history[index])
+
+
+    def __iter__(self):
+        if self.live != None:
+            yield self.live
+        for entry in self.history:
+            yield entry
+
+
+    def to_list(self):
+        return(list(self))
+
+
+class SeriesValues(object):
+    ''' Same as the series it wraps but only returns the values (timestamps stripped). '''
+    def __init__(self, series):
+        self.series = series
+
+
+    def __len__(self):
+        return(len(self.series))
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return([entry[1] for entry in self.series[index]])
+        return(self.series[index][1])
+
+
+    def __iter__(self):
+        for entry in self.series:
+            yield entry[1]
+
+
+class IndicatorCache(object):
+    '''
+    Cache of closed candle indicator values keyed by (group, name, params, last closed candle open time).
+    -> Closed candle values never change so a key is only ever built once.
+    -> When a candle closes the entries for the previous close time are evicted (they have rolled out of date).
+    '''
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.latest_keys = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key):
+        if key in self.entries:
+            self.hits += 1
+            return(self.entries[key])
+        self.misses += 1
+        return(None)
+
+
+    def put(self, key, value):
+        base_key = key[:3]
+        old_key = self.latest_keys.get(base_key)
+
+        if old_key != None and old_key != key and old_key in self.entries:
+            del self.entries[old_key]
+            self.evictions += 1
+
+        self.entries[key] = value
+        self.latest_keys[base_key] = key
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def clear(self):
+        self.entries.clear()
+        self.latest_keys.clear()
+
+
+    def get_stats(self):
+        return({'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions, 'entries':len(self.entries)})
+
+
+class IndicatorEngine(object):
+
+    def __init__(self, max_length=None):
+        # Initilize the engine used to incrementally update indicators per market.
+        self.max_length         = max_length
+        self.entries            = []
+        self.indicators         = {}
+        self.values             = {}
+        self.last_closed_time   = None
+        self.cache              = IndicatorCache()
+
+
+    def add(self, group, indicator, name=None, source=CLOSE_INDEX):
+        '''
+        Register an indicator with the engine.
+        -> group/name define where the indicator is placed (indicators[group] or indicators[group][name]).
+        -> source is the candle index used as the input value (default is the close price).
+        '''
+        series = IndicatorSeries(self.max_length)
+
+        if name == None:
+            self.indicators.update({group:series})
+            self.values.update({group:series.values})
+        else:
+            self.indicators.setdefault(group, {}).update({name:series})
+            self.values.setdefault(group, {}).update({name:series.values})
+
+        self.entries.append([indicator, series, source, group, name])
+        self.last_closed_time = None
+
+
+    def update(self, candles):
+        '''
+        Update the indicators with newest first candles.
+        -> Roll forward any candles that have closed since the last update.
+        -> Re-calculate the live candle only.
+        '''
+        if len(candles) == 0:
+            return(self.indicators)
+
+        if self.last_closed_time == None:
+            self._initilize(candles)
+        else:
+            index = 1
+            while index < len(candles) and candles[index][0] > self.last_closed_time:
+                index += 1
+
+            if index == len(candles):
+                ## Gap is larger than the candle window so start again.
+                logging.debug('[IndicatorEngine] Candle gap seen, rebuilding indicators.')
+                self._initilize(candles)
+            else:
+                for i in range(index-1, 0, -1):
+                    self._roll(candles[i])
+
+        self._live(candles[0])
+        return(self.indicators)
+
+
+    def closed_series(self):
+        '''
+        Return (group, name, closed values) for every registered indicator (newest first [time, value] lists, the live value is left out).
+        Closed candle values are taken from the cache so they are only copied once per candle close.
+        '''
+        closed_series = []
+        for indicator, series, source, group, name in self.entries:
+            key = (group, name, indicator.params, self.last_closed_time)
+            closed = self.cache.get(key)
+
+            if closed == None:
+                closed = list(series.history)
+                self.cache.put(key, closed)
+            closed_series.append((group, name, closed))
+        return(closed_series)
+
+
+    def series_items(self):
+        ''' Return (group, name, series) for every registered indicator (name is None for ungrouped indicators). '''
+        return([(group, name, series) for indicator, series, source, group, name in self.entries])
+
+
+    def _initilize(self, candles):
+        if self.max_length == None:
+            self.max_length = len(candles)
+
+        self.cache.clear()
+        for entry in self.entries:
+            entry[0].reset()
+            entry[1].history = collections.deque(maxlen=self.max_length)
+            entry[1].live = None
+
+        self.last_closed_time = None
+        if hasattr(candles, 'chronological'):
+            ### Column stores are read a column at a time rather than building each candle.
+            columns = [candles.chronological(field).tolist() for field in candle_store.CANDLE_FIELDS]
+            for candle in list(zip(*columns))[:-1]:
+                self._roll(candle)
+        else:
+            for i in range(len(candles)-1, 0, -1):
+                self._roll(candles[i])
+
+        if self.last_closed_time == None:
+            self.last_closed_time = candles[0][0]-1
+
+
+    def _roll(self, candle):
+        for indicator, series, source, group, name in self.entries:
+            value = indicator.roll(candle[source])
+            if value != None:
+                series.history.appendleft([candle[0], value])
+        self.last_closed_time = candle[0]
+
+
+    def _live(self, candle):
+        for indicator, series, source, group, name in self.entries:
+            value = indicator.peek(candle[source])
+            series.live = None if value == None else [candle[0], value]
@@ -0,0 +1,243 @@
+#! /usr/bin/env python3
+import os
+import time
+import logging
+import threading
+import concurrent.futures
+import numpy as np
+import requests
+
+from . import candle_store
+
+## Directory (within the cache directory) the kline files are kept in.
+KLINE_DIR = 'klines'
+
+## Kline file extension (backtester.load_klines also reads these).
+KLINE_EXTENSION = '.klines'
+
+## Each record holds the candle fields as little endian float64 values (times in ms are exact as float64).
+RECORD_DTYPE = np.dtype('<f8')
+RECORD_SIZE = RECORD_DTYPE.itemsize*len(candle_store.CANDLE_FIELDS)
+
+## Max klines requested per REST call (request weight 2 on Binance up to 500).
+KLINE_PAGE_LIMIT = 500
+
+## Markets backfilled at once (the rate limiter still bounds the request weight used).
+BACKFILL_WORKERS = 8
+
+## Length of each kline interval unit (in ms).
+INTERVAL_UNITS = {'m':60000, 'h':3600000, 'd':86400000, 'w':604800000}
+
+
+def interval_ms(interval):
+    ''' Length of a Binance kline interval (e.g. 1m, 4h) in ms. '''
+    if not(interval[-1:] in INTERVAL_UNITS) or not(interval[:-1].isdigit()):
+        raise ValueError('Unsupported kline interval: {0}'.format(interval))
+    return(int(interval[:-1])*INTERVAL_UNITS[interval[-1]])
+
+
+def find_gaps(klines, interval_ms):
+    ''' Row indexes (of oldest first klines) that do not follow on from the kline before them. '''
+    return(np.flatnonzero(np.diff(klines[:, 0]) != interval_ms)+1)
+
+
+def map_klines(file_path):
+    ''' Map a kline file as a read only oldest first (N, 6) float64 array (a torn record at the end is ignored). '''
+    rows = os.path.getsize(file_path)//RECORD_SIZE
+    if rows == 0:
+        return(np.zeros((0, len(candle_store.CANDLE_FIELDS)), dtype=np.float64))
+    return(np.memmap(file_path, dtype=RECORD_DTYPE, mode='r', shape=(rows, len(candle_store.CANDLE_FIELDS))))
+
+
+class KlineFile(object):
+    '''
+    Append only file of the closed klines for one symbol and interval.
+    -> The klines held are always contiguous, when klines after a gap are appended the file is rotated
+        (renamed with the time range it holds, it can still be given to the backtester) and a new one started.
+    '''
+    def __init__(self, file_path, interval_ms):
+        self.file_path = file_path
+        self.interval_ms = interval_ms
+        self.lock = threading.Lock()
+
+        ## Cut off a record torn by a crash mid write so new records stay aligned.
+        if os.path.exists(file_path):
+            size = os.path.getsize(file_path)
+            if size % RECORD_SIZE:
+                logging.warning('[KlineStore] Dropping torn record at the end of {0}.'.format(file_path))
+                with open(file_path, 'r+b') as f:
+                    f.truncate(size-(size % RECORD_SIZE))
+
+        self.file = open(file_path, 'ab')
+        klines = map_klines(file_path)
+        self.rows = len(klines)
+        self.last_time = int(klines[-1][0]) if self.rows else None
+
+
+    def read(self, limit=None):
+        ''' Newest limit klines as an oldest first (N, 6) array. '''
+        with self.lock:
+            klines = map_klines(self.file_path)
+        return(klines if limit == None else klines[max(len(klines)-limit, 0):])
+
+
+    def append(self, klines):
+        ''' Append oldest first closed klines, any not newer than the last stored one are skipped. '''
+        klines = np.asarray(klines, dtype=np.float64).reshape(-1, len(candle_store.CANDLE_FIELDS))
+        if self.last_time != None:
+            klines = klines[klines[:, 0] > self.last_time]
+        if len(klines) == 0:
+            return(0)
+
+        with self.lock:
+            for segment in np.split(klines, find_gaps(klines, self.interval_ms)):
+                if self.last_time != None and segment[0][0] != self.last_time+self.interval_ms:
+                    self._rotate()
+                self.file.write(np.ascontiguousarray(segment, dtype=RECORD_DTYPE).tobytes())
+                self.rows += len(segment)
+                self.last_time = int(segment[-1][0])
+            self.file.flush()
+        return(len(klines))
+
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+    def _rotate(self):
+        ''' Move the stored klines aside so the file only ever holds contiguous klines. '''
+        self.file.close()
+        klines = map_klines(self.file_path)
+        rotated_path = '{0}_{1}-{2}{3}'.format(self.file_path[:-len(KLINE_EXTENSION)], int(klines[0][0]), int(klines[-1][0]), KLINE_EXTENSION)
+        del klines
+
+        logging.info('[KlineStore] Gap after the last stored kline, moved the klines held to {0}.'.format(rotated_path))
+        os.replace(self.file_path, rotated_path)
+        self.file = open(self.file_path, 'ab')
+        self.rows = 0
+        self.last_time = None
+
+
+class KlineStore(object):
+    '''
+    Local on disk kline history for each symbol at the trader interval (kept in cache/klines).
+    -> Files are fixed width records (time, open, high, low, close, volume as float64) oldest first so they map
+        straight to an (N, 6) array with np.memmap, the same files can be given to the backtester.
+    -> Closed candles are appended from the traders candle stores, on start the stores are seeded from here so
+        only the candles since the last stored one need to be fetched.
+    -> backfill() fetches those missing candles for many markets at once so the socket only has to fetch the live ones.
+    '''
+    def __init__(self, cache_dir, interval):
+        self.directory = os.path.join(cache_dir, KLINE_DIR)
+        self.interval = interval
+        self.interval_ms = interval_ms(interval)
+        self.files = {}
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def file_path(self, symbol):
+        return(os.path.join(self.directory, '{0}_{1}{2}'.format(symbol, self.interval, KLINE_EXTENSION)))
+
+
+    def load(self, symbol, limit):
+        ''' Newest first candle list of the newest limit stored klines (for CandleStore.load), klines before any gap are left out. '''
+        klines = self._get_file(symbol).read(limit)
+        gaps = find_gaps(klines, self.interval_ms)
+        if len(gaps):
+            klines = klines[gaps[-1]:]
+        return([[int(kline[0])]+kline[1:] for kline in klines[::-1].tolist()])
+
+
+    def fetch_limit(self, symbols, max_candles, now=None):
+        ''' Candles to fetch so the newest stored kline of every symbol is covered (max_candles if one has none stored). '''
+        now = time.time()*1000 if now == None else now
+        limit = 2
+        for symbol in symbols:
+            last_time = self._get_file(symbol).last_time
+            if last_time == None:
+                return(max_candles)
+            ## The stored candle itself plus every candle opened since (including the live one).
+            limit = max(limit, int((now-last_time)//self.interval_ms)+2)
+        return(min(limit, max_candles))
+
+
+    def backfill(self, symbols, max_candles, rest_url, rest_api=None, workers=BACKFILL_WORKERS):
+        ''' Fetch the closed klines missing since the last stored one (up to max_candles) for each symbol concurrently, returns the number stored per symbol. '''
+        fetched = {}
+        if not(symbols):
+            return(fetched)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(symbols))) as executor:
+            futures = {symbol:executor.submit(self._backfill_symbol, symbol, max_candles, rest_api, rest_url) for symbol in symbols}
+
+        for symbol, future in futures.items():
+            try:
+                fetched.update({symbol:future.result()})
+            except Exception as error:
+                ## The socket fetch still covers the market, only with the full candle limit.
+                logging.warning('[KlineStore] Failed to backfill {0}: {1}'.format(symbol, error))
+                fetched.update({symbol:0})
+        return(fetched)
+
+
+    def record(self, symbol, candles):
+        ''' Append the closed candles (all but the live candle) of a CandleStore not yet stored. '''
+        kline_file = self._get_file(symbol)
+        times = candles.column('time')[1:]
+        closed = len(times) if kline_file.last_time == None else int(np.count_nonzero(times > kline_file.last_time))
+        if closed == 0:
+            return(0)
+
+        klines = np.column_stack([candles.column(field, closed+1)[1:] for field in candle_store.CANDLE_FIELDS])
+        return(kline_file.append(klines[::-1]))
+
+
+    def close(self):
+        with self.lock:
+            for kline_file in self.files.values():
+                kline_file.close()
+            self.files = {}
+
+
+    def _backfill_symbol(self, symbol, max_candles, rest_api, rest_url):
+        kline_file = self._get_file(symbol)
+        now = time.time()*1000
+        live_open_time = (now//self.interval_ms)*self.interval_ms
+
+        ## Start after the last stored kline unless it is older than the held candles (the file is then rotated on append).
+        start_time = live_open_time-(max_candles-1)*self.interval_ms
+        if kline_file.last_time != None:
+            start_time = max(start_time, kline_file.last_time+self.interval_ms)
+
+        stored = 0
+        while start_time < live_open_time:
+            limit = int(min(KLINE_PAGE_LIMIT, (live_open_time-start_time)//self.interval_ms))
+            if rest_api:
+                klines = rest_api.call('get_klines', self._get_klines, rest_url, symbol, start_time, limit)
+            else:
+                klines = self._get_klines(rest_url, symbol, start_time, limit)
+
+            ## Only closed klines are stored (the live one is still changing).
+            klines = [kline[:len(candle_store.CANDLE_FIELDS)] for kline in klines if kline[0] < live_open_time]
+            if not(klines):
+                break
+            stored += kline_file.append(np.array(klines, dtype=np.float64))
+            start_time = klines[-1][0]+self.interval_ms
+        return(stored)
+
+
+    def _get_klines(self, rest_url, symbol, start_time, limit):
+        response = requests.get('{0}/api/v3/klines'.format(rest_url), params={'symbol':symbol, 'interval':self.interval, 'startTime':int(start_time), 'limit':limit}, timeout=10)
+        response.raise_for_status()
+        return(response.json())
+
+
+    def _get_file(self, symbol):
+        with self.lock:
+            kline_file = self.files.get(symbol)
+            if kline_file == None:
+                kline_file = KlineFile(self.file_path(symbol), self.interval_ms)
+                self.files.update({symbol:kline_file})
+        return(kline_file)
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+import math
+import threading
+
+## Smallest latency bucket (in seconds), anything lower is placed in the first bucket.
+MIN_LATENCY = 0.000001
+
+## Growth between bucket bounds (4 buckets per doubling gives ~19% resolution).
+BUCKET_GROWTH = 2**0.25
+
+## Number of buckets (covers 1us up to ~100s).
+BUCKET_COUNT = 108
+
+
+class LatencyHistogram(object):
+    '''
+    Fixed size log-bucketed histogram.
+    Recording is O(1) with no allocation so it can be left on in production, percentiles are
+    reported as the upper bound of the bucket they fall in.
+    '''
+    def __init__(self):
+        self.buckets = [0]*BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def record(self, seconds):
+        if seconds <= MIN_LATENCY:
+            index = 0
+        else:
+            index = min(int(math.log(seconds/MIN_LATENCY, BUCKET_GROWTH))+1, BUCKET_COUNT-1)
+
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return(0.0)
+
+        target = self.count*(percent/100)
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return(min(MIN_LATENCY*(BUCKET_GROWTH**index), self.max))
+        return(self.max)
+
+
+    def get_stats(self):
+        return({
+            'count':self.count,
+            'mean':(self.total/self.count) if self.count else 0.0,
+            'p50':self.percentile(50),
+            'p99':self.percentile(99),
+            'max':self.max})
+
+
+class StageTimer(object):
+    ''' Latency histograms for each stage of a traders cycle. '''
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+
+    def record(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram == None:
+            with self.lock:
+                histogram = self.stages.setdefault(stage, LatencyHistogram())
+        histogram.record(seconds)
+
+
+    def get_stats(self):
+        return({stage:histogram.get_stats() for stage, histogram in list(self.stages.items())})
@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+import threading
+
+
+def market_symbol(market):
+    ''' Exchange symbol for a print pair (BTC-ETH -> ETHBTC). '''
+    quote_asset, base_asset = market.split('-')
+    return(base_asset+quote_asset)
+
+
+class MarketRegistry(object):
+    '''
+    Index of the traders run by a core.
+    -> Traders are looked up by print pair (BTC-ETH) or exchange symbol (ETHBTC) and listed per asset.
+    -> Traders can be added and removed while the core runs, traders() returns them in the order they were added
+        (or the market_order given) as a list that is replaced on add/remove so callers can iterate it without the lock.
+    '''
+    def __init__(self, market_order=None):
+        self.market_order   = {market:index for index, market in enumerate(market_order or [])}
+        self.lock           = threading.Lock()
+        self.markets        = {}
+        self.symbols        = {}
+        self.assets         = {}
+        self.ordered        = []
+
+
+    def add(self, trader_):
+        ''' Register a trader (anything with print_pair, quote_asset and base_asset), returns False if its market is already held. '''
+        market = trader_.print_pair
+        with self.lock:
+            if market in self.markets:
+                return(False)
+
+            self.markets.update({market:trader_})
+            self.symbols.update({market_symbol(market):trader_})
+            for asset in [trader_.quote_asset, trader_.base_asset]:
+                self.assets.setdefault(asset, {}).update({market:trader_})
+            ordered = self.ordered+[trader_]
+            if self.market_order:
+                ordered.sort(key=lambda held_trader: self.market_order.get(held_trader.print_pair, len(self.market_order)))
+            self.ordered = ordered
+        return(True)
+
+
+    def remove(self, market):
+        ''' Unregister a market, returns its trader (None if it was not held). '''
+        with self.lock:
+            trader_ = self.markets.pop(market, None)
+            if trader_ == None:
+                return(None)
+
+            self.symbols.pop(market_symbol(market), None)
+            for asset in [trader_.quote_asset, trader_.base_asset]:
+                asset_traders = self.assets.get(asset, {})
+                asset_traders.pop(market, None)
+                if not(asset_traders):
+                    self.assets.pop(asset, None)
+            self.ordered = [held_trader for held_trader in self.ordered if held_trader is not trader_]
+        return(trader_)
+
+
+    def get(self, market):
+        return(self.markets.get(market))
+
+
+    def get_symbol(self, symbol):
+        return(self.symbols.get(symbol))
+
+
+    def for_asset(self, asset):
+        ''' Traders that trade the asset on either side of their pair. '''
+        with self.lock:
+            return(list(self.assets.get(asset, {}).values()))
+
+
+    def traders(self):
+        return(self.ordered)
+
+
+    def market_list(self):
+        return([trader_.print_pair for trader_ in self.ordered])
+
+
+    def __contains__(self, market):
+        return(market in self.markets)
+
+
+    def __len__(self):
+        return(len(self.ordered))
@@ -0,0 +1,64 @@
+#! /usr/bin/env python3
+import logging
+
+from binance_api import api_master_socket_caller
+
+
+class MarketSocket(object):
+    '''
+    Socket for a market added while the core is running.
+    -> The binance_api socket builds its stream query once, so each added market gets its own socket holding
+        its candle (and depth, unless the local order books are kept) stream, only its candles are backfilled.
+    -> The user data (order and wallet updates) still comes from the core socket, socketBuffer is read from there.
+    -> Stopping the socket unsubscribes the market without touching the streams of the other markets.
+    '''
+    def __init__(self, market, core_socket, rest_api, interval, candle_limit, depth_limit, with_depth=True):
+        logging.info('[MarketSocket] Initilizing socket for {0}.'.format(market))
+
+        self.market         = market
+        self.core_socket    = core_socket
+        self.rest_api       = rest_api
+
+        self.socket = api_master_socket_caller.Binance_SOCK()
+        self.socket.BASE_CANDLE_LIMIT = candle_limit
+        self.socket.BASE_DEPTH_LIMIT = depth_limit
+        self.socket.set_candle_stream(symbol=market, interval=interval)
+        if with_depth:
+            self.socket.set_manual_depth_stream(symbol=market, update_speed='1000ms')
+
+        ## Same endpoints the traders use on the core socket.
+        self.get_live_candles = self.socket.get_live_candles
+        self.get_live_depths = self.socket.get_live_depths
+
+
+    @property
+    def socketBuffer(self):
+        return(self.core_socket.socketBuffer)
+
+
+    @property
+    def socketRunning(self):
+        return(self.socket.socketRunning)
+
+
+    @property
+    def last_data_recv_time(self):
+        return(self.socket.last_data_recv_time)
+
+
+    def start(self):
+        ''' Backfill the markets candles then open its stream. '''
+        self.socket.build_query()
+        self.socket.set_live_and_historic_combo(self.rest_api)
+        self.socket.start()
+
+
+    def reconnect(self):
+        ''' Reopen the stream after a connection issue (the held candles are kept). '''
+        self.socket.start()
+
+
+    def stop(self):
+        logging.info('[MarketSocket] Closing socket for {0}.'.format(self.market))
+        if hasattr(self.socket, 'stop'):
+            self.socket.stop()
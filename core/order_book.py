@@ -0,0 +1,515 @@
+#! /usr/bin/env python3
+import json
+import time
+import queue
+import logging
+import threading
+import collections
+import numpy as np
+import requests
+import websocket
+
+from . import rate_limiter
+
+## Binance endpoints used for the depth snapshots and the diff depth stream.
+REST_URL = 'https://api.binance.com'
+SOCKET_URL = 'wss://stream.binance.com:9443'
+
+## Speed of the diff depth stream (100ms or 1000ms).
+UPDATE_SPEED = '100ms'
+
+## Max price levels held per side of a book (levels worse than these are dropped so memory per book is fixed).
+BOOK_CAPACITY = 1000
+
+## Level counts the REST depth snapshot accepts, the smallest covering twice the levels served is requested (less weight),
+## the books hold no more levels than the snapshot and are resynced once the levels served reach its edge.
+SNAPSHOT_LIMITS = [5, 10, 20, 50, 100, 500, 1000, 5000]
+
+## Default number of levels served by get_live_depths (matches the MAX_DEPTH setting default).
+DEFAULT_DEPTH = 50
+
+## Max diff events buffered for a market while its snapshot is being loaded.
+MAX_BUFFERED_EVENTS = 1000
+
+## Time waited before reconnecting the depth socket (in seconds).
+RECONNECT_DELAY = 5
+
+
+class BookSide(object):
+    '''
+    One side of an order book held as sorted preallocated numpy arrays.
+    -> Bid prices are stored negated so both sides are ascending and index 0 is always the best level.
+    -> Levels are found with a binary search (np.searchsorted), inserts/removes shift the arrays in place.
+    -> Once capacity levels are held any level worse than all of them is dropped.
+    -> edge is the worst key every level up to is known (None when the whole side is held), updates past it are
+        ignored so the side never holds levels with unknown ones between them.
+    '''
+    def __init__(self, is_bid, capacity=BOOK_CAPACITY):
+        self.is_bid = is_bid
+        self.capacity = capacity
+        self.keys = np.zeros(capacity, dtype=np.float64)
+        self.quantities = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.edge = None
+
+
+    def __len__(self):
+        return(self.size)
+
+
+    def clear(self):
+        self.size = 0
+        self.edge = None
+
+
+    def update(self, price, quantity):
+        ''' Set the quantity held at a price (a quantity of 0 removes the level). '''
+        key = -price if self.is_bid else price
+        if self.edge != None and key > self.edge:
+            return
+
+        size = self.size
+        keys = self.keys
+        quantities = self.quantities
+
+        index = int(np.searchsorted(keys[:size], key))
+        found = index < size and keys[index] == key
+
+        if quantity == 0:
+            if found:
+                keys[index:size-1] = keys[index+1:size]
+                quantities[index:size-1] = quantities[index+1:size]
+                self.size -= 1
+            return
+
+        if found:
+            quantities[index] = quantity
+            return
+
+        ## A full side drops its worst level, nothing past the new worst level is known from then on.
+        if index >= self.capacity:
+            self.edge = keys[size-1]
+            return
+
+        end = min(size, self.capacity-1)
+        keys[index+1:end+1] = keys[index:end]
+        quantities[index+1:end+1] = quantities[index:end]
+        keys[index] = key
+        quantities[index] = quantity
+        self.size = end+1
+        if end < size:
+            self.edge = keys[end]
+
+
+    def known_levels(self):
+        ''' Number of levels held, None if the whole side is held (a side cut at its edge may have more levels). '''
+        return(None if self.edge == None else self.size)
+
+
+    def prices(self, limit=None):
+        ''' Best first prices as a new array. '''
+        size = self.size if limit == None else min(limit, self.size)
+        return(-self.keys[:size] if self.is_bid else self.keys[:size].copy())
+
+
+    def best(self):
+        ''' Best price and quantity or None if the side is empty. '''
+        if self.size == 0:
+            return(None)
+        return(float(self.prices(1)[0]), float(self.quantities[0]))
+
+
+    def levels(self, limit=None):
+        ''' Best first [price, quantity] lists (the format used by the binance_api depth endpoint). '''
+        size = self.size if limit == None else min(limit, self.size)
+        return(np.column_stack((self.prices(size), self.quantities[:size])).tolist())
+
+
+    def depth_to(self, price):
+        ''' Cumulative quantity of the levels at or better than price. '''
+        key = -price if self.is_bid else price
+        index = int(np.searchsorted(self.keys[:self.size], key, side='right'))
+        return(float(self.quantities[:index].sum()))
+
+
+    def vwap(self, quantity):
+        ''' Average price paid to take quantity from this side, None if the side does not hold enough. '''
+        if quantity <= 0 or self.size == 0:
+            return(None)
+
+        cumulative = np.cumsum(self.quantities[:self.size])
+        last_level = int(np.searchsorted(cumulative, quantity))
+        if last_level >= self.size:
+            return(None)
+
+        prices = self.prices(last_level+1)
+        used = cumulative[last_level-1] if last_level else 0.0
+        notional = float(np.dot(prices[:last_level], self.quantities[:last_level]))+(quantity-used)*prices[last_level]
+        return(float(notional/quantity))
+
+
+class OrderBook(object):
+    '''
+    Local order book for a single market kept from a REST snapshot plus the Binance diff depth events.
+    -> apply_event follows the Binance sync rules (events older than the book are skipped), a gap in the
+        update ids returns False so the book can be resynced.
+    -> Queries (top of book, spread, depth within N bps, VWAP to a size) read the numpy sides directly.
+    '''
+    def __init__(self, symbol, capacity=BOOK_CAPACITY):
+        self.symbol = symbol
+        self.bids = BookSide(True, capacity)
+        self.asks = BookSide(False, capacity)
+        self.lock = threading.Lock()
+        self.last_update_id = None
+        self.version = 0
+
+
+    @property
+    def synced(self):
+        return(self.last_update_id != None)
+
+
+    def load_snapshot(self, snapshot, limit=None):
+        ''' Replace the book with a REST depth snapshot ({'lastUpdateId', 'bids', 'asks'}) requested with limit levels. '''
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+            self._apply_levels(snapshot['bids'], snapshot['asks'])
+
+            ## A side the snapshot filled may have more levels past its worst one.
+            for side, levels in ((self.bids, snapshot['bids']), (self.asks, snapshot['asks'])):
+                if limit != None and len(levels) >= limit and side.size:
+                    side.edge = side.keys[side.size-1]
+
+            self.last_update_id = snapshot['lastUpdateId']
+            self.version += 1
+
+
+    def covers(self, levels):
+        ''' True if both sides still hold levels best levels (or all the levels there are). '''
+        with self.lock:
+            return(all(side.known_levels() == None or side.known_levels() >= levels for side in (self.bids, self.asks)))
+
+
+    def reset(self):
+        ''' Mark the book as out of sync (it is kept until a new snapshot is loaded). '''
+        with self.lock:
+            self.last_update_id = None
+
+
+    def apply_event(self, event):
+        ''' Apply a depthUpdate event, returns False if update ids were missed (or the book is not synced). '''
+        with self.lock:
+            if self.last_update_id == None:
+                return(False)
+
+            if event['u'] <= self.last_update_id:
+                return(True)
+
+            if event['U'] > self.last_update_id+1:
+                return(False)
+
+            self._apply_levels(event['b'], event['a'])
+            self.last_update_id = event['u']
+            self.version += 1
+        return(True)
+
+
+    def top_of_book(self):
+        with self.lock:
+            bid = self.bids.best()
+            ask = self.asks.best()
+        if bid == None or ask == None:
+            return(None)
+        return({'bidPrice':bid[0], 'bidQty':bid[1], 'askPrice':ask[0], 'askQty':ask[1]})
+
+
+    def spread(self):
+        top = self.top_of_book()
+        return(None if top == None else top['askPrice']-top['bidPrice'])
+
+
+    def mid_price(self):
+        top = self.top_of_book()
+        return(None if top == None else (top['askPrice']+top['bidPrice'])/2)
+
+
+    def depth_within(self, bps):
+        ''' Cumulative bid/ask quantity within bps (basis points) of the mid price. '''
+        mid_price = self.mid_price()
+        if mid_price == None:
+            return(None)
+
+        offset = mid_price*bps/10000
+        with self.lock:
+            return({'bids':self.bids.depth_to(mid_price-offset), 'asks':self.asks.depth_to(mid_price+offset)})
+
+
+    def vwap(self, side, quantity):
+        ''' Average price a market order of quantity would get (BUY takes the asks, SELL the bids). '''
+        with self.lock:
+            return(self.asks.vwap(quantity) if side == 'BUY' else self.bids.vwap(quantity))
+
+
+    def to_books_data(self, limit=None):
+        ''' The book in the binance_api depth format ({'a':[[price, quantity], ...], 'b':[...]}, best first). '''
+        with self.lock:
+            if self.bids.size == 0 or self.asks.size == 0:
+                return({})
+            return({'a':self.asks.levels(limit), 'b':self.bids.levels(limit)})
+
+
+    def _apply_levels(self, bids, asks):
+        for price, quantity in bids:
+            self.bids.update(float(price), float(quantity))
+        for price, quantity in asks:
+            self.asks.update(float(price), float(quantity))
+
+
+class DepthStream(object):
+    '''
+    Keeps a local OrderBook for each market from the Binance diff depth stream (in place of the binance_api depth stream).
+    -> One combined socket carries <symbol>@depth@<update_speed> for every market, events are buffered until
+        the markets REST snapshot has been loaded by the snapshot worker.
+    -> Books that miss update ids (or a socket reconnect) are resynced from a new snapshot.
+    -> Markets can be added/removed while running (SUBSCRIBE/UNSUBSCRIBE on the open socket).
+    -> get_live_depths mirrors the binance_api endpoint, the depth lists are only rebuilt when the book changes.
+    -> Snapshot calls go through rest_api.call (the RateLimitedREST wrapper) when given so they use the weight budget.
+    -> A listener set with set_listener is called as each update is applied (used to wake the markets trader).
+    '''
+    def __init__(self, symbols, depth_limit=DEFAULT_DEPTH, update_speed=UPDATE_SPEED, rest_url=REST_URL, socket_url=SOCKET_URL, rest_api=None, capacity=BOOK_CAPACITY):
+        logging.info('[DepthStream] Initilizing local order books for {0} markets ({1} updates).'.format(len(symbols), update_speed))
+
+        self.depth_limit    = depth_limit
+        self.snapshot_limit = next((limit for limit in SNAPSHOT_LIMITS if limit >= depth_limit*2), SNAPSHOT_LIMITS[-1])
+        self.update_speed   = update_speed
+        self.rest_url       = rest_url
+        self.socket_url     = socket_url
+        self.rest_api       = rest_api
+        self.running        = False
+        self.socket         = None
+        self.socket_thread  = None
+        self.snapshot_thread= None
+        self.resync_queue   = queue.Queue()
+        self.capacity       = min(capacity, self.snapshot_limit)
+        self.request_id     = 0
+        self.listener       = None
+
+        self.markets = {}
+        for symbol in symbols:
+            self.markets.update({symbol:self._new_market(symbol)})
+
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.snapshot_thread = threading.Thread(target=self._snapshot_worker, daemon=True)
+        self.snapshot_thread.start()
+        self.socket_thread = threading.Thread(target=self._socket_worker, daemon=True)
+        self.socket_thread.start()
+
+
+    def stop(self):
+        self.running = False
+        self.resync_queue.put(None)
+        if self.socket:
+            self.socket.close()
+        for thread in (self.socket_thread, self.snapshot_thread):
+            if thread:
+                thread.join()
+
+
+    def set_listener(self, listener):
+        ''' Set a callback called with the symbol (on the socket thread) each time a book changes. '''
+        self.listener = listener
+
+
+    def add_symbol(self, symbol):
+        ''' Start keeping a book for a market, it is synced from a new snapshot once subscribed. '''
+        if symbol in self.markets:
+            return
+        self.markets.update({symbol:self._new_market(symbol)})
+
+        if self.running:
+            self._send_request('SUBSCRIBE', symbol)
+            self._resync(symbol)
+
+
+    def remove_symbol(self, symbol):
+        ''' Stop keeping the book for a market. '''
+        if self.markets.pop(symbol, None) != None and self.running:
+            self._send_request('UNSUBSCRIBE', symbol)
+
+
+    def get_book(self, symbol):
+        market = self.markets.get(symbol)
+        return(None if market == None else market['book'])
+
+
+    def get_live_depths(self, symbol=None):
+        ''' Depth data for a market (or every market when no symbol is given), {} until the book is synced. '''
+        if symbol == None:
+            return({symbol:self.get_live_depths(symbol) for symbol in self.markets})
+
+        market = self.markets.get(symbol)
+        if market == None:
+            return({})
+
+        book = market['book']
+        if market['cache_version'] != book.version:
+            version = book.version
+            market['cache'] = book.to_books_data(self.depth_limit) if book.synced else {}
+            market['cache_version'] = version
+        return(market['cache'])
+
+
+    def get_stats(self):
+        return({symbol:{
+            'synced':market['book'].synced,
+            'last_update_id':market['book'].last_update_id,
+            'bid_levels':len(market['book'].bids),
+            'ask_levels':len(market['book'].asks),
+            'updates':market['updates'],
+            'resyncs':market['resyncs']} for symbol, market in list(self.markets.items())})
+
+
+    def _socket_worker(self):
+        ''' Keep the combined depth socket open (reconnecting on failure). '''
+        while self.running:
+            ## Built on each connect so markets added/removed while running are kept.
+            streams = '/'.join([self._stream_name(symbol) for symbol in list(self.markets)])
+            url = '{0}/stream?streams={1}'.format(self.socket_url, streams)
+            self.socket = websocket.WebSocketApp(url, on_open=self._on_open, on_message=self._on_message, on_error=self._on_error)
+            self.socket.run_forever()
+            if self.running:
+                logging.warning('[DepthStream] Depth socket closed, reconnecting in {0}s.'.format(RECONNECT_DELAY))
+                time.sleep(RECONNECT_DELAY)
+
+
+    def _on_open(self, socket):
+        logging.info('[DepthStream] Depth socket open, syncing {0} books.'.format(len(self.markets)))
+        for symbol in list(self.markets):
+            self._resync(symbol)
+
+
+    def _on_error(self, socket, error):
+        logging.warning('[DepthStream] Depth socket error: {0}'.format(error))
+
+
+    def _on_message(self, socket, message):
+        data = json.loads(message)
+        event = data.get('data', data)
+        market = self.markets.get(event.get('s'))
+        if market == None:
+            return
+
+        with market['lock']:
+            if market['pending']:
+                market['buffer'].append(event)
+                return
+
+            if not(market['book'].apply_event(event)):
+                logging.info('[DepthStream] Missed depth updates for {0}, resyncing.'.format(event['s']))
+                market['buffer'].append(event)
+                self._resync(event['s'], True)
+                return
+
+            market['updates'] += 1
+            if not(market['book'].covers(self.depth_limit)):
+                logging.info('[DepthStream] Depth for {0} moved past the snapshot edge, resyncing.'.format(event['s']))
+                self._resync(event['s'], True)
+                return
+
+        if self.listener:
+            self.listener(event['s'])
+
+
+    def _resync(self, symbol, locked=False):
+        ''' Queue a market for a new snapshot, its events are buffered until then. '''
+        market = self.markets.get(symbol)
+        if market == None:
+            return
+        if not(locked):
+            with market['lock']:
+                return(self._resync(symbol, True))
+
+        if market['pending']:
+            return
+        market['pending'] = True
+        market['book'].reset()
+        self.resync_queue.put(symbol)
+
+
+    def _snapshot_worker(self):
+        ''' Load snapshots for the markets waiting to be synced then replay their buffered events. '''
+        while self.running:
+            symbol = self.resync_queue.get()
+            if symbol == None:
+                break
+            market = self.markets.get(symbol)
+            if market == None:
+                continue
+
+            try:
+                if self.rest_api:
+                    snapshot = self.rest_api.call('get_depth_snapshot', self._get_snapshot, symbol, weight=rate_limiter.depth_weight(self.snapshot_limit))
+                else:
+                    snapshot = self._get_snapshot(symbol)
+            except Exception as error:
+                logging.warning('[DepthStream] Failed to get the depth snapshot for {0}: {1}'.format(symbol, error))
+                time.sleep(RECONNECT_DELAY)
+                self.resync_queue.put(symbol)
+                continue
+
+            book = market['book']
+            book.load_snapshot(snapshot, self.snapshot_limit)
+            market['resyncs'] += 1
+
+            ## Replay the buffered events (older ones are skipped by the book), a gap means the snapshot is already stale.
+            with market['lock']:
+                in_sync = True
+                while market['buffer']:
+                    if not(book.apply_event(market['buffer'].popleft())):
+                        in_sync = False
+                        break
+
+                if in_sync:
+                    market['pending'] = False
+                else:
+                    book.reset()
+                    self.resync_queue.put(symbol)
+
+            if in_sync and self.listener:
+                self.listener(symbol)
+
+
+    def _new_market(self, symbol):
+        return({
+            'book':OrderBook(symbol, self.capacity),
+            'buffer':collections.deque(maxlen=MAX_BUFFERED_EVENTS),
+            'pending':False,
+            'lock':threading.Lock(),
+            'cache':{},
+            'cache_version':-1,
+            'updates':0,
+            'resyncs':0})
+
+
+    def _stream_name(self, symbol):
+        return('{0}@depth@{1}'.format(symbol.lower(), self.update_speed))
+
+
+    def _send_request(self, method, symbol):
+        ''' Change the streams of the open socket, if it is not connected the next connect picks up the change. '''
+        self.request_id += 1
+        try:
+            self.socket.send(json.dumps({'method':method, 'params':[self._stream_name(symbol)], 'id':self.request_id}))
+        except Exception as error:
+            logging.warning('[DepthStream] Failed to {0} {1}: {2}'.format(method.lower(), symbol, error))
+
+
+    def _get_snapshot(self, symbol):
+        response = requests.get('{0}/api/v3/depth'.format(self.rest_url), params={'symbol':symbol, 'limit':self.snapshot_limit}, timeout=10)
+        response.raise_for_status()
+        return(response.json())
@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+import time
+import logging
+import threading
+import concurrent.futures
+
+from . import latency_stats
+
+## Default number of worker threads used to make the order REST calls.
+DEFAULT_WORKERS = 4
+
+
+class OrderGateway(object):
+    '''
+    Runs the order REST calls (place/cancel/borrow/repay) on a worker pool so traders never block on the exchange.
+    -> submit() queues the call and returns a future, the optional callback is called with the future once done.
+    -> The submit to ack latency (queue time plus exchange round trip) is recorded per action.
+    '''
+    def __init__(self, workers=DEFAULT_WORKERS):
+        logging.info('[OrderGateway] Initilizing the order gateway with {0} workers.'.format(workers))
+
+        self.worker_count   = workers
+        self.executor       = None
+        self.stage_timer    = latency_stats.StageTimer()
+        self.lock           = threading.Lock()
+
+        ## Counters used for monitoring.
+        self.pending        = 0
+        self.submitted      = 0
+        self.failed         = 0
+
+
+    def start(self):
+        if self.executor == None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.worker_count, thread_name_prefix='OrderGateway')
+
+
+    def stop(self, wait=True):
+        ''' Stop the pool, by default waiting for any queued calls to finish. '''
+        if self.executor != None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+
+    def submit(self, action, function, *args, callback=None, **kwargs):
+        ''' Queue a REST call, returns a future holding its result. '''
+        with self.lock:
+            self.pending += 1
+            self.submitted += 1
+
+        future = self.executor.submit(self._run, action, time.perf_counter(), function, args, kwargs)
+        if callback:
+            future.add_done_callback(callback)
+        return(future)
+
+
+    def get_stats(self):
+        with self.lock:
+            stats = {'pending':self.pending, 'submitted':self.submitted, 'failed':self.failed}
+        stats.update({'ack_latency':self.stage_timer.get_stats()})
+        return(stats)
+
+
+    def _run(self, action, submit_time, function, args, kwargs):
+        try:
+            return(function(*args, **kwargs))
+        except Exception as error:
+            with self.lock:
+                self.failed += 1
+            logging.exception('[OrderGateway] {0} failed: {1}'.format(action, error))
+            raise
+        finally:
+            self.stage_timer.record(action, time.perf_counter()-submit_time)
+            with self.lock:
+                self.pending -= 1
@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+import os
+import time
+import random
+import logging
+import itertools
+import numpy as np
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import trader_configuration as TC
+
+from . import backtester
+
+## Strategy parameters as they are before any sweep overrides (restored before every task).
+BASE_PARAMETERS = dict(TC.PARAMETERS)
+
+## Klines attached from shared memory within each worker process.
+_worker_klines = None
+_worker_memory = None
+
+
+def build_grid(space):
+    ''' Build every combination of a {name:[values]} parameter space. '''
+    names = list(space)
+    return([dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])])
+
+
+def build_random(space, samples, seed=None):
+    '''
+    Build random samples of a parameter space.
+    -> [values] entries are picked from, (low, high) entries are drawn uniformly (ints stay ints).
+    '''
+    rand = random.Random(seed)
+    param_sets = []
+
+    for i in range(samples):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                params.update({name:rand.randint(low, high) if isinstance(low, int) and isinstance(high, int) else rand.uniform(low, high)})
+            else:
+                params.update({name:rand.choice(values)})
+        param_sets.append(params)
+    return(param_sets)
+
+
+def _init_worker(memory_name, shape):
+    ''' Attach the shared kline array once per worker process (the klines are never pickled per task). '''
+    global _worker_klines, _worker_memory
+    _worker_memory = shared_memory.SharedMemory(name=memory_name)
+    _worker_klines = np.ndarray(shape, dtype=np.float64, buffer=_worker_memory.buf)
+
+
+def _run_task(params, market, market_type, base_currency, max_candles, rules):
+    ''' Run a single backtest with the parameter overrides applied to trader_configuration. '''
+    TC.PARAMETERS.clear()
+    TC.PARAMETERS.update(BASE_PARAMETERS)
+    TC.PARAMETERS.update(params)
+
+    report = backtester.Backtester(market, _worker_klines, market_type=market_type, base_currency=base_currency,
+        max_candles=max_candles, rules=rules, logs_dir=None).run()
+    report.update({'params':params})
+    return(report)
+
+
+class ParameterSweep(object):
+
+    def __init__(self, market, klines, market_type='SPOT', base_currency=0.002, max_candles=500, rules=None, workers=None):
+        # Initilize the sweep runner, backtests are fanned out over a process pool.
+        self.market         = market
+        self.klines         = np.ascontiguousarray(klines, dtype=np.float64)
+        self.market_type    = market_type
+        self.base_currency  = base_currency
+        self.max_candles    = max_candles
+        self.rules          = rules
+        self.workers        = workers or os.cpu_count()
+        self.elapsed        = 0.0
+
+
+    def run(self, param_sets):
+        '''
+        Run a backtest for every parameter set.
+        -> The klines are copied once into shared memory which each worker attaches to.
+        -> Returns the reports ranked by outcome (best first).
+        '''
+        memory = shared_memory.SharedMemory(create=True, size=max(self.klines.nbytes, 1))
+        results = []
+
+        try:
+            shared_klines = np.ndarray(self.klines.shape, dtype=np.float64, buffer=memory.buf)
+            shared_klines[:] = self.klines
+
+            logging.info('[ParameterSweep] Running {0} backtests on {1} workers.'.format(len(param_sets), self.workers))
+            start_time = time.perf_counter()
+
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(memory.name, self.klines.shape)) as executor:
+                futures = [executor.submit(_run_task, params, self.market, self.market_type, self.base_currency, self.max_candles, self.rules) for params in param_sets]
+
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as error:
+                        logging.warning('[ParameterSweep] Backtest failed: {0}'.format(error))
+
+            self.elapsed = time.perf_counter()-start_time
+        finally:
+            memory.close()
+            memory.unlink()
+
+        return(rank_results(results))
+
+
+def rank_results(results, key='outcome'):
+    ''' Sort the reports best first. '''
+    return(sorted(results, key=lambda report: report[key], reverse=True))
+
+
+def format_table(results, limit=None):
+    ''' Build a plain text table of ranked results. '''
+    if not(results):
+        return('No results.')
+
+    param_names = sorted(results[0]['params'])
+    header = ['rank']+param_names+['outcome', 'round_trips', 'wins', 'candles/sec']
+    rows = []
+
+    for rank, report in enumerate(results[:limit], 1):
+        row = [str(rank)]+[str(report['params'][name]) for name in param_names]
+        row += ['{0:.8f}'.format(report['outcome']), str(report['round_trips']), str(report['wins']), '{0:.0f}'.format(report['candles_per_sec'])]
+        rows.append(row)
+
+    widths = [max(len(row[i]) for row in [header]+rows) for i in range(len(header))]
+    lines = [' | '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [header]+rows]
+    lines.insert(1, '-+-'.join('-'*width for width in widths))
+    return('\n'.join(lines))
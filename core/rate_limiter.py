@@ -0,0 +1,228 @@
+#! /usr/bin/env python3
+import time
+import logging
+import threading
+import requests
+
+## Binance request weight allowed per minute (per IP).
+WEIGHT_LIMIT = 1200
+
+## Binance orders allowed per 10 seconds (per account).
+ORDER_LIMIT = 50
+
+## Fraction of the weight budget only order traffic may use.
+ORDER_RESERVE = 0.2
+
+## Request weight of each REST call used by the bot (unknown calls default to DEFAULT_WEIGHT).
+ENDPOINT_WEIGHTS = {
+    'get_exchangeInfo':10,
+    'get_account':10,
+    'test_ping':1,
+    'get_klines':2,
+    'place_order':1,
+    'cancel_order':1,
+    'cancel_oco_order':1,
+    'margin_accountBorrow':1,
+    'margin_accountRepay':1}
+DEFAULT_WEIGHT = 1
+
+## Request weight of a depth snapshot by the levels requested ((max limit, weight) tiers).
+DEPTH_WEIGHTS = [(100, 5), (500, 25), (1000, 50), (5000, 250)]
+
+## Calls that are orders (these have priority and also use the order budget).
+ORDER_ENDPOINTS = ['place_order', 'cancel_order', 'cancel_oco_order', 'margin_accountBorrow', 'margin_accountRepay']
+
+## Read only calls, identical calls made while one is in flight share its result.
+COALESCE_ENDPOINTS = ['get_exchangeInfo', 'get_account', 'test_ping']
+
+## Binance error code returned when the request limit has been hit, all calls are paused for BACKOFF_TIME (in seconds).
+TOO_MANY_REQUESTS = -1003
+BACKOFF_TIME = 60
+
+## HTTP statuses of a rate limited (429) or IP banned (418) request, calls are paused for their Retry-After (in seconds).
+BACKOFF_STATUSES = [429, 418]
+
+
+def depth_weight(limit):
+    ''' Request weight of a depth snapshot of limit levels. '''
+    for max_limit, weight in DEPTH_WEIGHTS:
+        if limit <= max_limit:
+            return(weight)
+    return(DEPTH_WEIGHTS[-1][1])
+
+
+class TokenBucket(object):
+    ''' Token bucket holding a budget that refills continuously over a period. '''
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity/period
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens+(now-self.last_refill)*self.rate)
+        self.last_refill = now
+
+
+    def wait_time(self, amount, floor=0):
+        ''' Time until amount can be taken while leaving at least floor tokens. '''
+        missing = amount+floor-self.tokens
+        return(0 if missing <= 0 else missing/self.rate)
+
+
+class RateLimitedREST(object):
+    '''
+    Wraps Binance_REST so every call is budgeted against the Binance request weight and order limits.
+    -> Calls wait (queue) when the budget is used up, order calls are always served before housekeeping
+        calls and housekeeping calls may not use the reserved part of the budget.
+    -> Identical read only calls made while one is already in flight share its result.
+    -> A too many requests response pauses all calls for BACKOFF_TIME, a raised 429/418 HTTP error for its Retry-After.
+    '''
+    def __init__(self, rest_api, weight_limit=WEIGHT_LIMIT, order_limit=ORDER_LIMIT):
+        logging.info('[RateLimitedREST] Initilizing REST rate limiter ({0} weight/min, {1} orders/10s).'.format(weight_limit, order_limit))
+
+        self.rest_api       = rest_api
+        self.weight_bucket  = TokenBucket(weight_limit, 60)
+        self.order_bucket   = TokenBucket(order_limit, 10)
+        self.order_reserve  = weight_limit*ORDER_RESERVE
+        self.condition      = threading.Condition()
+        self.waiting_orders = 0
+        self.paused_until   = 0
+        self.in_flight      = {}
+
+        ## Counters used for monitoring.
+        self.endpoint_stats = {}
+        self.queued         = 0
+        self.coalesced      = 0
+        self.throttled      = 0
+
+
+    def __getattr__(self, name):
+        attribute = getattr(self.rest_api, name)
+        if not(callable(attribute)):
+            return(attribute)
+        return(lambda *args, **kwargs: self.call(name, attribute, *args, **kwargs))
+
+
+    def call(self, name, function, *args, weight=None, **kwargs):
+        ''' Make a REST call once there is budget for it (weight overrides the ENDPOINT_WEIGHTS weight of the call). '''
+        if name in COALESCE_ENDPOINTS:
+            key = (name, args, tuple(sorted(kwargs.items())))
+            with self.condition:
+                shared = self.in_flight.get(key)
+                if shared == None:
+                    shared = {'done':threading.Event(), 'result':None, 'error':None}
+                    self.in_flight.update({key:shared})
+                    owner = True
+                else:
+                    self.coalesced += 1
+                    owner = False
+
+            if not(owner):
+                shared['done'].wait()
+                if shared['error']:
+                    raise shared['error']
+                return(shared['result'])
+
+            try:
+                shared['result'] = self._call(name, function, args, kwargs, weight)
+            except Exception as error:
+                shared['error'] = error
+                raise
+            finally:
+                with self.condition:
+                    del self.in_flight[key]
+                shared['done'].set()
+            return(shared['result'])
+
+        return(self._call(name, function, args, kwargs, weight))
+
+
+    def get_stats(self):
+        with self.condition:
+            self.weight_bucket.refill()
+            self.order_bucket.refill()
+            return({
+                'weight_used':round(self.weight_bucket.capacity-self.weight_bucket.tokens),
+                'weight_limit':self.weight_bucket.capacity,
+                'orders_used':round(self.order_bucket.capacity-self.order_bucket.tokens),
+                'order_limit':self.order_bucket.capacity,
+                'waiting':self.queued,
+                'coalesced':self.coalesced,
+                'throttled':self.throttled,
+                'paused':max(self.paused_until-time.monotonic(), 0),
+                'endpoints':{name:dict(stats) for name, stats in self.endpoint_stats.items()}})
+
+
+    def _call(self, name, function, args, kwargs, weight=None):
+        if weight == None:
+            weight = ENDPOINT_WEIGHTS.get(name, DEFAULT_WEIGHT)
+        is_order = name in ORDER_ENDPOINTS
+        wait_start = time.perf_counter()
+
+        self._acquire(weight, is_order)
+
+        with self.condition:
+            stats = self.endpoint_stats.setdefault(name, {'calls':0, 'weight':0, 'wait_time':0.0})
+            stats['calls'] += 1
+            stats['weight'] += weight
+            stats['wait_time'] += time.perf_counter()-wait_start
+
+        try:
+            result = function(*args, **kwargs)
+        except requests.HTTPError as error:
+            ## Calls made with requests directly raise on a rate limited status rather than returning the error.
+            if error.response != None and error.response.status_code in BACKOFF_STATUSES:
+                retry_after = error.response.headers.get('Retry-After', '')
+                self._pause(name, int(retry_after) if retry_after.isdigit() else BACKOFF_TIME)
+            raise
+
+        if isinstance(result, dict) and result.get('code') == TOO_MANY_REQUESTS:
+            self._pause(name, BACKOFF_TIME)
+        return(result)
+
+
+    def _pause(self, name, backoff_time):
+        ''' Pause every call for backoff_time (in seconds) once the exchange has rejected one for its request rate. '''
+        logging.warning('[RateLimitedREST] Request limit hit on {0}, pausing calls for {1}s.'.format(name, backoff_time))
+        with self.condition:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic()+backoff_time)
+            self.weight_bucket.tokens = 0
+
+
+    def _acquire(self, weight, is_order):
+        ''' Block until the weight (and an order slot for orders) can be taken. '''
+        with self.condition:
+            if is_order:
+                self.waiting_orders += 1
+            self.queued += 1
+
+            try:
+                while True:
+                    self.weight_bucket.refill()
+                    self.order_bucket.refill()
+
+                    wait_time = self.paused_until-time.monotonic()
+                    if wait_time <= 0:
+                        if is_order:
+                            wait_time = max(self.weight_bucket.wait_time(weight), self.order_bucket.wait_time(1))
+                        elif self.waiting_orders:
+                            wait_time = None
+                        else:
+                            wait_time = self.weight_bucket.wait_time(weight, self.order_reserve)
+
+                    if wait_time == 0:
+                        break
+                    self.condition.wait(wait_time)
+
+                self.weight_bucket.tokens -= weight
+                if is_order:
+                    self.order_bucket.tokens -= 1
+            finally:
+                self.queued -= 1
+                if is_order:
+                    self.waiting_orders -= 1
+                    self.condition.notify_all()
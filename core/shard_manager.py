@@ -0,0 +1,538 @@
+#! /usr/bin/env python3
+import os
+import copy
+import time
+import json
+import pickle
+import signal
+import logging
+import threading
+import multiprocessing
+
+from . import core_lifecycle
+from . import web_delta
+from . import trader_store
+from . import trade_history
+from . import trade_journal
+from . import market_registry
+
+## Time between each shard reporting its changed trader data to the parent (in seconds).
+REPORT_INTERVAL = 0.5
+
+## Max time the parent waits for a shard to answer a call (in seconds).
+CALL_TIMEOUT = 10
+
+## Max time given for a shard to start its traders (in seconds).
+START_TIMEOUT = 300
+
+## BotCore methods the parent may call on a shard.
+SHARD_CALLS = ['trader_action', 'add_market', 'remove_market', 'get_chart_data', 'get_trader_candles', 'get_latency_stats', 'get_indicator_cache_stats',
+    'get_scheduler_stats', 'get_order_gateway_stats', 'get_order_book', 'get_startup_stats']
+
+## Stats merged across shards with max rather than summed.
+MAX_STATS = ['max_queue_depth', 'paused', 'check_time', 'poll_interval']
+
+## Set latency stats log file name (same as the single process core).
+LATENCY_LOG_FILE = 'latency_stats.json'
+
+
+class ShardLink(object):
+    '''
+    Shard process side of the pipe to the parent.
+    -> Messages are tuples of (kind, *args), sends are locked as trader threads and the reporter share the pipe.
+    -> serve() reports the changed trader data (and rate limiter counters) every REPORT_INTERVAL and answers parent calls until told to stop.
+    '''
+    def __init__(self, shard_id, shard_count, connection, cached_traders):
+        self.shard_id       = shard_id
+        self.shard_count    = shard_count
+        self.connection     = connection
+        self.cached_traders = cached_traders
+        self.send_lock      = threading.Lock()
+
+
+    def send(self, *message):
+        with self.send_lock:
+            self.connection.send(message)
+
+
+    def serve(self, core):
+        ''' Block handling parent calls until the parent asks the shard to stop (or goes away). '''
+        reporter_thread = threading.Thread(target=self._reporter, args=(core,), daemon=True)
+        reporter_thread.start()
+
+        while True:
+            try:
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                logging.warning('[ShardLink] Lost the parent connection, stopping shard {0}.'.format(self.shard_id))
+                break
+
+            if message[0] == 'stop':
+                break
+
+            if message[0] == 'call':
+                request_id, method, args = message[1:]
+                result = None
+                if method in SHARD_CALLS:
+                    try:
+                        result = getattr(core, method)(*args)
+                    except Exception as error:
+                        logging.exception('[ShardLink] Call {0} failed: {1}'.format(method, error))
+                self.send('reply', request_id, result)
+
+
+    def _reporter(self, core):
+        ''' Send the data of each trader that changed since it was last reported (pickled once to compare). '''
+        last_sent = {}
+        last_rate_limit_stats = None
+
+        while not(core.lifecycle.wait(REPORT_INTERVAL)):
+            changed = []
+            for trader_ in core.trader_objects:
+                try:
+                    trader_data = pickle.dumps(trader_.get_trader_data())
+                except RuntimeError:
+                    ## The trader changed its data mid pickle, it is picked up on the next report.
+                    continue
+
+                if last_sent.get(trader_.print_pair) != trader_data:
+                    last_sent[trader_.print_pair] = trader_data
+                    changed.append(trader_data)
+
+            ## The rate limiter counters are pushed so the parents web updater never waits on a shard for them.
+            rate_limit_stats = core.get_rate_limit_stats()
+            if rate_limit_stats == last_rate_limit_stats:
+                rate_limit_stats = None
+            else:
+                last_rate_limit_stats = rate_limit_stats
+
+            try:
+                if changed:
+                    self.send('traders', changed)
+                if rate_limit_stats != None:
+                    self.send('rate_limit_stats', rate_limit_stats)
+            except (BrokenPipeError, OSError):
+                break
+
+
+class ShardStateStore(object):
+    ''' Stand in for the TraderStateStore within a shard, the cache is loaded and written by the parent. '''
+    def __init__(self, shard_link):
+        self.shard_link = shard_link
+
+
+    def load(self):
+        return(self.shard_link.cached_traders)
+
+
+    def record_fill(self, market, trade_recorder, market_activity):
+        self.shard_link.send('fill', market, list(trade_recorder), copy.deepcopy(market_activity))
+
+
+    def sync(self, traders):
+        ''' Trader state is synced by the parent from the reported trader data. '''
+
+
+    def close(self):
+        pass
+
+
+class ShardJournal(object):
+    ''' Stand in for the TradeJournal within a shard, round trips are passed to the parents journal. '''
+    def __init__(self, shard_link):
+        self.shard_link = shard_link
+
+
+    def start(self):
+        pass
+
+
+    def stop(self, timeout=None):
+        pass
+
+
+    def record(self, market, buy_trade, sell_trade):
+        self.shard_link.send('journal', market, list(buy_trade), list(sell_trade))
+
+
+class TraderView(object):
+    ''' Parent copy of a shard traders data, holds the attributes the web tracker, state store and API read. '''
+    def __init__(self, market):
+        self.print_pair = market
+        self.quote_asset, self.base_asset = market.split('-')
+        self.update({'configuration':{}, 'market_prices':{}, 'wallet_pair':{}, 'custom_conditions':{},
+            'market_activity':{}, 'trade_recorder':[], 'trade_totals':{'round_trips':0, 'outcome':0.0}, 'state_data':{}})
+
+
+    def update(self, trader_data):
+        self.trader_data             = trader_data
+        self.configuration           = trader_data['configuration']
+        self.market_prices           = trader_data['market_prices']
+        self.wallet_pair             = trader_data['wallet_pair']
+        self.custom_conditional_data = trader_data['custom_conditions']
+        self.market_activity         = trader_data['market_activity']
+        self.trade_recorder          = trader_data['trade_recorder']
+        self.trade_totals            = trader_data['trade_totals']
+        self.state_data              = trader_data['state_data']
+
+
+    def get_trader_data(self):
+        return(self.trader_data)
+
+
+class Shard(object):
+    ''' Parent side of a shard process. '''
+    def __init__(self, shard_id, markets, process, connection):
+        self.shard_id   = shard_id
+        self.markets    = markets
+        self.process    = process
+        self.connection = connection
+        self.ready      = threading.Event()
+        self.lock       = threading.Lock()
+        self.request_id = 0
+        self.pending    = {}
+
+
+    def call(self, method, *args):
+        ''' Call a BotCore method within the shard, returns None if the shard does not answer in time. '''
+        with self.lock:
+            self.request_id += 1
+            request_id = self.request_id
+            pending = {'done':threading.Event(), 'result':None}
+            self.pending.update({request_id:pending})
+            try:
+                self.connection.send(('call', request_id, method, args))
+            except (BrokenPipeError, OSError):
+                del self.pending[request_id]
+                return(None)
+
+        if not(pending['done'].wait(CALL_TIMEOUT)):
+            logging.warning('[ShardedCore] Shard {0} did not answer {1}.'.format(self.shard_id, method))
+        with self.lock:
+            self.pending.pop(request_id, None)
+        return(pending['result'])
+
+
+    def reply(self, request_id, result):
+        with self.lock:
+            pending = self.pending.get(request_id)
+        if pending:
+            pending['result'] = result
+            pending['done'].set()
+
+
+    def send(self, *message):
+        with self.lock:
+            self.connection.send(message)
+
+
+class ShardedCore(object):
+    '''
+    Runs the traders across shard processes so they are not bound to a single core by the GIL.
+    -> Each shard is a BotCore (own REST rate limit share, sockets, notifier and worker pool) for a round robin slice of the markets.
+    -> Shards report their changed trader data over a pipe, the parent keeps a TraderView per market for the web UI.
+    -> The parent owns the trader state cache and trade journal, shards send their fills and round trips to it.
+    -> Web API calls that need live trader objects (candles, indicators, stats, actions) are forwarded to the owning shard.
+    '''
+    def __init__(self, settings, logs_dir, cache_dir, shard_count):
+        logging.info('[ShardedCore] Initilizing the sharded core with {0} processes.'.format(shard_count))
+
+        self.settings           = settings
+        self.logs_dir           = logs_dir
+        self.cache_dir          = cache_dir
+        self.shard_count        = min(shard_count, len(settings['trading_markets']))
+        self.latency_log        = settings['latency_log']
+        self.trading_markets    = settings['trading_markets']
+
+        ## The parent owns the trader state cache and the journal, the trade history database is shared (sqlite handles the locking).
+        self.state_store        = trader_store.TraderStateStore(cache_dir)
+        self.history_store      = trade_history.TradeHistory(os.path.join(cache_dir, trade_history.HISTORY_FILE))
+        self.trade_journal      = trade_journal.TradeJournal(os.path.join(logs_dir, trade_journal.JOURNAL_FILE), settings['journal_fsync'])
+
+        self.shards             = []
+        self.market_shards      = {}
+        ## Views are added as their first report arrives, keep them in the settings order.
+        self.market_registry    = market_registry.MarketRegistry(self.trading_markets)
+        self.market_lock        = threading.Lock()
+        ## Rate limiter counters last pushed by each shard (by shard id).
+        self.rate_limit_stats   = {}
+        self.web_tracker        = web_delta.WebDeltaTracker()
+        self.lifecycle          = core_lifecycle.CoreLifecycle()
+
+
+    @property
+    def coreState(self):
+        return(self.lifecycle.state)
+
+
+    @property
+    def trader_objects(self):
+        return(self.market_registry.traders())
+
+
+    def start(self):
+        logging.info('[ShardedCore] Starting {0} shard processes.'.format(self.shard_count))
+        self.lifecycle.set_state('SETUP')
+
+        cached_traders_data = self.state_store.load()
+        self.trade_journal.start()
+
+        ## Spawn (rather than fork) so the shards never inherit the parents threads or sockets.
+        context = multiprocessing.get_context('spawn')
+
+        for shard_id in range(self.shard_count):
+            markets = self.trading_markets[shard_id::self.shard_count]
+
+            shard_settings = dict(self.settings)
+            shard_settings.update({
+                'trading_markets':markets,
+                'shard_processes':0,
+                'latency_log':False,
+                ## Only one shard keeps the account BNB topped up.
+                'update_bnb_balance':self.settings['update_bnb_balance'] and shard_id == 0})
+            cached_traders = [cached_trader for cached_trader in cached_traders_data if cached_trader['market'] in markets]
+
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(target=run_shard, name='Shard-{0}'.format(shard_id),
+                args=(shard_id, self.shard_count, shard_settings, self.logs_dir, self.cache_dir, child_connection, cached_traders))
+            process.start()
+            child_connection.close()
+
+            shard = Shard(shard_id, markets, process, parent_connection)
+            self.shards.append(shard)
+            for market in markets:
+                self.market_shards.update({market:shard})
+            self.lifecycle.start_thread('ShardReader-{0}'.format(shard_id), lambda shard=shard: self._shard_reader(shard))
+
+        for shard in self.shards:
+            if not(shard.ready.wait(START_TIMEOUT)):
+                logging.warning('[ShardedCore] Shard {0} did not start within {1}s.'.format(shard.shard_id, START_TIMEOUT))
+
+        self.lifecycle.start_thread('FileManager', self._file_manager)
+
+        logging.info('[ShardedCore] ShardedCore successfully started.')
+        self.lifecycle.set_state('RUN')
+
+
+    def stop(self, timeout=core_lifecycle.STOP_TIMEOUT):
+        ''' Stop the shards (each cleanly stops its traders) then write the final cache. '''
+        if not(self.lifecycle.set_state('STOP')):
+            return(False)
+        logging.info('[ShardedCore] Stopping the ShardedCore object.')
+
+        for shard in self.shards:
+            try:
+                shard.send('stop')
+            except (BrokenPipeError, OSError):
+                pass
+
+        ## Shards stop their own traders within their stop timeout, so are given that on top of the timeout.
+        deadline = time.time()+timeout+core_lifecycle.STOP_TIMEOUT
+        for shard in self.shards:
+            shard.process.join(max(0, deadline-time.time()))
+            if shard.process.is_alive():
+                logging.warning('[ShardedCore] Shard {0} did not stop, terminating it.'.format(shard.shard_id))
+                shard.process.terminate()
+
+        ## Once the shard readers have drained the pipes the final fills/round trips are written.
+        alive = self.lifecycle.join(timeout)
+        self.state_store.sync(self.trader_objects)
+        self.state_store.close()
+        self.history_store.close()
+        self.trade_journal.stop(core_lifecycle.STOP_TIMEOUT)
+
+        logging.info('[ShardedCore] ShardedCore stopped.')
+        return(len(alive) == 0)
+
+
+    def _shard_reader(self, shard):
+        ''' Handle the messages sent by a shard until its pipe is closed. '''
+        while True:
+            try:
+                message = shard.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            kind = message[0]
+            try:
+                if kind == 'traders':
+                    for trader_data in message[1]:
+                        self._update_view(pickle.loads(trader_data))
+                elif kind == 'fill':
+                    self.state_store.record_fill(*message[1:])
+                elif kind == 'journal':
+                    self.trade_journal.record(*message[1:])
+                elif kind == 'rate_limit_stats':
+                    self.rate_limit_stats.update({shard.shard_id:message[1]})
+                elif kind == 'reply':
+                    shard.reply(*message[1:])
+                elif kind == 'ready':
+                    shard.ready.set()
+            except Exception as error:
+                logging.exception('[ShardedCore] Failed to handle {0} from shard {1}: {2}'.format(kind, shard.shard_id, error))
+
+        shard.ready.set()
+        self.rate_limit_stats.pop(shard.shard_id, None)
+        if not(self.lifecycle.is_stopping()):
+            logging.critical('[ShardedCore] Shard {0} exited unexpectedly (markets: {1}).'.format(shard.shard_id, ', '.join(shard.markets)))
+
+
+    def _update_view(self, trader_data):
+        market = trader_data['market']
+        view = self.market_registry.get(market)
+        if view == None:
+            ## A report sent before the market was removed.
+            if not(market in self.market_shards):
+                return
+            view = TraderView(market)
+            self.market_registry.add(view)
+        view.update(trader_data)
+
+
+    def _file_manager(self):
+        ''' Sync the trader cache from the reported trader data (the shards send their fills as they happen, the final sync is done by stop). '''
+        while not(self.lifecycle.wait(15)):
+            self.state_store.sync(self.trader_objects)
+
+            if self.latency_log and os.path.exists(self.logs_dir):
+                file_path = '{0}{1}'.format(self.logs_dir, LATENCY_LOG_FILE)
+                with open(file_path, 'w') as f:
+                    json.dump({'lastUpdateTime':time.time(), 'data':self.get_latency_stats()}, f)
+
+
+    def _call_market(self, market, method, *args):
+        shard = self.market_shards.get(market)
+        return(None if shard == None else shard.call(method, market, *args))
+
+
+    def _call_all(self, method, *args):
+        return([shard.call(method, *args) for shard in self.shards])
+
+
+    def trader_action(self, market, action):
+        return(bool(self._call_market(market, 'trader_action', action)))
+
+
+    def add_market(self, market):
+        ''' Add a market to the shard running the fewest markets. '''
+        if self.coreState != 'RUN':
+            return(False, 'CORE_NOT_RUNNING')
+
+        with self.market_lock:
+            if market in self.market_shards:
+                return(False, 'MARKET_EXISTS')
+
+            shard = min(self.shards, key=lambda shard: len(shard.markets))
+            added, message = shard.call('add_market', market) or (False, 'SHARD_TIMEOUT')
+            if added:
+                shard.markets.append(market)
+                self.market_shards.update({market:shard})
+                self.trading_markets = self.trading_markets+[market]
+        return(added, message)
+
+
+    def remove_market(self, market):
+        with self.market_lock:
+            shard = self.market_shards.get(market)
+            if shard == None:
+                return(False, 'INVALID_TRADER')
+
+            removed, message = shard.call('remove_market', market) or (False, 'SHARD_TIMEOUT')
+
+            ## The shard no longer holds the market (its set up failed), drop it so it can be added again.
+            if removed or message == 'INVALID_TRADER':
+                shard.markets.remove(market)
+                self.market_shards.pop(market)
+                self.market_registry.remove(market)
+                self.trading_markets = [trading_market for trading_market in self.trading_markets if trading_market != market]
+        return(removed, message)
+
+
+    def get_chart_data(self, market, kind, limit=None, since=None, before=None, encoding='json'):
+        ## Encoded (and cached) in the shard so only the response bytes cross the pipe.
+        return(self._call_market(market, 'get_chart_data', kind, limit, since, before, encoding))
+
+
+    def get_trader_candles(self, market, limit=None):
+        return(self._call_market(market, 'get_trader_candles', limit) or [])
+
+
+    def get_order_book(self, market, bps, size=None):
+        return(self._call_market(market, 'get_order_book', bps, size))
+
+
+    def get_latency_stats(self, market=None):
+        if market != None:
+            return(self._call_market(market, 'get_latency_stats') or {})
+        return(_merge_markets(self._call_all('get_latency_stats')))
+
+
+    def get_indicator_cache_stats(self, market=None):
+        if market != None:
+            return(self._call_market(market, 'get_indicator_cache_stats') or {})
+        return(_merge_markets(self._call_all('get_indicator_cache_stats')))
+
+
+    def get_scheduler_stats(self):
+        shard_stats = [stats for stats in self._call_all('get_scheduler_stats') if stats != None]
+        return(_merge_stats(shard_stats) if shard_stats else None)
+
+
+    def get_rate_limit_stats(self):
+        ''' Merged from the counters the shards push with their reports (no round trip to the shards). '''
+        return(_merge_stats(list(self.rate_limit_stats.values())))
+
+
+    def get_startup_stats(self):
+        ''' The shards start in parallel so their timings are given per shard. '''
+        return({'shard_{0}'.format(shard_id):stats for shard_id, stats in enumerate(self._call_all('get_startup_stats'))})
+
+
+    def get_order_gateway_stats(self):
+        ''' Counters are summed, the latency stats can not be merged so are given per shard. '''
+        shard_stats = [stats or {} for stats in self._call_all('get_order_gateway_stats')]
+        ack_latency = {'shard_{0}'.format(shard_id):stats.pop('ack_latency', {}) for shard_id, stats in enumerate(shard_stats)}
+        gateway_stats = _merge_stats(shard_stats)
+        gateway_stats.update({'ack_latency':ack_latency})
+        return(gateway_stats)
+
+
+def run_shard(shard_id, shard_count, settings, logs_dir, cache_dir, connection, cached_traders):
+    ''' Entry point of a shard process, runs a BotCore for the shards markets until the parent stops it. '''
+    ## botCore imports this module so it is imported here.
+    from . import botCore
+
+    ## Interrupts go to the whole process group, the parent decides when the shards stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    logging.info('[Shard-{0}] Starting shard for {1} markets.'.format(shard_id, len(settings['trading_markets'])))
+    shard_link = ShardLink(shard_id, shard_count, connection, cached_traders)
+    core = botCore.BotCore(settings, logs_dir, cache_dir, shard_link=shard_link)
+    core.start()
+
+    shard_link.send('ready')
+    shard_link.serve(core)
+
+    core.stop()
+    connection.close()
+
+
+def _merge_markets(shard_results):
+    merged = {}
+    for result in shard_results:
+        merged.update(result or {})
+    return(merged)
+
+
+def _merge_stats(shard_stats):
+    ''' Sum the numeric stats of each shard (nested dicts are merged the same way). '''
+    merged = {}
+    for stats in shard_stats:
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                merged[key] = _merge_stats([merged.get(key, {}), value])
+            elif isinstance(value, (int, float)) and not(isinstance(value, bool)):
+                merged[key] = max(merged.get(key, 0), value) if key in MAX_STATS else merged.get(key, 0)+value
+            else:
+                merged[key] = value
+    return(merged)
@@ -0,0 +1,67 @@
+#! /usr/bin/env python3
+import time
+import threading
+import contextlib
+
+## Number of the slowest markets listed in the startup stats.
+SLOWEST_MARKETS = 5
+
+
+class StartupTimer(object):
+    '''
+    Times the phases of a core start and when each markets trader was started.
+    -> Phases may overlap (they are run concurrently) so each is reported with its start offset and duration.
+    -> All times are in seconds from when the timer was created.
+    '''
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.markets = {}
+        self.total = None
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases.update({name:{
+                    'start':phase_start-self.start_time,
+                    'elapsed':time.perf_counter()-phase_start}})
+
+
+    def timed(self, name, function, *args):
+        ''' Run a function as a phase (for use with an executor), returns its result. '''
+        with self.phase(name):
+            return(function(*args))
+
+
+    def market_started(self, market):
+        with self.lock:
+            self.markets.update({market:time.perf_counter()-self.start_time})
+
+
+    def finish(self):
+        self.total = time.perf_counter()-self.start_time
+
+
+    def get_stats(self):
+        with self.lock:
+            started = sorted(self.markets.items(), key=lambda market: market[1])
+            return({
+                'total':self.total,
+                'phases':{name:dict(phase) for name, phase in sorted(self.phases.items(), key=lambda phase: phase[1]['start'])},
+                'markets_started':len(started),
+                'first_market':started[0][1] if started else None,
+                'last_market':started[-1][1] if started else None,
+                'slowest_markets':dict(started[:-SLOWEST_MARKETS-1:-1])})
+
+
+    def summary(self):
+        ''' One line summary for the logs. '''
+        stats = self.get_stats()
+        phases = ', '.join(['{0} {1:.2f}s'.format(name, phase['elapsed']) for name, phase in stats['phases'].items()])
+        return('{0:.2f}s ({1}), {2} traders started'.format(stats['total'] or 0, phases, stats['markets_started']))
@@ -84,6 +84,53 @@ function initial_build(target_element, charting_data) {
 }
 
 
+function decode_chart_data(buffer) {
+    // Decode a binary chart response (magic, uint32 header length, json header, float64 rows) into the json layout.
+    var view = new DataView(buffer);
+    if (buffer.byteLength < 8 || new TextDecoder().decode(buffer.slice(0, 4)) != 'SBTC') {
+        return(null);
+    }
+
+    var header_length = view.getUint32(4, true);
+    var header = JSON.parse(new TextDecoder().decode(buffer.slice(8, 8+header_length)));
+    var chart_data = {'market':header['market'], 'cursor':header['cursor'], 'before':header['before'], 'indicators':{}};
+    var offset = 8+header_length;
+
+    for (var i=0; i < header['series'].length; i++) {
+        var series = header['series'][i];
+        var columns = series['columns'];
+        var values = new Float64Array(buffer.slice(offset, offset+(series['rows']*columns.length*8)));
+        var rows = [];
+        offset += values.byteLength;
+
+        for (var r=0; r < series['rows']; r++) {
+            var row = Array.from(values.subarray(r*columns.length, (r+1)*columns.length));
+            if (series['group'] == 'candles' || columns.length == 2) {
+                rows.push(row);
+            } else {
+                var named_values = {};
+                for (var c=1; c < columns.length; c++) {
+                    named_values[columns[c]] = row[c];
+                }
+                rows.push([row[0], named_values]);
+            }
+        }
+
+        if (series['group'] == 'candles') {
+            chart_data['candles'] = rows;
+        } else if (series['name'] == null) {
+            chart_data['indicators'][series['group']] = rows;
+        } else {
+            if (!(series['group'] in chart_data['indicators'])) {
+                chart_data['indicators'][series['group']] = {};
+            }
+            chart_data['indicators'][series['group']][series['name']] = rows;
+        }
+    }
+    return(chart_data);
+}
+
+
 function build_candle_data(candle_data) {
     var built_candle_data = [];
     var built_volume_data = [];
@@ -18,14 +18,73 @@ const class_data_mapping = {
 var current_chart = '';
 var update_chart = false;
 
+// Trader state held client side, kept up to date by merging the deltas sent by the server.
+var traders_state = {};
+
 
 $(document).ready(function() {
     socket.on('current_traders_data', function(data) {
-        update_trader_results(data);
+        // Full snapshot (sent on connect or when requested).
+        traders_state = {};
+        for (x = 0; x < (data['data'].length); x++){
+            traders_state[data['data'][x]['market']] = data['data'][x];
+        }
+        render_traders_state();
+    });
+
+    socket.on('rate_limit_stats', function(data) {
+        update_rate_limit_stats(data['data']);
+    });
+
+    socket.on('traders_data_delta', function(data) {
+        if (merge_trader_deltas(data['data'])) {
+            render_traders_state();
+        } else {
+            // A version was missed so ask for a full snapshot.
+            socket.emit('request_snapshot');
+        }
     });
 });
 
 
+function merge_trader_deltas(deltas) {
+    // Merge the changed fields/new trades into the held state, returns false if a delta is out of sequence.
+    for (x = 0; x < (deltas.length); x++){
+        var delta = deltas[x];
+        var current = traders_state[delta['market']];
+
+        if (current === undefined) {
+            if (delta['version'] != 1) {
+                return(false);
+            }
+            current = {'market':delta['market'], 'version':0, 'trade_recorder':[]};
+            traders_state[delta['market']] = current;
+        }
+
+        if (delta['version'] != current['version']+1) {
+            return(false);
+        }
+
+        for (var key in delta['changed']) {
+            current[key] = delta['changed'][key];
+        }
+
+        if ('trade_recorder' in delta) {
+            current['trade_recorder'] = delta['trade_recorder'];
+        } else if ('new_trades' in delta) {
+            current['trade_recorder'] = current['trade_recorder'].concat(delta['new_trades']).slice(delta['drop_trades']);
+        }
+        current['version'] = delta['version'];
+    }
+    return(true);
+}
+
+
+function render_traders_state() {
+    update_trader_results({'data':Object.values(traders_state)});
+}
+
+
 function update_trader_results(data) {
     // 
     var currentTraders = data['data'];
@@ -42,6 +101,11 @@ function update_trader_results(data) {
             var trader_panel = document.getElementById(update_targets[i]);
             var target_el = null;
 
+            // Markets added/removed since the page was loaded have no panel.
+            if (trader_panel == null) {
+                continue;
+            }
+
             for (var key in class_data_mapping) {
                 target_el = trader_panel.getElementsByClassName(key);
                 if (target_el.length != 0) {
@@ -67,27 +131,9 @@ function update_trader_results(data) {
                 }
             }
 
-            var outcome = 0;
-            var total_trades = 0;
-            if (trade_recorder.length >= 2) {
-                range = trade_recorder.length/2
-                for (y = 0; y < (range); y++) {
-                    buy_order = trade_recorder[(range*2)-2]
-                    sell_order = trade_recorder[range*2-1]
-
-                    buy_value = buy_order[1]*buy_order[2]
-                    sell_value = sell_order[1]*buy_order[2]
-
-                    if (buy_order[3].includes("SHORT")) {
-                        outcome += buy_value-sell_value;
-                    } else {
-                        outcome += sell_value-buy_value;
-                    }
-                    total_trades += 1
-                }
-            }
-
-            var r_outcome = Math.round(outcome*100000000)/100000000;
+            // Totals over the full trade history (trade_recorder only holds the newest trades).
+            var total_trades = current['round_trips'];
+            var r_outcome = Math.round(current['total_outcome']*100000000)/100000000;
 
             target_el = trader_panel.getElementsByClassName('trader-trades')[0];
             target_el.innerText = total_trades;
@@ -116,6 +162,18 @@ function update_trader_results(data) {
 }
 
 
+function update_rate_limit_stats(stats) {
+    // Show the REST rate limiter counters within the overview.
+    var overview_section = document.getElementById('trader_Overview');
+
+    overview_section.getElementsByClassName('overview-apiweight')[0].innerText = `${stats['weight_used']}/${stats['weight_limit']}`;
+    overview_section.getElementsByClassName('overview-apiorders')[0].innerText = `${stats['orders_used']}/${stats['order_limit']}`;
+    overview_section.getElementsByClassName('overview-apiwaiting')[0].innerText = stats['waiting'];
+    overview_section.getElementsByClassName('overview-apicoalesced')[0].innerText = stats['coalesced'];
+    overview_section.getElementsByClassName('overview-apithrottled')[0].innerText = stats['throttled'];
+}
+
+
 function hide_section(e, section_id){
 
     var section_el = document.getElementsByTagName('section');
@@ -143,8 +201,53 @@ function pause_trader(e, market_pair){
 }
 
 
+function add_market(e){
+    e.preventDefault();
+    var market_pair = document.getElementById('add_market_input').value.trim().toUpperCase();
+    rest_api('POST', 'market_update', {'action':'add', 'market':market_pair}, reload_markets);
+}
+
+
+function remove_market(e, market_pair){
+    e.preventDefault();
+    rest_api('POST', 'market_update', {'action':'remove', 'market':market_pair}, reload_markets);
+}
+
+
+function reload_markets(resp_data){
+    // The market panels are built with the page so reload it once the markets change.
+    if (resp_data['call']) {
+        location.reload();
+    } else {
+        alert(resp_data['message']);
+    }
+}
+
+
 function build_chart(market_pair, element){
-    rest_api('GET', `get_trader_charting?market=${market_pair}&limit=200`, null, initial_build, element);
+    rest_api_binary(`get_trader_charting?market=${market_pair}&limit=200&format=binary`, initial_build, element);
+}
+
+
+function rest_api_binary(endpoint, target_function, target_element){
+    // GET a binary encoded chart endpoint and pass the decoded data on (errors are still sent as json).
+    let request = new XMLHttpRequest();
+    request.open('GET', '/rest-api/v1/'+endpoint, true);
+    request.responseType = 'arraybuffer';
+
+    request.onload = function() {
+        if (this.status == 200){
+            var chart_data = decode_chart_data(request.response);
+            if (chart_data == null) {
+                console.log(JSON.parse(new TextDecoder().decode(request.response)));
+            } else {
+                target_function(target_element, chart_data);
+            }
+        } else {
+            console.log(`error ${request.status} ${request.statusText}`);
+        }
+    }
+    request.send();
 }
 
 
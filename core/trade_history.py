@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+import sqlite3
+import logging
+import threading
+
+## Trade history database file name (placed in the cache directory).
+HISTORY_FILE = 'trade_history.db'
+
+## Number of the newest trades each trader keeps in memory (kept even so buy/sell pairs stay aligned).
+RECENT_TRADES = 100
+
+## Max number of trades returned by a single query.
+MAX_QUERY_LIMIT = 1000
+
+
+class TradeHistory(object):
+    '''
+    Append only store of every completed trade (SQLite).
+    -> Trades are stored as rows of [time, price, quantity, description, side] per market.
+    -> The (market, time) index keeps range queries independent of the total history size.
+    '''
+    def __init__(self, db_path):
+        logging.info('[TradeHistory] Initilizing trade history store.')
+
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS trades (
+                id INTEGER PRIMARY KEY,
+                market TEXT NOT NULL,
+                time REAL NOT NULL,
+                price REAL NOT NULL,
+                quantity REAL NOT NULL,
+                description TEXT,
+                side TEXT NOT NULL)''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS trades_market_time ON trades (market, time)')
+            self.connection.commit()
+
+
+    def append(self, market, trade):
+        ''' Append a completed trade for a market. '''
+        self.extend(market, [trade])
+
+
+    def extend(self, market, trades):
+        ''' Append several completed trades for a market in one transaction. '''
+        with self.lock:
+            self.connection.executemany(
+                'INSERT INTO trades (market, time, price, quantity, description, side) VALUES (?, ?, ?, ?, ?, ?)',
+                [(market, trade[0], trade[1], trade[2], trade[3], trade[4]) for trade in trades])
+            self.connection.commit()
+
+
+    def query(self, market=None, start=None, end=None, side=None, limit=MAX_QUERY_LIMIT, offset=0, newest_first=False):
+        '''
+        Return trades oldest first (or newest first) as [time, price, quantity, description, side] lists.
+        -> start/end are inclusive trade times (in seconds), any filter left as None is not applied.
+        -> newest_first keeps the newest trades when more than limit match.
+        '''
+        conditions, parameters = self._build_conditions(market, start, end, side)
+        parameters += [min(limit, MAX_QUERY_LIMIT), offset]
+        order = 'time DESC, id DESC' if newest_first else 'time, id'
+
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT time, price, quantity, description, side FROM trades{0} ORDER BY {1} LIMIT ? OFFSET ?'.format(conditions, order),
+                parameters).fetchall()
+        return([list(row) for row in rows])
+
+
+    def count(self, market=None, start=None, end=None, side=None):
+        ''' Return the number of trades matching the filters. '''
+        conditions, parameters = self._build_conditions(market, start, end, side)
+
+        with self.lock:
+            return(self.connection.execute('SELECT COUNT(*) FROM trades{0}'.format(conditions), parameters).fetchone()[0])
+
+
+    def totals(self, market):
+        '''
+        Return the completed round trips of a market and their summed outcome {'round_trips', 'outcome'}.
+        -> Each SELL is paired with the trade before it (as trade_journal.round_trip_outcome does, SHORT outcomes are negated).
+        '''
+        with self.lock:
+            row = self.connection.execute('''SELECT COUNT(*), TOTAL((price-buy_price)*quantity*(CASE WHEN instr(buy_description, 'SHORT') THEN -1 ELSE 1 END))
+                FROM (SELECT side, price, quantity,
+                    LAG(price) OVER (ORDER BY time, id) AS buy_price,
+                    LAG(description) OVER (ORDER BY time, id) AS buy_description
+                    FROM trades WHERE market = ?)
+                WHERE side = 'SELL' AND buy_price IS NOT NULL''', [market]).fetchone()
+        return({'round_trips':row[0], 'outcome':row[1]})
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def _build_conditions(self, market, start, end, side):
+        conditions = []
+        parameters = []
+
+        for column, operator, value in (('market', '=', market), ('time', '>=', start), ('time', '<=', end), ('side', '=', side)):
+            if value != None:
+                conditions.append('{0} {1} ?'.format(column, operator))
+                parameters.append(value)
+
+        return((' WHERE '+' AND '.join(conditions)) if conditions else '', parameters)
+
+
+def trim_recent(trade_recorder, count=RECENT_TRADES):
+    ''' Drop the oldest trades (in buy/sell pairs) so no more than count (+1 for an open buy) are kept in memory. '''
+    excess = len(trade_recorder)-count
+    excess -= excess % 2
+    if excess > 0:
+        del trade_recorder[:excess]
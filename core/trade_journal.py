@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+import os
+import json
+import queue
+import logging
+import threading
+
+## Trade journal file name (placed in the logs directory).
+JOURNAL_FILE = 'trade_journal.jsonl'
+
+## When the journal is fsynced: after every record, after every written batch or left to the OS.
+FSYNC_POLICIES = ['always', 'batch', 'none']
+
+## Max number of records written per batch.
+BATCH_SIZE = 256
+
+## Max time a record waits before the writer flushes it (in seconds).
+FLUSH_INTERVAL = 1
+
+
+class TradeJournal(object):
+    '''
+    Asynchronous JSON lines journal of completed round trips.
+    -> record() only queues the entry, a background writer batches the writes to the file.
+    -> Each line holds the market, the buy/sell time/price/quantity/type and the outcome.
+    '''
+    def __init__(self, file_path, fsync_policy='batch', batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        logging.info('[TradeJournal] Initilizing trade journal ({0}).'.format(file_path))
+
+        if not(fsync_policy in FSYNC_POLICIES):
+            raise ValueError('Unknown fsync policy: {0}'.format(fsync_policy))
+
+        self.file_path      = file_path
+        self.fsync_policy   = fsync_policy
+        self.batch_size     = batch_size
+        self.flush_interval = flush_interval
+        self.queue          = queue.Queue()
+        self.writer_thread  = None
+        self.running        = False
+        self.written        = 0
+
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.writer_thread = threading.Thread(target=self._writer, name='TradeJournal', daemon=True)
+        self.writer_thread.start()
+
+
+    def stop(self, timeout=None):
+        ''' Stop the writer once every queued record has been written. '''
+        if not(self.running):
+            return
+        self.running = False
+        self.queue.put(None)
+        self.writer_thread.join(timeout)
+
+
+    def record(self, market, buy_trade, sell_trade):
+        ''' Queue a completed round trip from its buy and sell trade recorder entries (never blocks). '''
+        self.queue.put({
+            'market':market,
+            'buy_time':buy_trade[0],
+            'buy_price':buy_trade[1],
+            'buy_quantity':buy_trade[2],
+            'buy_type':buy_trade[3],
+            'sell_time':sell_trade[0],
+            'sell_price':sell_trade[1],
+            'sell_quantity':sell_trade[2],
+            'sell_type':sell_trade[3],
+            'outcome':round_trip_outcome(buy_trade, sell_trade)})
+
+
+    def _writer(self):
+        with open(self.file_path, 'a') as f:
+            stopping = False
+
+            while not(stopping):
+                try:
+                    batch = [self.queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if None in batch:
+                    stopping = True
+                    batch = [entry for entry in batch if entry != None]
+
+                for entry in batch:
+                    f.write(json.dumps(entry)+'\n')
+                    if self.fsync_policy == 'always':
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                f.flush()
+                if self.fsync_policy == 'batch':
+                    os.fsync(f.fileno())
+                self.written += len(batch)
+
+
+def round_trip_outcome(buy_trade, sell_trade):
+    ''' Outcome of a round trip from its trade recorder entries ((Sellprice - Buyprice) * tokensSold, negated for SHORT). '''
+    outcome = (sell_trade[1]-buy_trade[1])*sell_trade[2]
+    if 'SHORT' in str(buy_trade[3]):
+        return(-outcome)
+    return(outcome)
+
+
+def read_journal(file_path):
+    ''' Yield the journal records, a torn last line (crash mid write) is skipped. '''
+    if not(os.path.exists(file_path)):
+        return
+
+    with open(file_path, 'r') as f:
+        for line in f:
+            try:
+                yield(json.loads(line))
+            except ValueError:
+                logging.warning('[TradeJournal] Skipping unreadable journal line.')
+
+
+def aggregate_pnl(records):
+    '''
+    Build PnL statistics per market and over all markets.
+    -> round_trips, wins, losses, win_rate, total_outcome, average_outcome, best, worst and
+        max_drawdown (largest drop of the running outcome from its peak).
+    '''
+    markets = {}
+    overall = _new_stats()
+
+    for record in records:
+        stats = markets.setdefault(record['market'], _new_stats())
+        for target in (stats, overall):
+            _add_outcome(target, record['outcome'])
+
+    results = {market:_finish_stats(stats) for market, stats in markets.items()}
+    return({'markets':results, 'overall':_finish_stats(overall)})
+
+
+def _new_stats():
+    return({'round_trips':0, 'wins':0, 'losses':0, 'total_outcome':0.0, 'best':None, 'worst':None, 'peak':0.0, 'max_drawdown':0.0})
+
+
+def _add_outcome(stats, outcome):
+    stats['round_trips'] += 1
+    stats['wins'] += 1 if outcome > 0 else 0
+    stats['losses'] += 1 if outcome < 0 else 0
+    stats['total_outcome'] += outcome
+    stats['best'] = outcome if stats['best'] == None else max(stats['best'], outcome)
+    stats['worst'] = outcome if stats['worst'] == None else min(stats['worst'], outcome)
+    stats['peak'] = max(stats['peak'], stats['total_outcome'])
+    stats['max_drawdown'] = max(stats['max_drawdown'], stats['peak']-stats['total_outcome'])
+
+
+def _finish_stats(stats):
+    stats = dict(stats)
+    del stats['peak']
+    stats.update({
+        'win_rate':(stats['wins']/stats['round_trips']) if stats['round_trips'] else 0.0,
+        'average_outcome':(stats['total_outcome']/stats['round_trips']) if stats['round_trips'] else 0.0})
+    return(stats)
@@ -8,9 +8,18 @@ import datetime
 import threading
 import trader_configuration as TC
 
-MULTI_DEPTH_INDICATORS = ['ema', 'sma', 'rma']
+from . import candle_store
+from . import latency_stats
+from . import trade_history
+from . import trade_journal
+from . import fill_simulator
+from . import indicator_engine
+
 TRADER_SLEEP = 1
 
+# Max time the trader waits for its first market data before starting anyway (in seconds).
+READY_TIMEOUT = 60
+
 # Base commission fee with binance.
 COMMISION_FEE = 0.00075
 
@@ -54,7 +63,7 @@ TYPE_MARKET_EXTRA = {
 }
 
 class BaseTrader(object):
-    def __init__(self, quote_asset, base_asset, rest_api, socket_api=None, data_if=None):
+    def __init__(self, quote_asset, base_asset, rest_api, socket_api=None, data_if=None, notifier=None, scheduler=None, batch_evaluator=None, state_store=None, history_store=None, trade_journal=None, order_gateway=None, depth_stream=None, max_candles=candle_store.DEFAULT_CAPACITY):
         # Initilize the main trader object.
         symbol = '{0}{1}'.format(base_asset, quote_asset)
 
@@ -68,6 +77,7 @@ class BaseTrader(object):
         ## Sets the rest api that will be used by the trader.
         self.rest_api = rest_api
 
+        ## data_if must provide get_candle_data/get_depth_data as well as advance() and time() for the simulated clock.
         if socket_api == None and data_if == None:
             logging.critical('[BaseTrader][{0}] Initilization failed, bot must have either socket_api OR data_if set.'.format(self.print_pair))
             return
@@ -75,29 +85,71 @@ class BaseTrader(object):
         ## Setup socket/data interface.
         self.data_if = None
         self.socket_api = None
+        self.notifier = None
+
+        ## Scheduler used to run the trader on a shared worker pool (a dedicated thread is used if not set).
+        self.scheduler = scheduler
+
+        ## Evaluator used for batched (all market) condition checks.
+        self.batch_evaluator = batch_evaluator
+        self.cycle_lock = threading.Lock()
+
+        ## Store used to persist fills as they happen (optional).
+        self.state_store = state_store
+
+        ## Store holding the full trade history, when set only the newest trades are kept in trade_recorder.
+        self.history_store = history_store
+
+        ## Journal completed round trips are queued to (optional).
+        self.trade_journal = trade_journal
+
+        ## Running totals of every completed round trip (trade_recorder only holds the newest trades).
+        self.trade_totals = {'round_trips':0, 'outcome':0.0}
+
+        ## Gateway used to make real order calls off the trader thread (orders are placed inline if not set).
+        self.order_gateway = order_gateway
+        self.pending_order = None
 
         if socket_api:
             ### Setup socket for live market data trading.
             self.candle_enpoint = socket_api.get_live_candles
             self.depth_endpoint = socket_api.get_live_depths
             self.socket_api = socket_api
+
+            ### Use the local order book for depth data if one is kept for the market.
+            if depth_stream:
+                self.depth_endpoint = depth_stream.get_live_depths
+
+            ### Register with the notifier so the trader is only woken when its market data changes.
+            if notifier:
+                self.notifier = notifier
+                self.notifier.register(symbol, self.candle_enpoint, self.depth_endpoint, lambda: socket_api.socketBuffer, depth_pushed=depth_stream != None)
         else:
             ### Setup data interface for past historic trading.
             self.data_if = data_if
             self.candle_enpoint = data_if.get_candle_data
             self.depth_endpoint = data_if.get_depth_data
 
-        ## Setup the default path for the trader by market beeing traded.
-        self.orders_log_path = 'logs/order_{0}_log.txt'.format(symbol)
         self.configuration = {}
         self.market_prices = {}
         self.wallet_pair = None
         self.custom_conditional_data = {}
-        self.indicators = {}
+        self.candle_store = candle_store.CandleStore(max_candles)
+        self.indicator_engine = indicator_engine.IndicatorEngine(max_candles)
+        TC.setup_indicators(self.indicator_engine)
+        self.indicators = self.indicator_engine.indicators
         self.market_activity = {}
         self.trade_recorder = []
         self.state_data = {}
         self.rules = {}
+        self.tick_latency = 0.0
+        self.last_wallet_update_time = 0
+        self.main_thread = None
+        self.books_data = None
+        self.stage_timer = latency_stats.StageTimer()
+
+        ## Fills TEST orders against the held order book (slippage, partial fills and fees).
+        self.fill_simulator = fill_simulator.FillSimulator(COMMISION_FEE)
 
         logging.debug('[BaseTrader][{0}] Initilized trader object.'.format(self.print_pair))
 
@@ -135,22 +187,29 @@ class BaseTrader(object):
             If a recent, not closed traded is seen, or leftover currency on the account over the min to place order then set trader to sell automatically.
         
         ->  Start the trader thread. 
-            Once all is good the trader will then start the thread to allow for the market to be monitored.
+            Once all is good the trader will then be added to the scheduler (or start its own thread) to allow for the market to be monitored.
         '''
         logging.info('[BaseTrader][{0}] Starting the trader object.'.format(self.print_pair))
         sock_symbol = self.base_asset+self.quote_asset
 
-        if self.socket_api != None:
-            while True:
-                if self.socket_api.get_live_candles()[sock_symbol] and ('a' in self.socket_api.get_live_depths()[sock_symbol]):
-                    break
+        ## Wait for the market data to be ready without spinning.
+        if self.notifier:
+            if not(self.notifier.wait_ready(sock_symbol, READY_TIMEOUT)):
+                logging.warning('[BaseTrader][{0}] No market data after {1}s, starting anyway.'.format(self.print_pair, READY_TIMEOUT))
+        elif self.socket_api != None:
+            while not(self.socket_api.get_live_candles()[sock_symbol] and ('a' in self.depth_endpoint(sock_symbol))):
+                time.sleep(TRADER_SLEEP)
 
         self.state_data['runtime_state'] = 'SETUP'
         self.wallet_pair = wallet_pair
         self.state_data['base_currency'] = float(MAC)
 
-        ## Start the main of the trader in a thread.
-        threading.Thread(target=self._main).start()
+        ## Start the main of the trader on the shared worker pool or in its own thread.
+        if self.scheduler:
+            self.scheduler.add(self)
+        else:
+            self.main_thread = threading.Thread(target=self._main, name='Trader-{0}'.format(self.print_pair))
+            self.main_thread.start()
         return(True)
 
 
@@ -163,107 +222,193 @@ class BaseTrader(object):
         logging.debug('[BaseTrader][{0}] Stopping trader.'.format(self.print_pair))
 
         self.state_data['runtime_state'] = 'STOP'
+
+        if self.scheduler:
+            self.scheduler.remove(self)
         return(True)
 
 
+    def join(self, timeout=None):
+        ''' Wait for the trader thread to finish (only used when not run by the scheduler). '''
+        if self.main_thread:
+            self.main_thread.join(timeout)
+
+
     def _main(self):
         '''
-        Main body for the trader loop.
+        Main body for the trader loop (used when the trader is not run by the scheduler).
         -> Wait for candle data to be fed to trader.
-            Infinite loop to check if candle has been populated with data,
-        -> Call the updater.
-            Updater is used to re-calculate the indicators as well as carry out timed checks.
-        -> Call Order Manager.
-            Order Manager is used to check on currently PLACED orders.
-        -> Call Trader Manager.
-            Trader Manager is used to check the current conditions of the indicators then set orders if any can be PLACED.
+            Block on the notifier until the markets candle/depth data changes (or the heartbeat times out).
+        -> Run a trader cycle.
         '''
         sock_symbol = self.base_asset+self.quote_asset
-        last_wallet_update_time = 0
-
-        if self.configuration['trading_type'] == 'SPOT':
-            position_types = ['LONG']
-        elif self.configuration['trading_type'] == 'MARGIN':
-            position_types = ['LONG', 'SHORT']
 
         ## Main trader loop
         while self.state_data['runtime_state'] != 'STOP':
-            # Pull required data for the trader.
-            candles = self.candle_enpoint(sock_symbol)
-            books_data = self.depth_endpoint(sock_symbol)
-            self.indicators = TC.technical_indicators(candles)
-            indicators = self.strip_timestamps(self.indicators)
+            # Wait for new market data before running a cycle.
+            data_changed_at = None
+            if self.notifier:
+                data_changed_at = self.notifier.wait(sock_symbol)
+            elif self.data_if:
+                ### Historic data is stepped on as fast as possible and the trader stops once it runs out.
+                if not(self.data_if.advance()):
+                    self.state_data['runtime_state'] = 'STOP'
+            elif self.socket_api:
+                time.sleep(TRADER_SLEEP)
+
+            if self.state_data['runtime_state'] == 'STOP':
+                break
 
-            logging.debug('[BaseTrader] Collected trader data. [{0}]'.format(self.print_pair))
+            self._run_cycle(data_changed_at)
 
-            socket_buffer_symbol = None
-            if self.configuration['run_type'] == 'REAL':
 
-                if sock_symbol in self.socket_api.socketBuffer:
-                    socket_buffer_symbol = self.socket_api.socketBuffer[sock_symbol]
+    def _run_cycle(self, data_changed_at=None):
+        ''' Run a single pass of the trader (the cycle lock prevents the batch evaluator updating data mid cycle). '''
+        with self.cycle_lock:
+            ## Stopped while this cycle was waiting for the lock.
+            if self.state_data['runtime_state'] == 'STOP':
+                return
+            start_time = time.perf_counter()
+            self._trader_cycle(data_changed_at)
+            self.stage_timer.record('cycle', time.perf_counter()-start_time)
 
-                # get the global socket buffer and update the wallets for the used markets.
-                socket_buffer_global = self.socket_api.socketBuffer
-                if 'outboundAccountPosition' in socket_buffer_global:
-                    if last_wallet_update_time != socket_buffer_global['outboundAccountPosition']['E']:
-                        self.wallet_pair, last_wallet_update_time = self.update_wallets(socket_buffer_global)
-            
-            # Update martket prices with current data
-            if books_data != None:
-                self.market_prices = {
-                    'lastPrice':candles[0][4],
-                    'askPrice':books_data['a'][0][0],
-                    'bidPrice':books_data['b'][0][0]}
 
-            # Check to make sure there is enough crypto to place orders.
-            if self.state_data['runtime_state'] == 'PAUSE_INSUFBALANCE':
-                if self.wallet_pair[self.quote_asset][0] > self.state_data['base_currency']:
-                    self.state_data['runtime_state'] = 'RUN' 
+    def _update_market_data(self):
+        ''' Pull the newest candles/depth into the trader and update the indicators, returns False if data is missing. '''
+        sock_symbol = self.base_asset+self.quote_asset
 
-            if not self.state_data['runtime_state'] in ['STANDBY', 'FORCE_STANDBY', 'FORCE_PAUSE']:
-                ## Call for custom conditions that can be used for more advanced managemenet of the trader.
+        start_time = time.perf_counter()
+        self.candle_store.sync(self.candle_enpoint(sock_symbol))
+        self.books_data = self.depth_endpoint(sock_symbol)
+        fetch_time = time.perf_counter()
+        self.stage_timer.record('data_fetch', fetch_time-start_time)
 
-                for market_type in position_types:
-                    cp = self.market_activity
+        if len(self.candle_store) == 0 or not(self.books_data) or not('a' in self.books_data):
+            return(False)
 
-                    if cp['order_market_type'] != market_type and cp['order_market_type'] != None:
-                        continue
+        self.indicator_engine.update(self.candle_store)
+        self.stage_timer.record('indicators', time.perf_counter()-fetch_time)
+        return(True)
 
-                    ## For managing active orders.
-                    if socket_buffer_symbol != None or self.configuration['run_type'] == 'TEST':
-                        cp = self._order_status_manager(market_type, cp, socket_buffer_symbol)
 
-                    ## For checking custom conditional actions
-                    self.custom_conditional_data, cp = TC.other_conditions(
-                        self.custom_conditional_data, 
-                        cp,
-                        self.trade_recorder,
-                        market_type,
-                        candles,
-                        indicators, 
-                        self.configuration['symbol'])
+    def _trader_cycle(self, data_changed_at=None):
+        '''
+        Single pass of the trader.
+        -> Call the updater.
+            Updater is used to re-calculate the indicators as well as carry out timed checks.
+        -> Call Order Manager.
+            Order Manager is used to check on currently PLACED orders.
+        -> Call Trader Manager.
+            Trader Manager is used to check the current conditions of the indicators then set orders if any can be PLACED.
+        '''
+        sock_symbol = self.base_asset+self.quote_asset
 
-                    ## For managing the placement of orders/condition checking.
-                    if cp['can_order'] and self.state_data['runtime_state'] == 'RUN' and cp['market_status'] == 'TRADING':
-                        if cp['order_type'] == 'COMPLETE':
-                            cp['order_type'] = 'WAIT'
+        if self.configuration['trading_type'] == 'SPOT':
+            position_types = ['LONG']
+        elif self.configuration['trading_type'] == 'MARGIN':
+            position_types = ['LONG', 'SHORT']
 
-                        tm_data = self._trade_manager(market_type, cp, indicators, candles)
-                        cp = tm_data if tm_data else cp
+        # Pull required data for the trader.
+        if not(self._update_market_data()):
+            logging.debug('[BaseTrader] Market data not ready. [{0}]'.format(self.print_pair))
+            return
 
-                    if not cp['market_status']: 
-                        cp['market_status'] = 'TRADING'
+        candles = self.candle_store
+        books_data = self.books_data
+        indicators = self.indicator_engine.values
 
-                    self.market_activity = cp
+        logging.debug('[BaseTrader] Collected trader data. [{0}]'.format(self.print_pair))
 
-                    time.sleep(TRADER_SLEEP)
+        socket_buffer_symbol = None
+        if self.configuration['run_type'] == 'REAL':
 
-            current_localtime = time.localtime()
-            self.state_data['last_update_time'] = '{0}:{1}:{2}'.format(current_localtime[3], current_localtime[4], current_localtime[5])
+            if sock_symbol in self.socket_api.socketBuffer:
+                socket_buffer_symbol = self.socket_api.socketBuffer[sock_symbol]
 
-            if self.state_data['runtime_state'] == 'SETUP':
-                self.state_data['runtime_state'] = 'RUN'
+            # get the global socket buffer and update the wallets for the used markets.
+            socket_buffer_global = self.socket_api.socketBuffer
+            if 'outboundAccountPosition' in socket_buffer_global:
+                if self.last_wallet_update_time != socket_buffer_global['outboundAccountPosition']['E']:
+                    self.wallet_pair, self.last_wallet_update_time = self.update_wallets(socket_buffer_global)
         
+        # Update martket prices with current data
+        if books_data != None:
+            self.market_prices = {
+                'lastPrice':candles[0][4],
+                'askPrice':books_data['a'][0][0],
+                'bidPrice':books_data['b'][0][0]}
+
+        # Check to make sure there is enough crypto to place orders.
+        if self.state_data['runtime_state'] == 'PAUSE_INSUFBALANCE':
+            if self.wallet_pair[self.quote_asset][0] > self.state_data['base_currency']:
+                self.state_data['runtime_state'] = 'RUN' 
+
+        # Apply the result of an order sent through the gateway once it has been acknowledged.
+        if self.pending_order:
+            if self.pending_order['future'].done():
+                self.market_activity = self._reconcile_order(self.market_activity)
+        elif self.market_activity.get('order_status') == 'SUBMITTED':
+            # An order that was in flight when the trader was last stopped, its outcome is unknown.
+            logging.warning('[BaseTrader] {0} Order submission result lost, checking orders.'.format(self.print_pair))
+            self.market_activity['order_status'] = None
+            self.state_data['runtime_state'] = 'CHECK_ORDERS'
+
+        if not self.state_data['runtime_state'] in ['STANDBY', 'FORCE_STANDBY', 'FORCE_PAUSE']:
+            ## Call for custom conditions that can be used for more advanced managemenet of the trader.
+
+            for market_type in position_types:
+                cp = self.market_activity
+
+                if cp['order_market_type'] != market_type and cp['order_market_type'] != None:
+                    continue
+
+                ## For managing active orders.
+                if socket_buffer_symbol != None or self.configuration['run_type'] == 'TEST':
+                    stage_start = time.perf_counter()
+                    trade_count = len(self.trade_recorder)
+                    cp = self._order_status_manager(market_type, cp, socket_buffer_symbol)
+                    if self.state_store and len(self.trade_recorder) != trade_count:
+                        self.state_store.record_fill(self.print_pair, self.trade_recorder, cp)
+                    self.stage_timer.record('order_status_manager', time.perf_counter()-stage_start)
+
+                ## For checking custom conditional actions
+                stage_start = time.perf_counter()
+                self.custom_conditional_data, cp = TC.other_conditions(
+                    self.custom_conditional_data, 
+                    cp,
+                    self.trade_recorder,
+                    market_type,
+                    candles,
+                    indicators, 
+                    self.configuration['symbol'])
+                self.stage_timer.record('other_conditions', time.perf_counter()-stage_start)
+
+                ## For managing the placement of orders/condition checking.
+                if cp['can_order'] and self.state_data['runtime_state'] == 'RUN' and cp['market_status'] == 'TRADING':
+                    if cp['order_type'] == 'COMPLETE':
+                        cp['order_type'] = 'WAIT'
+
+                    stage_start = time.perf_counter()
+                    tm_data = self._trade_manager(market_type, cp, indicators, candles)
+                    self.stage_timer.record('trade_manager', time.perf_counter()-stage_start)
+                    cp = tm_data if tm_data else cp
+
+                if not cp['market_status']: 
+                    cp['market_status'] = 'TRADING'
+
+                self.market_activity = cp
+
+        if data_changed_at:
+            self.tick_latency = time.time()-data_changed_at
+            self.stage_timer.record('tick_to_decision', self.tick_latency)
+            logging.debug('[BaseTrader] Tick to decision latency {0:.6f}s. [{1}]'.format(self.tick_latency, self.print_pair))
+
+        current_localtime = time.localtime(self._now())
+        self.state_data['last_update_time'] = '{0}:{1}:{2}'.format(current_localtime[3], current_localtime[4], current_localtime[5])
+
+        if self.state_data['runtime_state'] == 'SETUP':
+            self.state_data['runtime_state'] = 'RUN'
+
 
     def _order_status_manager(self, market_type, cp, socket_buffer_symbol):
         '''
@@ -288,8 +433,8 @@ class BaseTrader(object):
                     active_trade = True
 
         else:
-            # Basic update for test orders.
-            if cp['order_status'] == 'PLACED':
+            # Basic update for test orders (partially filled test orders are locked like real ones).
+            if cp['order_status'] in ['PLACED', 'LOCKED']:
                 active_trade = True
                 order_seen = None
 
@@ -308,7 +453,11 @@ class BaseTrader(object):
                 print(order_seen)
 
             # Update order recorder.
-            self.trade_recorder.append([time.time(), cp['price'], token_quantity, cp['order_description'], cp['order_side']])
+            trade = [self._now(), cp['price'], token_quantity, cp['order_description'], cp['order_side']]
+            self.trade_recorder.append(trade)
+            if self.history_store:
+                self.history_store.append(self.print_pair, trade)
+                trade_history.trim_recent(self.trade_recorder)
             logging.info('[BaseTrader] Completed {0} order. [{1}]'.format(cp['order_side'], self.print_pair))
 
             if cp['order_side'] == 'BUY':
@@ -325,21 +474,18 @@ class BaseTrader(object):
                 # If the trader is trading margin and the runtype is real then repay any loans.
                 if self.configuration['trading_type']  == 'MARGIN':
                     if self.configuration['run_type'] == 'REAL' and cp['loan_cost'] != 0:
-                        loan_repay_result = self.rest_api.margin_accountRepay(asset=self.base_asset, amount=cp['loan_cost'])
+                        if self._use_gateway():
+                            self.order_gateway.submit('margin_repay', self.rest_api.margin_accountRepay, asset=self.base_asset, amount=cp['loan_cost'])
+                        else:
+                            loan_repay_result = self.rest_api.margin_accountRepay(asset=self.base_asset, amount=cp['loan_cost'])
 
-                # Format data to print it to a file.
-                trB = self.trade_recorder[-2]
-                trS = self.trade_recorder[-1]
+                self.trade_totals = {
+                    'round_trips':self.trade_totals['round_trips']+1,
+                    'outcome':self.trade_totals['outcome']+trade_journal.round_trip_outcome(self.trade_recorder[-2], self.trade_recorder[-1])}
 
-                buyTime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trB[0]))
-                sellTime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trS[0]))
-
-                outcome = ((trS[1]-trB[1])*trS[2])
-
-                trade_details = 'BuyTime:{0}, BuyPrice:{1:.8f}, BuyQuantity:{2:.8f}, BuyType:{3}, SellTime:{4}, SellPrice:{5:.8f}, SellQuantity:{6:.8f}, SellType:{7}, Outcome:{8:.8f}\n'.format(
-                    buyTime, trB[1], trB[2], trB[3], sellTime, trS[1], trS[2], trS[3], outcome) # (Sellprice - Buyprice) * tokensSold
-                with open(self.orders_log_path, 'a') as file:
-                    file.write(trade_details)
+                # Journal the completed round trip (written by the journals background writer).
+                if self.trade_journal:
+                    self.trade_journal.record(self.print_pair, self.trade_recorder[-2], self.trade_recorder[-1])
 
                 # Reset trader variables.
                 cp['market_status']     = 'COMPLETE_TRADE'
@@ -378,11 +524,7 @@ class BaseTrader(object):
                     elif order_seen['X'] == 'PARTIALLY_FILLED' and cp['order_status'] != 'LOCKED':
                         cp['order_status'] = 'LOCKED'
             else:
-                if market_type == 'LONG':
-                    trade_done = True if ((self.market_prices['lastPrice'] <= cp['price']) or (cp['order_type'] == 'MARKET')) else False
-                elif market_type == 'SHORT':
-                    trade_done = True if ((self.market_prices['lastPrice'] >= cp['price']) or (cp['order_type'] == 'MARKET')) else False
-                token_quantity = cp['tokens_holding']
+                cp, trade_done, token_quantity = self._check_test_order(side, market_type, cp)
 
         elif side == 'SELL':
             if self.configuration['run_type'] == 'REAL':
@@ -394,21 +536,37 @@ class BaseTrader(object):
                     elif order_seen['X'] == 'PARTIALLY_FILLED' and cp['order_status'] != 'LOCKED':
                         cp['order_status'] = 'LOCKED'
             else:
-                if market_type == 'LONG':
-                    if cp['order_type'] != 'STOP_LOSS_LIMIT':
-                        trade_done = True if ((self.market_prices['lastPrice'] >= cp['price']) or (self.market_prices['lastPrice'] >= cp['stopLimitPrice']) or (cp['order_type'] == 'MARKET')) else False
-                    else:
-                        trade_done = True if (self.market_prices['lastPrice'] <= cp['price']) else False
-
-                elif market_type == 'SHORT':
-                    if cp['order_type'] != 'STOP_LOSS_LIMIT':
-                        trade_done = True if ((self.market_prices['lastPrice'] <= cp['price']) or (cp['order_type'] == 'MARKET')) else False
-                    else:
-                        trade_done = True if (self.market_prices['lastPrice'] >= cp['price']) else False
-                token_quantity = cp['tokens_holding']
+                cp, trade_done, token_quantity = self._check_test_order(side, market_type, cp)
         return(cp, trade_done, token_quantity)
 
 
+    def _check_test_order(self, side, market_type, cp):
+        ''' Update a test order using the fill simulator, the trade is done once the order is fully filled. '''
+        sim_order = self.fill_simulator.check(self.books_data, self.market_prices['lastPrice'])
+
+        if sim_order == None:
+            ## Order restored from the cache, place it again with the simulator.
+            sim_order = self.fill_simulator.place(self._exchange_side(market_type, side), cp['order_type'], cp['tokens_holding'],
+                price=cp['price'], books_data=self.books_data, last_price=self.market_prices['lastPrice'])
+            sim_order = self.fill_simulator.check(self.books_data, self.market_prices['lastPrice'])
+
+        if sim_order.status == 'FILLED':
+            cp['price'] = sim_order.effective_price
+            logging.debug('[BaseTrader] {0} Test order filled at {1:.8f} (fees {2:.8f}).'.format(self.print_pair, sim_order.effective_price, sim_order.fees))
+            return(cp, True, sim_order.filled)
+
+        if sim_order.status == 'PARTIALLY_FILLED' and cp['order_status'] != 'LOCKED':
+            cp['order_status'] = 'LOCKED'
+        return(cp, False, cp['tokens_holding'])
+
+
+    def _exchange_side(self, market_type, side):
+        ''' The side sent to the exchange (short orders are inverted). '''
+        if market_type == 'SHORT':
+            return('SELL' if side == 'BUY' else 'BUY')
+        return(side)
+
+
     def _trade_manager(self, market_type, cp, indicators, candles):
         ''' 
         Here both the sell and buy conditions are managed by the trader.
@@ -418,8 +576,8 @@ class BaseTrader(object):
 
         # Check for entry/exit conditions.
 
-        ## If order status is locked then return.
-        if cp['order_status'] == 'LOCKED':
+        ## If order status is locked or an order is still being submitted then return.
+        if cp['order_status'] in ['LOCKED', 'SUBMITTED']:
             return
 
         ## Select the correct conditions function dynamically.
@@ -436,7 +594,12 @@ class BaseTrader(object):
 
         # Check condition check results.
         logging.debug('[BaseTrader] Checking for {0} {1} condition. [{2}]'.format(cp['order_side'], market_type, self.print_pair))
-        new_order = current_conditions(self.custom_conditional_data, cp, indicators,  self.market_prices, candles, self.print_pair)
+        new_order = None
+        if self.batch_evaluator:
+            new_order = self.batch_evaluator.get_result(current_conditions.__name__, self.configuration['symbol'], candles)
+
+        if new_order == None:
+            new_order = current_conditions(self.custom_conditional_data, cp, indicators,  self.market_prices, candles, self.print_pair)
                 
         ## If no new order is returned then just return.
         if not(new_order):
@@ -481,68 +644,133 @@ class BaseTrader(object):
 
                 #### Cancel active order if one is placed.
                 if cp['order_id'] != None and new_order['order_type'] == 'WAIT':
-                    cancel_order_results = self._cancel_order(cp['order_id'], cp['order_type'])
+                    if self._use_gateway():
+                        self.order_gateway.submit('cancel_order', self._cancel_order, cp['order_id'], cp['order_type'])
+                    else:
+                        cancel_order_results = self._cancel_order(cp['order_id'], cp['order_type'])
                     cp['order_id'] = None
+                elif self.configuration['run_type'] == 'TEST':
+                    self.fill_simulator.cancel()
 
                 return(cp)
 
         # Place a new market order.
         if order:
+            if self._use_gateway():
+                ## Real orders (including any cancel of the current order) are sent through the gateway and reconciled once acknowledged.
+                activity = dict(cp)
+                self.pending_order = {
+                    'future':self.order_gateway.submit('place_order', self._place_order, market_type, activity, order, callback=self._order_done),
+                    'activity':activity,
+                    'order':order,
+                    'market_type':market_type,
+                    'previous_status':cp['order_status']}
+                cp['order_status'] = 'SUBMITTED'
+                return(cp)
+
+            stage_start = time.perf_counter()
             order_results = self._place_order(market_type, cp, order)
-            logging.info('order: {0}\norder result:\n{1}'.format(order, order_results))
-
-            # Error handle for binance related errors from order placement:
-            if 'code' in order_results['data']:
-                if order_results['data']['code'] == -2010:
-                    self.state_data['runtime_state'] = 'PAUSE_INSUFBALANCE'
-                elif order_results['data']['code'] == -2011:
-                    self.state_data['runtime_state'] = 'CHECK_ORDERS'
-                return
+            self.stage_timer.record('place_order', time.perf_counter()-stage_start)
+            return(self._apply_order_results(market_type, cp, order, order_results))
 
-            logging.info('[BaseTrader] {0} Order placed for {1}.'.format(self.print_pair, new_order['order_type']))
-            logging.info('[BaseTrader] {0} Order placement results:\n{1}'.format(self.print_pair, str(order_results['data'])))
 
-            if 'type' in order_results['data']:
-                if order_results['data']['type'] == 'MARKET':
-                    price1 = order_results['data']['fills'][0]['price']
-                else:
-                    price1 = order_results['data']['price']
-            else: price1 = None
-
-            # Set the price the order was placed at.
-            price2 = None
-            if 'price' in order:
-                price2 = float(order['price'])
-                if price1 == 0.0 or price1 == None: 
-                    order_price = price2
-                else: order_price = price1
-            else: order_price = price1
+    def _apply_order_results(self, market_type, cp, order, order_results):
+        ''' Update the market activity with the results of a placed order (returns None if the order failed). '''
+        logging.info('order: {0}\norder result:\n{1}'.format(order, order_results))
 
-            if 'stopPrice' in order:
-                cp['stopPrice'] == ['stopPrice']
+        # Error handle for binance related errors from order placement:
+        if 'code' in order_results['data']:
+            if order_results['data']['code'] == -2010:
+                self.state_data['runtime_state'] = 'PAUSE_INSUFBALANCE'
+            elif order_results['data']['code'] == -2011:
+                self.state_data['runtime_state'] = 'CHECK_ORDERS'
+            return
 
-            # Setup the test order quantity and setup margin trade loan.
-            if order['side'] == 'BUY':
-                cp['order_market_type'] = market_type
+        logging.info('[BaseTrader] {0} Order placed for {1}.'.format(self.print_pair, order['order_type']))
+        logging.info('[BaseTrader] {0} Order placement results:\n{1}'.format(self.print_pair, str(order_results['data'])))
 
-                if self.configuration['run_type'] == 'REAL':
-                    if self.configuration['trading_type'] == 'MARGIN' and 'loan_id' in order_results['data']:
-                        cp['loan_id'] = order_results['data']['loan_id'] 
-                        cp['loan_cost'] = order_results['data']['loan_cost']
-                else:
-                    cp['tokens_holding'] = order_results['data']['tester_quantity']
+        if 'type' in order_results['data']:
+            if order_results['data']['type'] == 'MARKET':
+                price1 = order_results['data']['fills'][0]['price']
+            else:
+                price1 = order_results['data']['price']
+        else: price1 = None
+
+        # Set the price the order was placed at.
+        price2 = None
+        if 'price' in order:
+            price2 = float(order['price'])
+            if price1 == 0.0 or price1 == None: 
+                order_price = price2
+            else: order_price = price1
+        else: order_price = price1
+
+        if 'stopPrice' in order:
+            cp['stopPrice'] == ['stopPrice']
+
+        # Setup the test order quantity and setup margin trade loan.
+        if order['side'] == 'BUY':
+            cp['order_market_type'] = market_type
 
-            # Update the live order id for real trades.
             if self.configuration['run_type'] == 'REAL':
-                cp['order_id'] = order_results['data']['orderId']
+                if self.configuration['trading_type'] == 'MARGIN' and 'loan_id' in order_results['data']:
+                    cp['loan_id'] = order_results['data']['loan_id'] 
+                    cp['loan_cost'] = order_results['data']['loan_cost']
+            else:
+                cp['tokens_holding'] = order_results['data']['tester_quantity']
+
+        # Update the live order id for real trades.
+        if self.configuration['run_type'] == 'REAL':
+            cp['order_id'] = order_results['data']['orderId']
+
+        cp['price']         = float(order_price)
+        cp['order_type']    = order['order_type']
+        cp['order_status']  = 'PLACED'
+
+        logging.info('type: {0}, status: {1}'.format(order['order_type'], cp['order_status']))
+        return(cp)
 
-            cp['price']         = float(order_price)
-            cp['order_type']    = new_order['order_type']
-            cp['order_status']  = 'PLACED'
 
-            logging.info('type: {0}, status: {1}'.format(new_order['order_type'], cp['order_status']))
+    def _reconcile_order(self, cp):
+        ''' Apply the acknowledged result of an order sent through the gateway to the market activity. '''
+        pending = self.pending_order
+        self.pending_order = None
+        cp['order_status'] = pending['previous_status']
+
+        ## The gateway cleared the order id of its copy if the current order was cancelled before the new one was placed.
+        cancelled = cp['order_id'] != None and pending['activity']['order_id'] == None
+
+        try:
+            order_results = pending['future'].result()
+        except Exception as error:
+            logging.warning('[BaseTrader] {0} Order submission failed: {1}'.format(self.print_pair, error))
+            if cancelled:
+                self._clear_order(cp)
+                self.state_data['runtime_state'] = 'CHECK_ORDERS'
             return(cp)
 
+        placed_cp = self._apply_order_results(pending['market_type'], cp, pending['order'], order_results)
+        if placed_cp == None and cancelled:
+            self._clear_order(cp)
+        return(placed_cp or cp)
+
+
+    def _clear_order(self, cp):
+        ''' Stop tracking the current order (it was cancelled). '''
+        cp['order_id']      = None
+        cp['order_status']  = None
+        cp['order_type']    = 'WAIT'
+
+
+    def _order_done(self, future):
+        ''' Called by the gateway once an order is acknowledged, wakes the trader to reconcile it. '''
+        if self.notifier:
+            self.notifier.notify(self.configuration['symbol'])
+
+
+    def _use_gateway(self):
+        return(self.order_gateway != None and self.configuration['run_type'] == 'REAL')
+
 
     def _place_order(self, market_type, cp, order):
         ''' place order '''
@@ -562,6 +790,8 @@ class BaseTrader(object):
             cancel_order_results = self._cancel_order(cp['order_id'], cp['order_type'])
             if 'code' in cancel_order_results:
                 return({'action':'ORDER_ISSUE', 'data':cancel_order_results})
+            ## The current order is gone, it must not be tracked if the new order is not placed.
+            self._clear_order(cp)
 
         ## Setup the quantity to be the correct precision.
         if quantity:
@@ -606,13 +836,21 @@ class BaseTrader(object):
                 return({'action':'PLACED_STOPLOSS_ORDER', 'data':rData})
 
         else:
+            ## Test orders are filled against the held order book by the fill simulator (market orders fill straight away).
+            sim_order = self.fill_simulator.place(self._exchange_side(market_type, order['side']), order['order_type'], float(f_quantity),
+                price=float(order['price']) if 'price' in order else None,
+                stop_price=float(order['stopPrice']) if 'stopPrice' in order else None,
+                stop_limit_price=float(order['stopLimitPrice']) if 'stopLimitPrice' in order else None,
+                books_data=self.books_data,
+                last_price=self.market_prices['lastPrice'])
+
             placed_order = {'type':'test', 'price':0, 'tester_quantity':float(f_quantity)}
             
             if order['order_type'] == 'OCO_LIMIT':
                 placed_order.update({'stopPrice':order['stopPrice'], 'stopLimitPrice':order['stopLimitPrice']})
 
             if order['order_type'] == 'MARKET':
-                placed_order.update({'price':self.market_prices['lastPrice']})
+                placed_order.update({'price':sim_order.effective_price or self.market_prices['lastPrice']})
             else:
                 placed_order.update({'price':order['price']})
 
@@ -632,6 +870,13 @@ class BaseTrader(object):
         return(True)
 
 
+    def _now(self):
+        ''' Current time, this is the simulated clock of the data interface when replaying historic data. '''
+        if self.data_if:
+            return(self.data_if.time())
+        return(time.time())
+
+
     def get_trader_data(self):
         ''' Access that is availble for the traders details. '''
         trader_data = {
@@ -642,28 +887,15 @@ class BaseTrader(object):
             'custom_conditions':self.custom_conditional_data,
             'market_activity':self.market_activity,
             'trade_recorder':self.trade_recorder,
+            'trade_totals':self.trade_totals,
             'state_data':self.state_data,
-            'rules':self.rules
+            'rules':self.rules,
+            'tick_latency':self.tick_latency
         }
 
         return(trader_data)
 
 
-    def strip_timestamps(self, indicators):
-
-        base_indicators = {}
-
-        for ind in indicators:
-            if ind in MULTI_DEPTH_INDICATORS:
-                base_indicators.update({ind:{}})
-                for sub_ind in indicators[ind]:
-                    base_indicators[ind].update({sub_ind:[ val[1] for val in indicators[ind][sub_ind] ]})
-            else:
-                base_indicators.update({ind:[ val[1] for val in indicators[ind] ]})
-
-        return(base_indicators)
-
-
     def update_wallets(self, socket_buffer_global):
         ''' Update the wallet data with that collected via the socket '''
         last_wallet_update_time = socket_buffer_global['outboundAccountPosition']['E']
@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+import time
+import logging
+import threading
+import collections
+
+## Default number of worker threads used to run trader cycles.
+DEFAULT_WORKERS = 4
+
+
+class TraderScheduler(object):
+    '''
+    Runs the cycles of many traders on a bounded pool of worker threads.
+    -> A trader is queued when its market data changes, a trader is never queued twice.
+    -> Updates that arrive while a trader is running are coalesced into one re-run which is
+        placed at the back of the queue so every market gets a fair turn.
+    '''
+    def __init__(self, workers=DEFAULT_WORKERS):
+        logging.info('[TraderScheduler] Initilizing the scheduler with {0} workers.'.format(workers))
+
+        self.worker_count   = workers
+        self.workers        = []
+        self.condition      = threading.Condition()
+        self.ready_queue    = collections.deque()
+        self.traders        = {}
+        self.running        = False
+
+        ## Counters used for monitoring.
+        self.busy_workers   = 0
+        self.max_queue_depth= 0
+        self.cycles_run     = 0
+        self.cycles_failed  = 0
+
+
+    def start(self):
+        ''' Start the worker threads. '''
+        if self.running:
+            return
+        self.running = True
+        for i in range(self.worker_count):
+            worker = threading.Thread(target=self._worker, name='TraderWorker-{0}'.format(i))
+            worker.start()
+            self.workers.append(worker)
+
+
+    def stop(self, timeout=None):
+        ''' Stop the workers once they have finished their current cycle. '''
+        with self.condition:
+            self.running = False
+            self.ready_queue.clear()
+            self.condition.notify_all()
+
+        ## The workers share one deadline.
+        deadline = None if timeout == None else time.time()+timeout
+        for worker in self.workers:
+            worker.join(None if deadline == None else max(0, deadline-time.time()))
+        self.workers = []
+
+
+    def add(self, trader):
+        ''' Add a trader to be run by the scheduler, it is woken via the notifier when its data changes. '''
+        symbol = trader.configuration['symbol']
+        with self.condition:
+            self.traders.update({symbol:{'trader':trader, 'queued':False, 'running':False, 'rerun':False, 'changed_at':None}})
+
+        if trader.notifier:
+            trader.notifier.set_callback(symbol, lambda changed_at: self.schedule(symbol, changed_at))
+        self.schedule(symbol, None)
+
+
+    def remove(self, trader):
+        ''' Remove a trader from the scheduler. '''
+        symbol = trader.configuration['symbol']
+        with self.condition:
+            if symbol in self.traders:
+                self.traders.pop(symbol)
+            if symbol in self.ready_queue:
+                self.ready_queue.remove(symbol)
+
+        if trader.notifier:
+            trader.notifier.set_callback(symbol, None)
+
+
+    def schedule(self, symbol, changed_at):
+        ''' Queue a trader to run a cycle. '''
+        with self.condition:
+            entry = self.traders.get(symbol)
+            if entry == None:
+                return
+
+            if changed_at and not(entry['changed_at']):
+                entry['changed_at'] = changed_at
+
+            if entry['running']:
+                entry['rerun'] = True
+            elif not(entry['queued']):
+                entry['queued'] = True
+                self.ready_queue.append(symbol)
+                self.max_queue_depth = max(self.max_queue_depth, len(self.ready_queue))
+                self.condition.notify()
+
+
+    def get_stats(self):
+        ''' Return the scheduler stats. '''
+        return({
+            'workers':self.worker_count,
+            'busy_workers':self.busy_workers,
+            'queue_depth':len(self.ready_queue),
+            'max_queue_depth':self.max_queue_depth,
+            'traders':len(self.traders),
+            'cycles_run':self.cycles_run,
+            'cycles_failed':self.cycles_failed})
+
+
+    def _worker(self):
+        ''' Worker loop pulling traders off the ready queue and running a single cycle. '''
+        while True:
+            with self.condition:
+                while self.running and not(self.ready_queue):
+                    self.condition.wait()
+
+                if not(self.running):
+                    return
+
+                symbol = self.ready_queue.popleft()
+                entry = self.traders.get(symbol)
+                if entry == None:
+                    continue
+
+                entry['queued'] = False
+                entry['running'] = True
+                changed_at = entry['changed_at']
+                entry['changed_at'] = None
+                self.busy_workers += 1
+
+            trader = entry['trader']
+            failed = False
+            try:
+                if trader.state_data['runtime_state'] != 'STOP':
+                    trader._run_cycle(changed_at)
+            except Exception as error:
+                failed = True
+                logging.exception('[TraderScheduler] Trader cycle failed for {0}: {1}'.format(trader.print_pair, error))
+
+            with self.condition:
+                self.busy_workers -= 1
+                self.cycles_run += 1
+                if failed:
+                    self.cycles_failed += 1
+                entry['running'] = False
+                if entry['rerun'] and self.running:
+                    entry['rerun'] = False
+                    entry['queued'] = True
+                    self.ready_queue.append(symbol)
+                    self.condition.notify()
@@ -0,0 +1,198 @@
+#! /usr/bin/env python3
+import os
+import copy
+import json
+import time
+import logging
+import threading
+
+from . import trade_history
+
+## Snapshot and write-ahead log file names (placed in the cache directory).
+SNAPSHOT_FILE = 'traders.json'
+WAL_FILE = 'traders.wal'
+
+## Size the write-ahead log can reach before it is compacted into the snapshot (in bytes).
+COMPACT_SIZE = 1024*1024
+
+## Trader state sections that are persisted (the trade recorder is persisted as appended trades, only the
+## newest are kept as the full history lives in the trade history store).
+STATE_SECTIONS = ['configuration', 'custom_conditions', 'market_activity', 'state_data']
+
+
+class TraderStateStore(object):
+    '''
+    Persists trader state as a snapshot plus a write-ahead log of changes.
+    -> Each log line is one JSON record {'seq', 'market', 'state':{changed sections}, 'trades':[new trades]}.
+    -> Fills are appended (and fsynced) as they happen, other state changes are appended on sync().
+    -> compact() writes a full snapshot to a temp file and renames it over the old one before the
+        log is truncated, the snapshot holds the last seq it includes so a crash between the two
+        steps never applies a record twice.
+    -> A torn last line (crash mid write) is dropped when the log is replayed.
+    '''
+    def __init__(self, cache_dir, compact_size=COMPACT_SIZE):
+        logging.info('[TraderStateStore] Initilizing trader state store.')
+
+        self.snapshot_path  = os.path.join(cache_dir, SNAPSHOT_FILE)
+        self.wal_path       = os.path.join(cache_dir, WAL_FILE)
+        self.compact_size   = compact_size
+        self.markets        = {}
+        self.seq            = 0
+        self.wal_file       = None
+        self.lock           = threading.RLock()
+
+
+    def load(self):
+        ''' Load the snapshot and replay the log, returns the cached traders in the traders.json data format. '''
+        with self.lock:
+            snapshot_seq = 0
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, 'r') as f:
+                    snapshot = json.load(f)
+                snapshot_seq = snapshot.get('walSeq', 0)
+                for trader_data in snapshot['data'] or []:
+                    self.markets.update({trader_data['market']:self._blank_state(trader_data)})
+            self.seq = snapshot_seq
+
+            replayed = 0
+            if os.path.exists(self.wal_path):
+                valid_size = 0
+                with open(self.wal_path, 'rb') as f:
+                    for line in f:
+                        ## A record missing its newline was cut off mid write even if what was written parses.
+                        try:
+                            if not(line.endswith(b'\n')):
+                                raise ValueError('Incomplete record')
+                            record = json.loads(line)
+                        except ValueError:
+                            logging.warning('[TraderStateStore] Dropping torn record at the end of the log.')
+                            break
+                        valid_size += len(line)
+
+                        if record['seq'] > snapshot_seq:
+                            self._apply(record)
+                            self.seq = record['seq']
+                            replayed += 1
+
+                ## Cut any torn record off so new records are not appended onto it.
+                if valid_size != os.path.getsize(self.wal_path):
+                    with open(self.wal_path, 'r+b') as f:
+                        f.truncate(valid_size)
+
+            logging.info('[TraderStateStore] Loaded {0} traders, replayed {1} log records.'.format(len(self.markets), replayed))
+            return(copy.deepcopy([self._trader_data(market) for market in self.markets]))
+
+
+    def record_fill(self, market, trade_recorder, market_activity):
+        ''' Append the trades not yet recorded with the market activity they left the trader in (fsynced). '''
+        with self.lock:
+            state = self._get_market(market)
+            trades = self._new_trades(state['trade_recorder'], trade_recorder)
+            market_activity = copy.deepcopy(market_activity)
+            state['market_activity'] = market_activity
+            self._add_trades(state, trades)
+            self._append({'market':market, 'state':{'market_activity':market_activity}, 'trades':trades}, sync=True)
+
+
+    def sync(self, traders):
+        ''' Append the sections (and any trades) of each trader that changed since they were last recorded. '''
+        with self.lock:
+            for trader_ in traders:
+                market = trader_.print_pair
+                state = self._get_market(market)
+                trader_data = trader_.get_trader_data()
+
+                changed = {}
+                for section in STATE_SECTIONS:
+                    if state[section] != trader_data[section]:
+                        value = copy.deepcopy(trader_data[section])
+                        state[section] = value
+                        changed.update({section:value})
+
+                trades = self._new_trades(state['trade_recorder'], trader_.trade_recorder)
+                if changed or trades:
+                    self._add_trades(state, trades)
+                    self._append({'market':market, 'state':changed, 'trades':trades})
+
+            if self.wal_file:
+                self.wal_file.flush()
+                if self.wal_file.tell() >= self.compact_size:
+                    self.compact()
+
+
+    def compact(self):
+        ''' Atomically replace the snapshot with the current state and truncate the log. '''
+        with self.lock:
+            temp_path = self.snapshot_path+'.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump({
+                    'lastUpdateTime':time.time(),
+                    'walSeq':self.seq,
+                    'data':[self._trader_data(market) for market in self.markets]}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+
+            if self.wal_file:
+                self.wal_file.close()
+            self.wal_file = open(self.wal_path, 'w')
+            logging.debug('[TraderStateStore] Compacted the log into the snapshot at seq {0}.'.format(self.seq))
+
+
+    def close(self):
+        ''' Compact and close the log. '''
+        with self.lock:
+            self.compact()
+            self.wal_file.close()
+            self.wal_file = None
+
+
+    def _append(self, record, sync=False):
+        if self.wal_file == None:
+            self.wal_file = open(self.wal_path, 'a')
+
+        self.seq += 1
+        record.update({'seq':self.seq})
+        self.wal_file.write(json.dumps(record)+'\n')
+
+        if sync:
+            self.wal_file.flush()
+            os.fsync(self.wal_file.fileno())
+
+
+    def _apply(self, record):
+        state = self._get_market(record['market'])
+        state.update(record.get('state', {}))
+        self._add_trades(state, record.get('trades', []))
+
+
+    def _new_trades(self, recorded, trade_recorder):
+        ''' Return the trades after the last recorded one (the trade recorder may have been trimmed since). '''
+        if recorded:
+            for index in range(len(trade_recorder)-1, -1, -1):
+                if trade_recorder[index] == recorded[-1]:
+                    return(trade_recorder[index+1:])
+        return(list(trade_recorder))
+
+
+    def _add_trades(self, state, trades):
+        state['trade_recorder'].extend([list(trade) for trade in trades])
+        trade_history.trim_recent(state['trade_recorder'])
+
+
+    def _get_market(self, market):
+        if not(market in self.markets):
+            self.markets.update({market:self._blank_state({'market':market})})
+        return(self.markets[market])
+
+
+    def _blank_state(self, trader_data):
+        state = {section:trader_data.get(section, {}) for section in STATE_SECTIONS}
+        state.update({'trade_recorder':list(trader_data.get('trade_recorder', []))})
+        return(state)
+
+
+    def _trader_data(self, market):
+        trader_data = {'market':market}
+        trader_data.update(self.markets[market])
+        return(trader_data)
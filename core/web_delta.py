@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+import copy
+import logging
+import threading
+
+
+class WebDeltaTracker(object):
+    '''
+    Tracks what has been sent to the web UI for each trader so only changes are broadcast.
+    -> Every market has a version counter, bumped each time a delta is produced for it.
+    -> Deltas hold only the fields that changed plus any trades appended since the last version
+        (traders only hold their newest trades, the number trimmed from the front is sent as drop_trades).
+    -> snapshot() returns the full state at the current versions (used when a client connects).
+    '''
+    def __init__(self):
+        logging.info('[WebDeltaTracker] Initilizing the web delta tracker.')
+
+        self.markets = {}
+        self.lock = threading.Lock()
+
+
+    def collect(self, traders):
+        ''' Compare each traders current data with what was last sent and return the deltas. '''
+        deltas = []
+
+        with self.lock:
+            active_markets = set()
+
+            for trader_ in traders:
+                market = trader_.print_pair
+                active_markets.add(market)
+                state = self.markets.get(market)
+                if state == None:
+                    state = {'version':0, 'fields':{}, 'trade_recorder':[]}
+                    self.markets.update({market:state})
+
+                changed = {}
+                for key, value in self._flatten(trader_).items():
+                    if not(key in state['fields']) or state['fields'][key] != value:
+                        value = copy.deepcopy(value)
+                        state['fields'][key] = value
+                        changed.update({key:value})
+
+                ## Only trades appended since the last update are sent, with the number of old trades trimmed
+                ## from the front of the recorder (a full resend if the last sent trade is no longer held).
+                delta = {}
+                trade_recorder = list(trader_.trade_recorder)
+                sent_trades = state['trade_recorder']
+                if trade_recorder != sent_trades:
+                    new_trades = None
+                    if sent_trades:
+                        for index in range(len(trade_recorder)-1, -1, -1):
+                            if trade_recorder[index] == sent_trades[-1]:
+                                new_trades = trade_recorder[index+1:]
+                                break
+
+                    if new_trades == None:
+                        delta.update({'trade_recorder':trade_recorder})
+                    else:
+                        delta.update({'new_trades':new_trades, 'drop_trades':len(sent_trades)+len(new_trades)-len(trade_recorder)})
+                    state['trade_recorder'] = trade_recorder
+
+                if changed or delta:
+                    state['version'] += 1
+                    delta.update({'market':market, 'version':state['version'], 'changed':changed})
+                    deltas.append(delta)
+
+            for market in set(self.markets)-active_markets:
+                del self.markets[market]
+
+        return(deltas)
+
+
+    def snapshot(self):
+        ''' Return the full state of every market as of its current version. '''
+        with self.lock:
+            snapshot_data = []
+            for market, state in self.markets.items():
+                trader_data = dict(state['fields'])
+                trader_data.update({
+                    'market':market,
+                    'version':state['version'],
+                    'trade_recorder':list(state['trade_recorder'])})
+                snapshot_data.append(trader_data)
+        return(snapshot_data)
+
+
+    def _flatten(self, trader_):
+        ''' Build the flat {field:value} view the web UI uses for a trader (excluding the trade recorder). '''
+        flat_data = {'wallet_pair':trader_.wallet_pair, 'round_trips':trader_.trade_totals['round_trips'], 'total_outcome':trader_.trade_totals['outcome']}
+        for section in (trader_.custom_conditional_data, trader_.market_activity, trader_.market_prices, trader_.state_data):
+            flat_data.update(section)
+        return(flat_data)
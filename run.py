@@ -45,6 +45,24 @@ HOST_PORT=
 # Configuration for the candle range and depth range (default if left bank is candles=500, Depth=50)
 MAX_CANDLES=
 MAX_DEPTH=
+
+# Number of worker threads shared by all of the traders, 0 runs each trader in its own thread (default if left blank is 4)
+TRADER_WORKERS=
+
+# Periodically dump the trader stage latency stats to logs/latency_stats.json (True/False).
+LATENCY_LOG=False
+
+# When the trade journal (logs/trade_journal.jsonl) is synced to disk: always, batch or none (default if left blank is batch).
+JOURNAL_FSYNC=
+
+# Number of worker processes the markets are sharded across, 0 runs everything in this process (default if left blank is 0).
+SHARD_PROCESSES=
+
+# Keep local order books from the 100ms diff depth stream instead of the 1000ms binance_api depth stream (True/False).
+LOCAL_ORDER_BOOK=False
+
+# Host of a local exchange simulator (see simulator.py) to trade against instead of Binance, leave blank for Binance.
+SIMULATOR_HOST=
 '''
 
 
@@ -52,7 +70,7 @@ def settings_reader():
     # Setting reader function to parse over the settings file and collect kv pairs.
 
     ## Setup settings file object with initial default variables.
-    settings_file_data = {'public_key':'', 'private_key':'', 'host_ip':'127.0.0.1', 'host_port':5000, 'max_candles':500,'max_depth':50}
+    settings_file_data = {'public_key':'', 'private_key':'', 'host_ip':'127.0.0.1', 'host_port':5000, 'max_candles':500,'max_depth':50, 'trader_workers':4, 'shard_processes':0, 'latency_log':False, 'journal_fsync':'batch', 'local_order_book':False, 'simulator_host':''}
 
     ## Read the settings file and extract the fields.
     with open(SETTINGS_FILE_NAME, 'r') as f:
@@ -93,6 +111,21 @@ def settings_reader():
             elif key == 'MAX_DEPTH':
                 data = int(data)
 
+            elif key == 'TRADER_WORKERS':
+                data = int(data)
+
+            elif key == 'SHARD_PROCESSES':
+                data = int(data)
+
+            elif key == 'LATENCY_LOG':
+                data = data.upper() == 'TRUE'
+
+            elif key == 'JOURNAL_FSYNC':
+                data = data.lower()
+
+            elif key == 'LOCAL_ORDER_BOOK':
+                data = data.upper() == 'TRUE'
+
             settings_file_data.update({key.lower():data})
 
     return(settings_file_data)
@@ -0,0 +1,50 @@
+#! /usr/bin/env python3
+import time
+import logging
+import argparse
+from core import exchange_simulator
+
+## Settup logging.
+log_format = '%(asctime)s:%(name)s:%(message)s'
+logging.basicConfig(
+    format=log_format,
+    level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a local stand in for the Binance exchange (REST + websockets) for load and latency testing.')
+    parser.add_argument('--markets', default='BTC-ETH,BTC-LTC', help='Markets to simulate in QUOTE-BASE format seperated by "," or a number of generated BTC markets.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--rest-port', type=int, default=exchange_simulator.REST_PORT)
+    parser.add_argument('--socket-port', type=int, default=exchange_simulator.SOCKET_PORT)
+    parser.add_argument('--depth-interval', type=float, default=exchange_simulator.DEPTH_INTERVAL, help='Seconds between depth updates for each market.')
+    parser.add_argument('--kline-interval', type=float, default=exchange_simulator.KLINE_INTERVAL, help='Seconds between kline updates for each market.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stats-interval', type=float, default=10, help='Seconds between printed stats.')
+    return(parser.parse_args())
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.markets.isdigit():
+        markets = ['BTC-SIM{0}'.format(i) for i in range(int(args.markets))]
+    else:
+        markets = args.markets.replace(' ', '').split(',')
+
+    simulator = exchange_simulator.ExchangeSimulator(markets, host=args.host, rest_port=args.rest_port, socket_port=args.socket_port,
+        depth_interval=args.depth_interval, kline_interval=args.kline_interval, seed=args.seed)
+    simulator.start()
+
+    print('Set SIMULATOR_HOST={0} (ports {1}/{2}) and TRADING_MARKETS={3} within settings.conf to trade against the simulator.'.format(
+        args.host, args.rest_port, args.socket_port, ','.join(markets)))
+
+    try:
+        while True:
+            time.sleep(args.stats_interval)
+            stats = simulator.exchange.get_stats()
+            latency = stats['tick_to_order']
+            print('Markets: {0} | Events sent: {1} | Orders: {2} | Open: {3} | Tick to order p50: {4:.2f}ms p99: {5:.2f}ms'.format(
+                stats['markets'], stats['events_sent'], stats['orders_placed'], stats['open_orders'], latency['p50']*1000, latency['p99']*1000))
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+import logging
+import argparse
+from core import backtester
+from core import param_sweep
+
+## Settup logging.
+log_format = '%(asctime)s:%(name)s:%(message)s'
+logging.basicConfig(
+    format=log_format,
+    level=logging.WARNING)
+
+
+def parse_value(value):
+    # Keep whole numbers as ints (periods) and everything else as floats.
+    return(int(value) if value.lstrip('-').isdigit() else float(value))
+
+
+def parse_space(params, use_ranges):
+    '''
+    Build the parameter space from name=values arguments.
+    -> Grid    : stop_loss=0.002,0.004,0.006
+    -> Random  : stop_loss=0.001:0.01 (low:high range) or a list of values to pick from.
+    '''
+    space = {}
+    for param in params:
+        name, values = param.split('=')
+        if use_ranges and ':' in values:
+            low, high = values.split(':')
+            space.update({name:(parse_value(low), parse_value(high))})
+        else:
+            space.update({name:[parse_value(value) for value in values.split(',')]})
+    return(space)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Sweep trader_configuration.py PARAMETERS over backtests on a process pool.')
+    parser.add_argument('file', help='Kline file (.csv, .npy, .parquet or a cache/klines .klines file) with [time, open, high, low, close, volume] rows.')
+    parser.add_argument('--param', action='append', default=[], help='Parameter values e.g. stop_loss=0.002,0.004 or macd_fast=8:16 with --random.')
+    parser.add_argument('--random', type=int, default=0, help='Number of random samples to draw instead of running the full grid.')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default is the cpu count).')
+    parser.add_argument('--top', type=int, default=20, help='Number of ranked results shown.')
+    parser.add_argument('--market', default='BTC-ETH', help='Market in QUOTE-BASE format (default BTC-ETH).')
+    parser.add_argument('--market-type', default='SPOT', choices=['SPOT', 'MARGIN'])
+    parser.add_argument('--currency', type=float, default=0.002)
+    parser.add_argument('--max-candles', type=int, default=500)
+    return(parser.parse_args())
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    space = parse_space(args.param, args.random > 0)
+    if args.random > 0:
+        param_sets = param_sweep.build_random(space, args.random, args.seed)
+    else:
+        param_sets = param_sweep.build_grid(space)
+
+    klines = backtester.load_klines(args.file)
+    sweep = param_sweep.ParameterSweep(args.market, klines, market_type=args.market_type, base_currency=args.currency,
+        max_candles=args.max_candles, workers=args.workers)
+    results = sweep.run(param_sets)
+
+    print(param_sweep.format_table(results, args.top))
+    print('Backtests: {0} | Workers: {1} | Time: {2:.2f}s'.format(len(results), sweep.workers, sweep.elapsed))
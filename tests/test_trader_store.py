@@ -0,0 +1,42 @@
+#! /usr/bin/env python3
+import os
+import shutil
+import tempfile
+import unittest
+
+from core import trader_store
+
+
+class TornLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+
+    def test_record_without_newline_is_dropped(self):
+        store = trader_store.TraderStateStore(self.cache_dir)
+        store.load()
+        store.record_fill('BTC-ETH', [[1, 0.5, 1.0, 'LONG']], {'order_side':'SELL'})
+        store.wal_file.close()
+
+        ## Crash after the record was written but before its newline.
+        wal_path = os.path.join(self.cache_dir, trader_store.WAL_FILE)
+        with open(wal_path, 'rb+') as f:
+            f.truncate(os.path.getsize(wal_path)-1)
+
+        store = trader_store.TraderStateStore(self.cache_dir)
+        self.assertEqual(store.load(), [])
+        store.record_fill('BTC-ETH', [[2, 0.6, 1.0, 'LONG']], {'order_side':'BUY'})
+        store.wal_file.close()
+
+        traders = trader_store.TraderStateStore(self.cache_dir).load()
+        self.assertEqual(traders[0]['trade_recorder'], [[2, 0.6, 1.0, 'LONG']])
+        self.assertEqual(traders[0]['market_activity'], {'order_side':'BUY'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,25 +1,23 @@
 import logging
 import numpy as np
-import technical_indicators as TI
+from core import indicator_engine as IE
 
 ## Minimum price rounding.
 pRounding = 8
 
-def technical_indicators(candles):
-    indicators = {}
+## Tunable strategy parameters (these can be swept with sweep.py).
+PARAMETERS = {
+    'macd_fast':12,             # MACD fast EMA period.
+    'macd_slow':26,             # MACD slow EMA period.
+    'macd_signal':9,            # MACD signal EMA period.
+    'ema_period':200,           # Trend EMA period.
+    'stop_loss':0.004           # Stop-loss distance from the buy price (as a fraction).
+}
 
-    time_values     = [candle[0] for candle in candles]
-    open_prices     = [candle[1] for candle in candles]
-    high_prices     = [candle[2] for candle in candles]
-    low_prices      = [candle[3] for candle in candles]
-    close_prices    = [candle[4] for candle in candles]
-
-    indicators.update({'macd':TI.get_MACD(close_prices, time_values=time_values, map_time=True)})
-
-    indicators.update({'ema':{}})
-    indicators['ema'].update({'ema200':TI.get_EMA(close_prices, 200, time_values=time_values, map_time=True)})
-
-    return(indicators)
+def setup_indicators(engine):
+    # Register the indicators used by the trader (these are updated incrementally as candles come in).
+    engine.add('macd', IE.MACD(PARAMETERS['macd_fast'], PARAMETERS['macd_slow'], PARAMETERS['macd_signal']))
+    engine.add('ema', IE.EMA(PARAMETERS['ema_period']), name='ema{0}'.format(PARAMETERS['ema_period']))
 
 '''
 --- Current Supported Order ---
@@ -60,8 +58,13 @@ def technical_indicators(candles):
         description     = A description for the order that can be used to identify multiple conditions.
         order_type      = The type of the order that is to be placed.
 --- Candle Structure ---
-    Candles are structured in a multidimensional list as follows:
+    Candles are held in a newest first numpy backed store (core/candle_store.py) and index like a list:
         [[time, open, high, low, close, volume], ...]
+    Whole columns can be taken without copying with candles.column('close') (newest first).
+--- Indicator Structure ---
+    Indicators passed to the conditions are newest first with index 0 being the live candle:
+        indicators['macd'][0]['macd'], indicators['ema']['ema200'][0]
+    Available incremental indicators are IE.EMA, IE.SMA, IE.RMA and IE.MACD.
 '''
 
 
@@ -90,7 +93,7 @@ def long_exit_conditions(custom_conditional_data, trade_information, indicators,
                 'description':'LONG exit signal 1', 
                 'order_type':'MARKET'})
 
-    stop_loss_price = float('{0:.{1}f}'.format((trade_information['buy_price']-(trade_information['buy_price']*0.004)), pRounding))
+    stop_loss_price = float('{0:.{1}f}'.format((trade_information['buy_price']-(trade_information['buy_price']*PARAMETERS['stop_loss'])), pRounding))
     stop_loss_status = basic_stoploss_setup(trade_information, stop_loss_price, stop_loss_price, 'LONG')
 
     # Base return for waiting and updating order positions.
@@ -105,9 +108,9 @@ def long_entry_conditions(custom_conditional_data, trade_information, indicators
     order_point = 0
     signal_id = 0
     macd = indicators['macd']
-    ema200 = indicators['ema']['ema200']
+    ema_trend = indicators['ema']['ema{0}'.format(PARAMETERS['ema_period'])]
 
-    if (candles[0][4] > ema200[0]):
+    if (candles[0][4] > ema_trend[0]):
         if macd[0]['macd'] > macd[1]['macd']:
             order_point += 1
             if macd[1]['hist'] > macd[0]['hist']:
@@ -122,6 +125,28 @@ def long_entry_conditions(custom_conditional_data, trade_information, indicators
         return({'order_type':'WAIT', 'order_point':'L_ent_{0}_{1}'.format(signal_id, order_point)})
 
 
+def batch_long_entry_conditions(data):
+    # Optional batched version of long_entry_conditions evaluated for every market in one call.
+    # Each value is a (markets x candles) numpy matrix, newest first (column 0 is the live candle, NaN if no value).
+    # Return one result per market, returning None for a market falls back to long_entry_conditions.
+    macd = data['macd']
+    ema_trend = data['ema']['ema{0}'.format(PARAMETERS['ema_period'])]
+
+    with np.errstate(invalid='ignore'):
+        order_point = (data['close'][:,0] > ema_trend[:,0]) & (macd['macd'][:,0] > macd['macd'][:,1])
+        entry_signal = order_point & (macd['hist'][:,1] > macd['hist'][:,0])
+
+    results = []
+    for signal, point in zip(entry_signal.tolist(), order_point.tolist()):
+        if signal:
+            results.append({'side':'BUY', 'description':'LONG entry signal 1', 'order_type':'MARKET'})
+        elif point:
+            results.append({'order_type':'WAIT', 'order_point':'L_ent_0_1'})
+        else:
+            results.append({'order_type':'WAIT'})
+    return(results)
+
+
 def short_exit_conditions(custom_conditional_data, trade_information, indicators, prices, candles, symbol):
     ## Place Short exit (sell) conditions under this section.
     order_point = 0
@@ -135,7 +160,7 @@ def short_exit_conditions(custom_conditional_data, trade_information, indicators
                 'description':'SHORT exit signal 1', 
                 'order_type':'MARKET'})
 
-    stop_loss_price = float('{0:.{1}f}'.format((trade_information['buy_price']+(trade_information['buy_price']*0.004)), pRounding))
+    stop_loss_price = float('{0:.{1}f}'.format((trade_information['buy_price']+(trade_information['buy_price']*PARAMETERS['stop_loss'])), pRounding))
     stop_loss_status = basic_stoploss_setup(trade_information, stop_loss_price, stop_loss_price, 'SHORT')
 
     # Base return for waiting and updating order positions.
@@ -150,9 +175,9 @@ def short_entry_conditions(custom_conditional_data, trade_information, indicator
     order_point = 0
     signal_id = 0
     macd = indicators['macd']
-    ema200 = indicators['ema']['ema200']
+    ema_trend = indicators['ema']['ema{0}'.format(PARAMETERS['ema_period'])]
 
-    if (candles[0][4] < ema200[0]):
+    if (candles[0][4] < ema_trend[0]):
         if macd[0]['macd'] < macd[1]['macd'] and macd[0]['hist'] > macd[0]['macd']:
             order_point += 1
             if macd[1]['hist'] < macd[0]['hist']: